@@ -0,0 +1,161 @@
+import asyncio
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from classroom.models import Message, Room, Team, User
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBuffer:
+    '''
+    Write-behind buffer for chat messages. Consumers broadcast first and add
+    the message here; a background task saves the pending messages with one
+    bulk_create every batch_size messages or flush_interval seconds.
+
+    When max_size messages are pending, add() waits for the next flush, which
+    slows down the sending websockets instead of growing the buffer. Messages
+    that cannot be saved, and messages still pending when the process exits,
+    are appended to the spool file and saved by the next flush of any process.
+    Messages keep the time they were received, not the time of the flush.
+    '''
+
+    def __init__(self, batch_size=100, flush_interval=0.2, max_size=5000, spool_path=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.spool_path = spool_path
+        self.pending = []
+        self.loop = None
+        self.task = None
+        self.full = None
+        self.flushed = None
+        self.lock = threading.Lock()
+        atexit.register(self.save_on_exit)
+
+    async def add(self, user_id, room_id, content, team_id=None):
+        self.start()
+        while len(self.pending) >= self.max_size:
+            self.full.set()
+            self.flushed.clear()
+            await self.flushed.wait()
+        self.pending.append({'user_id': user_id, 'room_id': room_id, 'team_id': team_id, 'content': content,
+                             'date_added': timezone.now().isoformat()})
+        if len(self.pending) >= self.batch_size:
+            self.full.set()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is loop and not self.task.done():
+            return
+        self.loop = loop
+        self.full = asyncio.Event()
+        self.flushed = asyncio.Event()
+        self.task = loop.create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if batch:
+            await sync_to_async(self.save)(batch)
+        if self.flushed is not None:
+            self.flushed.set()
+
+    def save(self, batch):
+        with self.lock:
+            if self.has_spool():
+                self.save_with_spool(batch)
+                return
+            try:
+                save_messages(batch)
+            except Exception:
+                logger.exception('Could not save %s chat messages, spooling them', len(batch))
+                self.write_spool(batch)
+
+    def save_on_exit(self):
+        batch, self.pending = self.pending, []
+        if batch:
+            self.save(batch)
+
+    def has_spool(self):
+        return bool(self.spool_path) and os.path.exists(self.spool_path) and os.path.getsize(self.spool_path) > 0
+
+    def save_with_spool(self, batch):
+        # Файл общий для всех процессов: чтение, сохранение и очистка идут под одной блокировкой,
+        # и файл очищается только после сохранения. Если процесс упадет между ними, сообщения
+        # сохранятся повторно, но не пропадут
+        with open(self.spool_path, 'a+') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            spool.seek(0)
+            spooled = [json.loads(line) for line in spool if line.strip()]
+            try:
+                save_messages(spooled + batch)
+            except Exception:
+                logger.exception('Could not save %s chat messages, spooling them', len(spooled) + len(batch))
+                append_messages(spool, batch)
+            else:
+                spool.truncate(0)
+
+    def write_spool(self, batch):
+        if not self.spool_path:
+            logger.error('No spool file configured, %s chat messages are lost', len(batch))
+            return
+        with open(self.spool_path, 'a') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            append_messages(spool, batch)
+
+
+def append_messages(spool, batch):
+    for message in batch:
+        spool.write(json.dumps(message) + '\n')
+    spool.flush()
+    os.fsync(spool.fileno())
+
+
+@transaction.atomic
+def save_messages(batch):
+    '''
+    Saves buffered messages with one insert. Messages of users, rooms or
+    teams deleted since they were sent are skipped, so they cannot fail the
+    batch.
+    '''
+    user_ids = set(User.objects
+                   .filter(pk__in={message['user_id'] for message in batch})
+                   .values_list('pk', flat=True))
+    room_ids = set(Room.objects
+                   .filter(pk__in={message['room_id'] for message in batch})
+                   .values_list('pk', flat=True))
+    team_ids = set(Team.objects
+                   .filter(pk__in={message['team_id'] for message in batch} - {None})
+                   .values_list('pk', flat=True))
+    team_ids.add(None)
+    Message.objects.bulk_create([Message(**dict(message, date_added=parse_datetime(message['date_added'])))
+                                 for message in batch
+                                 if message['user_id'] in user_ids and message['room_id'] in room_ids
+                                 and message['team_id'] in team_ids])
+
+
+message_buffer = MessageBuffer(
+    batch_size=getattr(settings, 'CHAT_BUFFER_BATCH_SIZE', 100),
+    flush_interval=getattr(settings, 'CHAT_BUFFER_FLUSH_INTERVAL', 0.2),
+    max_size=getattr(settings, 'CHAT_BUFFER_MAX_SIZE', 5000),
+    spool_path=getattr(settings, 'CHAT_BUFFER_SPOOL', os.path.join(settings.BASE_DIR, 'chat-spool.jsonl')),
+)
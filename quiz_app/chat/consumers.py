@@ -1,10 +1,15 @@
+import asyncio
 import json
 
-from django.contrib.auth.models import User
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async
 
-from .models import Room, Message
+from classroom.chat_history import get_chat_team, get_team_history
+from classroom.live import PROGRESS_TICK, get_progress_group, get_quiz_progress, merge_progress
+from classroom.models import Quiz, Room
+from classroom.pagination import InvalidCursor
+
+from .buffer import message_buffer
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -12,6 +17,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = 'chat_%s' % self.room_name
 
+        # User and room are resolved once, messages only carry the text
+        self.user = self.scope['user']
+        self.room = await self.get_room(self.room_name)
+        if not self.user.is_authenticated or self.room is None:
+            await self.close()
+            return
+
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
@@ -19,7 +31,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
-    async def disconnect(self):
+    async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
@@ -28,12 +42,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
     # Receive message from WebSocket
     async def receive(self, text_data):
         data = json.loads(text_data)
-        print(data)
         message = data['message']
-        username = data['username']
-        room = data['room']
 
-        await self.save_message(username, room, message)
+        # Message is saved in the background, waits only while the buffer is full
+        await message_buffer.add(self.user.pk, self.room.pk, message)
 
         # Send message to room group
         await self.channel_layer.group_send(
@@ -41,7 +53,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             {
                 'type': 'chat_message',
                 'message': message,
-                'username': username
+                'username': self.user.username
             }
         )
 
@@ -56,9 +68,131 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'username': username
         }))
 
-    @sync_to_async
-    def save_message(self, username, room, message):
-        user = User.objects.get(username=username)
-        room = Room.objects.get(slug=room)
+    @database_sync_to_async
+    def get_room(self, slug):
+        return Room.objects.filter(slug=slug).first()
+
+
+class TeamChatConsumer(ChatConsumer):
+    '''
+    Chat of one team, open to the team members and the quiz owner. History is
+    sent in pages on connect and on {"type": "history", "before": ...} frames;
+    a bad cursor gets an {"type": "error"} frame back.
+    '''
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.team = None
+        if self.user.is_authenticated:
+            self.team = await self.get_team(self.scope['url_route']['kwargs']['team_id'])
+        if self.team is None:
+            await self.close()
+            return
+
+        self.room_group_name = 'team_%s' % self.team.pk
+        await self.channel_layer.group_add(
+            self.room_group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+        await self.send_history()
+
+    async def receive(self, text_data):
+        data = json.loads(text_data)
+        if data.get('type') == 'history':
+            await self.send_history(data.get('before'))
+            return
+
+        message = data['message']
+        await message_buffer.add(self.user.pk, self.team.quiz.room_id, message, team_id=self.team.pk)
+
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'chat_message',
+                'message': message,
+                'username': self.user.username
+            }
+        )
+
+    async def send_history(self, before=None):
+        try:
+            history = await database_sync_to_async(get_team_history)(self.team.pk, before=before)
+        except InvalidCursor as e:
+            await self.send(text_data=json.dumps({'type': 'error', 'error': e.args[0]}))
+            return
+        history['type'] = 'history'
+        await self.send(text_data=json.dumps(history))
+
+    @database_sync_to_async
+    def get_team(self, team_id):
+        return get_chat_team(self.user, team_id)
+
+
+class QuizDashboardConsumer(AsyncWebsocketConsumer):
+    '''
+    Live progress of one quiz for its owner. Progress deltas from the workers
+    are merged into the state, and the state is pushed at most once per tick
+    however many answers arrive.
+    '''
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.quiz_id = self.scope['url_route']['kwargs']['quiz_id']
+        if not self.user.is_authenticated or not await self.owns_quiz():
+            await self.close()
+            return
+
+        # Снимок до входа в группу: иначе дельты, пришедшие до его загрузки,
+        # попадут в состояние дважды
+        self.progress = await database_sync_to_async(get_quiz_progress)(self.quiz_id)
+        self.changed = True
+        self.group_name = get_progress_group(self.quiz_id)
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+        self.ticker = asyncio.ensure_future(self.tick())
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, 'group_name'):
+            return
+        self.ticker.cancel()
+        await self.channel_layer.group_discard(
+            self.group_name,
+            self.channel_name
+        )
+
+    # Receive progress delta from quiz group
+    async def progress_delta(self, event):
+        merge_progress(self.progress, event)
+        self.changed = True
+
+    async def tick(self):
+        while True:
+            if self.changed:
+                self.changed = False
+                await self.send_progress()
+            await asyncio.sleep(PROGRESS_TICK)
+
+    async def send_progress(self):
+        questions = {
+            question_id: {
+                'answered': answered,
+                'correct': correct,
+                'ratio': round(correct / answered, 3) if answered else 0
+            } for question_id, (answered, correct) in self.progress['questions'].items()
+        }
+        await self.send(text_data=json.dumps({
+            'type': 'progress',
+            'answers': sum(answered for answered, _ in self.progress['questions'].values()),
+            'questions': questions,
+            'teams': self.progress['teams']
+        }))
 
-        Message.objects.create(user=user, room=room, content=message)
+    @database_sync_to_async
+    def owns_quiz(self):
+        return Quiz.objects.filter(pk=self.quiz_id, owner=self.user).exists()
@@ -0,0 +1,272 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import random
+import string
+import struct
+import tempfile
+import time
+import weakref
+from copy import deepcopy
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!I')
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    '''
+    Channel layer for several worker processes on one host, without an
+    external broker.
+
+    Every process owns its specific channels and the group memberships of
+    those channels, and listens on a Unix socket in socket_dir. A group
+    message is delivered to the local members and written once to every other
+    live process socket; each process then fans it out to its own members.
+    Messages are sent as JSON, so they must be JSON serializable.
+    '''
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, socket_dir=None, expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, peer_refresh=1.0, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.socket_dir = socket_dir or os.path.join(tempfile.gettempdir(), 'quiz-app-channels')
+        self.group_expiry = group_expiry
+        self.peer_refresh = peer_refresh
+        self.process_name = 'unix-%s-%s' % (os.getpid(), self.random_string(6))
+        self.socket_path = os.path.join(self.socket_dir, self.process_name + '.sock')
+        self.channels = {}
+        self.groups = {}
+        self.server = None
+        self.server_loop = None
+        # Connections to other processes belong to the event loop that opened
+        # them; async_to_sync runs every call in a new loop
+        self.peers = weakref.WeakKeyDictionary()
+        self.peer_paths = []
+        self.peer_paths_checked = 0
+
+    @staticmethod
+    def random_string(length):
+        return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.check_name(channel, self.channel_name_regex, 'Channel')
+        assert '__asgi_channel__' not in message
+
+        owner = self.get_owner(channel)
+        if owner is None or owner == self.process_name:
+            self.put(channel, message)
+        else:
+            await self.send_frame(os.path.join(self.socket_dir, owner + '.sock'),
+                                  {'op': 'send', 'channel': channel, 'message': message})
+
+    async def receive(self, channel):
+        self.check_name(channel, self.channel_name_regex, 'Channel')
+        queue = self.get_queue(channel)
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires >= time.time():
+                    return message
+        finally:
+            if queue.empty():
+                self.channels.pop(channel, None)
+
+    async def new_channel(self, prefix='specific'):
+        await self.start_server()
+        return '%s.%s!%s' % (prefix, self.process_name, self.random_string(12))
+
+    async def flush(self):
+        self.channels = {}
+        self.groups = {}
+
+    async def close(self):
+        for writer in self.peers.pop(asyncio.get_running_loop(), {}).values():
+            writer.close()
+        if self.server is not None and not self.serves_other_loop():
+            self.server.close()
+            self.server = None
+            self.server_loop = None
+            self.remove_socket()
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.check_name(group, self.group_name_regex, 'Group')
+        self.check_name(channel, self.channel_name_regex, 'Channel')
+        owner = self.get_owner(channel)
+        if owner is None or owner == self.process_name:
+            self.groups.setdefault(group, {})[channel] = time.time()
+        else:
+            await self.send_frame(os.path.join(self.socket_dir, owner + '.sock'),
+                                  {'op': 'group_add', 'group': group, 'channel': channel})
+
+    async def group_discard(self, group, channel):
+        self.check_name(group, self.group_name_regex, 'Group')
+        self.check_name(channel, self.channel_name_regex, 'Channel')
+        owner = self.get_owner(channel)
+        if owner is None or owner == self.process_name:
+            self.discard(group, channel)
+        else:
+            await self.send_frame(os.path.join(self.socket_dir, owner + '.sock'),
+                                  {'op': 'group_discard', 'group': group, 'channel': channel})
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.check_name(group, self.group_name_regex, 'Group')
+        self.deliver_group(group, message)
+        frame = self.encode({'op': 'group_send', 'group': group, 'message': message})
+        await asyncio.gather(*[self.write_frame(path, frame) for path in self.get_peer_paths()])
+
+    # Local delivery
+
+    def check_name(self, name, regex, kind):
+        if not self.match_type_and_length(name) or not regex.match(name):
+            raise TypeError(self.invalid_name_error.format(kind))
+
+    def get_owner(self, channel):
+        # Specific channels look like "<prefix>.<process name>!<suffix>",
+        # normal channels are served by the process that receives them
+        if '!' not in channel:
+            return None
+        return channel[:channel.index('!')].rsplit('.', 1)[-1]
+
+    def get_queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def put(self, channel, message):
+        try:
+            self.get_queue(channel).put_nowait((time.time() + self.expiry, deepcopy(message)))
+        except asyncio.QueueFull:
+            raise ChannelFull(channel)
+
+    def discard(self, group, channel):
+        members = self.groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del self.groups[group]
+
+    def deliver_group(self, group, message):
+        members = self.groups.get(group)
+        if not members:
+            return
+        expired = time.time() - self.group_expiry
+        for channel, added in list(members.items()):
+            if added < expired:
+                self.discard(group, channel)
+                continue
+            try:
+                self.put(channel, message)
+            except ChannelFull:
+                # Group sends are best effort, a slow consumer must not block the others
+                pass
+
+    def dispatch(self, frame):
+        op = frame['op']
+        if op == 'group_send':
+            self.deliver_group(frame['group'], frame['message'])
+        elif op == 'send':
+            try:
+                self.put(frame['channel'], frame['message'])
+            except ChannelFull:
+                logger.warning('Channel %s is full, message dropped', frame['channel'])
+        elif op == 'group_add':
+            self.groups.setdefault(frame['group'], {})[frame['channel']] = time.time()
+        elif op == 'group_discard':
+            self.discard(frame['group'], frame['channel'])
+
+    # Inter-process transport
+
+    def serves_other_loop(self):
+        return self.server_loop is not asyncio.get_running_loop() and self.server_loop.is_running()
+
+    def get_peers(self):
+        loop = asyncio.get_running_loop()
+        peers = self.peers.get(loop)
+        if peers is None:
+            peers = self.peers[loop] = {}
+        return peers
+
+    async def start_server(self):
+        if self.server is not None:
+            # The socket stays with the loop that serves the consumers; a call
+            # from another loop only rebinds it after that loop has stopped
+            if self.server_loop is asyncio.get_running_loop() or self.server_loop.is_running():
+                return
+            self.server.close()
+            self.server = None
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self.remove_socket()
+        self.server = await asyncio.start_unix_server(self.handle_peer, path=self.socket_path)
+        if self.server_loop is None:
+            atexit.register(self.remove_socket)
+        self.server_loop = asyncio.get_running_loop()
+
+    def remove_socket(self):
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    async def handle_peer(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                data = await reader.readexactly(HEADER.unpack(header)[0])
+                self.dispatch(json.loads(data.decode()))
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def get_peer_paths(self):
+        if time.monotonic() - self.peer_paths_checked > self.peer_refresh:
+            try:
+                names = os.listdir(self.socket_dir)
+            except FileNotFoundError:
+                names = []
+            self.peer_paths = [os.path.join(self.socket_dir, name) for name in names
+                               if name.endswith('.sock') and name != self.process_name + '.sock']
+            self.peer_paths_checked = time.monotonic()
+        return self.peer_paths
+
+    def encode(self, frame):
+        data = json.dumps(frame, separators=(',', ':')).encode()
+        return HEADER.pack(len(data)) + data
+
+    async def send_frame(self, path, frame):
+        await self.write_frame(path, self.encode(frame))
+
+    async def write_frame(self, path, data):
+        peers = self.get_peers()
+        writer = peers.get(path)
+        try:
+            if writer is None or writer.is_closing():
+                _, writer = await asyncio.open_unix_connection(path)
+                peers[path] = writer
+            writer.write(data)
+            await writer.drain()
+        except ConnectionRefusedError:
+            # Nobody listens on the socket any more, the file is removed so
+            # other processes stop trying it
+            peers.pop(path, None)
+            self.peer_paths = [peer_path for peer_path in self.peer_paths if peer_path != path]
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        except (FileNotFoundError, ConnectionError):
+            peers.pop(path, None)
@@ -0,0 +1,74 @@
+import json
+import time
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.urls import path
+
+from chat.buffer import message_buffer
+from chat.consumers import ChatConsumer
+from classroom.models import Message, Room, User
+
+ROOM_SLUG = 'benchmark-chat'
+
+
+class LegacyChatConsumer(ChatConsumer):
+    '''
+    Previous receive path: user and room come with every frame and are looked
+    up again before each insert.
+    '''
+
+    async def receive(self, text_data):
+        data = json.loads(text_data)
+        await self.save_message(data['username'], data['room'], data['message'])
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {'type': 'chat_message', 'message': data['message'], 'username': data['username']}
+        )
+
+    @database_sync_to_async
+    def save_message(self, username, room, message):
+        user = User.objects.get(username=username)
+        room = Room.objects.get(slug=room)
+        Message.objects.create(user=user, room=room, content=message)
+
+
+class Command(BaseCommand):
+    help = ('Measures chat messages per second on one websocket connection with per-message user and room '
+            'lookups and with the user and room resolved in connect(). Writes Message rows, never run it '
+            'against a production database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Messages to send per run.')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='benchmark_chat_user')
+        Room.objects.get_or_create(slug=ROOM_SLUG, defaults={'name': ROOM_SLUG})
+        for name, consumer in (('Поиск на каждое сообщение', LegacyChatConsumer),
+                               ('Поиск при подключении', ChatConsumer)):
+            rate = async_to_sync(self.run)(consumer, user, options['messages'])
+            self.stdout.write('%-28s %8.0f сообщений/с' % (name, rate))
+
+    async def run(self, consumer, user, count):
+        application = URLRouter([path('ws/<str:room_name>/', consumer.as_asgi())])
+        communicator = WebsocketCommunicator(application, '/ws/%s/' % ROOM_SLUG)
+        communicator.scope['user'] = user
+        await communicator.connect()
+
+        started = time.perf_counter()
+        for i in range(count):
+            await communicator.send_to(text_data=json.dumps({
+                'message': 'benchmark %s' % i,
+                'username': user.username,
+                'room': ROOM_SLUG,
+            }))
+            await communicator.receive_from()
+        # Буферизованные сообщения тоже должны быть сохранены, иначе сравнение нечестное
+        await message_buffer.flush()
+        elapsed = time.perf_counter() - started
+
+        await communicator.disconnect()
+        return count / elapsed
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+
+from classroom.models import Room, User
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class Command(BaseCommand):
+    help = ('Opens many local websocket clients in one chat room, sends messages from one of them and '
+            'reports the group fan-out latency percentiles. The clients log in as --users test users and the '
+            'rooms of the URLs are created when missing, in the database the workers use; start the ASGI '
+            'workers before running it and never run it against a production database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', nargs='+', default=['ws://127.0.0.1:8000/ws/load-test/'],
+                            help='Chat room websocket URLs, clients are spread over them evenly. '
+                                 'Pass one URL per worker process to measure cross-process fan-out.')
+        parser.add_argument('--clients', type=int, default=2000, help='Number of websocket clients.')
+        parser.add_argument('--users', type=int, default=100, help='Number of test users the clients log in as.')
+        parser.add_argument('--messages', type=int, default=100, help='Number of messages to send.')
+        parser.add_argument('--interval', type=float, default=0.05, help='Seconds between messages.')
+        parser.add_argument('--connect-concurrency', type=int, default=200,
+                            help='Number of clients connecting at the same time.')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for deliveries.')
+
+    def handle(self, *args, **options):
+        try:
+            from websockets.asyncio.client import connect  # noqa: F401
+        except ImportError:
+            raise CommandError('Для нагрузочного теста нужен пакет websockets 13 или новее.')
+        # Потребитель чата принимает только вошедших пользователей и существующие комнаты
+        for url in options['url']:
+            slug = urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1]
+            Room.objects.get_or_create(slug=slug, defaults={'name': slug})
+        self.cookies = ['%s=%s' % (settings.SESSION_COOKIE_NAME, self.create_session(user))
+                        for user in self.get_users(options['users'])]
+        self.options = options
+        self.sent = {}
+        self.latencies = []
+        asyncio.run(self.run())
+
+    def get_users(self, count):
+        usernames = ['chat_load_test_%s' % i for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        User.objects.bulk_create([User(username=username) for username in usernames if username not in existing])
+        return list(User.objects.filter(username__in=usernames).order_by('pk'))
+
+    def create_session(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    async def run(self):
+        from websockets.asyncio.client import connect as websocket_connect
+
+        options = self.options
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def connect(index):
+            async with semaphore:
+                return await websocket_connect(options['url'][index % len(options['url'])],
+                                               additional_headers={'Cookie': self.cookies[index % len(self.cookies)]},
+                                               max_queue=None, open_timeout=options['timeout'])
+
+        started = time.perf_counter()
+        clients = await asyncio.gather(*[connect(i) for i in range(options['clients'])])
+        self.stdout.write('Подключено клиентов: %s за %.2f с' % (len(clients), time.perf_counter() - started))
+        readers = [asyncio.ensure_future(self.read(client)) for client in clients]
+
+        # Даем процессам время обнаружить друг друга и зарегистрировать клиентов в группе
+        await asyncio.sleep(2)
+        for seq in range(options['messages']):
+            self.sent[seq] = time.perf_counter()
+            await clients[0].send(json.dumps({'message': 'load-test:%s' % seq}))
+            await asyncio.sleep(options['interval'])
+
+        expected = len(clients) * options['messages']
+        deadline = time.perf_counter() + options['timeout']
+        while len(self.latencies) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*[client.close() for client in clients])
+        self.report(expected)
+
+    async def read(self, client):
+        async for data in client:
+            received = time.perf_counter()
+            message = json.loads(data).get('message', '')
+            if message.startswith('load-test:'):
+                self.latencies.append(received - self.sent[int(message.split(':', 1)[1])])
+
+    def report(self, expected):
+        latencies = sorted(self.latencies)
+        self.stdout.write('Доставлено сообщений: %s из %s' % (len(latencies), expected))
+        if not latencies:
+            return
+        for percentile in PERCENTILES:
+            index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+            self.stdout.write('  p%-5s %8.2f ms' % (percentile, latencies[index] * 1000))
+        self.stdout.write('  max    %8.2f ms' % (latencies[-1] * 1000))
@@ -3,5 +3,7 @@ from django.urls import path
 from . import consumers
 
 websocket_urlpatterns = [
+    path('ws/team/<int:team_id>/', consumers.TeamChatConsumer.as_asgi()),
+    path('ws/quiz/<int:quiz_id>/dashboard/', consumers.QuizDashboardConsumer.as_asgi()),
     path('ws/<str:room_name>/', consumers.ChatConsumer.as_asgi()),
 ]
\ No newline at end of file
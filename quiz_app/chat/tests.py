@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from classroom.models import Message, Quiz, Room, Subject, Team, User
+from classroom.pagination import get_cursor
+
+from .buffer import MessageBuffer
+from .consumers import QuizDashboardConsumer, TeamChatConsumer
+from .layers import UnixSocketChannelLayer
+
+
+class MessageBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('student', is_student=True)
+        cls.room = Room.objects.create(name='room', slug='room')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool_path = os.path.join(directory.name, 'chat-spool.jsonl')
+        self.buffer = MessageBuffer(spool_path=self.spool_path)
+
+    def get_message(self, content):
+        return {'user_id': self.user.pk, 'room_id': self.room.pk, 'team_id': None, 'content': content,
+                'date_added': timezone.now().isoformat()}
+
+    def get_spooled(self):
+        with open(self.spool_path) as spool:
+            return [json.loads(line)['content'] for line in spool]
+
+    def get_saved(self):
+        return list(Message.objects.order_by('pk').values_list('content', flat=True))
+
+    async def test_flush(self):
+        await self.buffer.add(self.user.pk, self.room.pk, 'first')
+        await self.buffer.add(self.user.pk, self.room.pk, 'second')
+        received = timezone.now()
+        self.buffer.task.cancel()
+        await self.buffer.flush()
+        messages = [message async for message in Message.objects.order_by('pk')]
+        self.assertEqual([message.content for message in messages], ['first', 'second'])
+        # Время сообщения - время получения, а не сохранения пачки
+        self.assertLessEqual(messages[1].date_added, received)
+        self.assertEqual(self.buffer.pending, [])
+
+    def test_failed_save_spooled(self):
+        with mock.patch('chat.buffer.save_messages', side_effect=DatabaseError), \
+                self.assertLogs('chat.buffer', 'ERROR'):
+            self.buffer.save([self.get_message('first')])
+        self.assertEqual(self.get_spooled(), ['first'])
+        self.assertEqual(self.get_saved(), [])
+
+        self.buffer.save([self.get_message('second')])
+        self.assertEqual(self.get_saved(), ['first', 'second'])
+        self.assertEqual(self.get_spooled(), [])
+
+    def test_spool_kept_until_saved(self):
+        with mock.patch('chat.buffer.save_messages', side_effect=DatabaseError), \
+                self.assertLogs('chat.buffer', 'ERROR') as logs:
+            self.buffer.save([self.get_message('first')])
+            self.buffer.save([self.get_message('second')])
+        self.assertIn('Could not save 2 chat messages', logs.output[1])
+        self.assertEqual(self.get_spooled(), ['first', 'second'])
+
+        self.buffer.save([])
+        self.assertEqual(self.get_saved(), ['first', 'second'])
+        self.assertEqual(self.get_spooled(), [])
+
+    def test_save_on_exit(self):
+        self.buffer.pending = [self.get_message('pending')]
+        self.buffer.save_on_exit()
+        self.assertEqual(self.get_saved(), ['pending'])
+
+    def test_deleted_room_skipped(self):
+        message = self.get_message('deleted')
+        message['room_id'] = self.room.pk + 1
+        self.buffer.save([message, self.get_message('kept')])
+        self.assertEqual(self.get_saved(), ['kept'])
+
+    def test_receive_time_kept(self):
+        message = self.get_message('late')
+        message['date_added'] = (timezone.now() - timedelta(minutes=5)).isoformat()
+        self.buffer.save([message])
+        self.assertLess(Message.objects.get().date_added, timezone.now() - timedelta(minutes=4))
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    '''
+    Two layers sharing a socket directory stand for two worker processes.
+    '''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.socket_dir = directory.name
+
+    def get_layer(self):
+        return UnixSocketChannelLayer(socket_dir=self.socket_dir, peer_refresh=0)
+
+    async def receive(self, layer, channel):
+        return await asyncio.wait_for(layer.receive(channel), 1)
+
+    async def test_send_receive(self):
+        layer = self.get_layer()
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'chat.message', 'text': 'hello'})
+        self.assertEqual(await self.receive(layer, channel), {'type': 'chat.message', 'text': 'hello'})
+        await layer.close()
+
+    async def test_send_to_other_process(self):
+        first, second = self.get_layer(), self.get_layer()
+        channel = await first.new_channel()
+        await second.new_channel()
+        await second.send(channel, {'type': 'chat.message', 'text': 'hello'})
+        self.assertEqual(await self.receive(first, channel), {'type': 'chat.message', 'text': 'hello'})
+        await first.close()
+        await second.close()
+
+    async def test_group_fan_out(self):
+        first, second = self.get_layer(), self.get_layer()
+        channels = [await first.new_channel(), await first.new_channel(), await second.new_channel()]
+        await first.group_add('team_1', channels[0])
+        await first.group_add('team_1', channels[1])
+        await second.group_add('team_1', channels[2])
+        await first.group_add('team_2', channels[0])
+
+        await first.group_send('team_1', {'type': 'chat.message', 'text': 'hello'})
+        for layer, channel in zip((first, first, second), channels):
+            self.assertEqual(await self.receive(layer, channel), {'type': 'chat.message', 'text': 'hello'})
+
+        await second.group_discard('team_1', channels[2])
+        await second.group_send('team_1', {'type': 'chat.message', 'text': 'again'})
+        self.assertEqual(await self.receive(first, channels[0]), {'type': 'chat.message', 'text': 'again'})
+        self.assertEqual(await self.receive(first, channels[1]), {'type': 'chat.message', 'text': 'again'})
+        self.assertTrue(second.get_queue(channels[2]).empty())
+        await first.close()
+        await second.close()
+
+    async def test_dead_socket_removed(self):
+        layer = self.get_layer()
+        await layer.new_channel()
+        # Сокет процесса, который завершился, не удалив файл
+        path = os.path.join(self.socket_dir, 'unix-0-dead.sock')
+        with socket.socket(socket.AF_UNIX) as dead:
+            dead.bind(path)
+        await layer.group_send('team_1', {'type': 'chat.message'})
+        self.assertFalse(os.path.exists(path))
+        await layer.close()
+        self.assertFalse(os.path.exists(layer.socket_path))
+
+
+class TeamChatConsumerTests(TransactionTestCase):
+    '''
+    database_sync_to_async закрывает соединения вне транзакции теста, поэтому
+    здесь TransactionTestCase.
+    '''
+
+    def setUp(self):
+        teacher = User.objects.create_user('teacher', is_teacher=True)
+        room = Room.objects.create(name='room', slug='room')
+        quiz = Quiz.objects.create(owner=teacher, subject=Subject.objects.create(name='Subject'), room=room, name='Quiz')
+        team = Team.objects.create(quiz=quiz, name='Team')
+        self.message = Message.objects.create(user=teacher, room=room, team=team, content='hello')
+        self.consumer = TeamChatConsumer()
+        self.consumer.team = team
+        self.consumer.send = mock.AsyncMock()
+
+    async def receive_history(self, before):
+        self.consumer.send.reset_mock()
+        await self.consumer.receive(json.dumps({'type': 'history', 'before': before}))
+        return json.loads(self.consumer.send.call_args.kwargs['text_data'])
+
+    async def test_history(self):
+        history = await self.receive_history(None)
+        self.assertEqual([message['text'] for message in history['messages']], ['hello'])
+        history = await self.receive_history(get_cursor(self.message, ('-date_added', '-id')))
+        self.assertEqual((history['type'], history['messages']), ('history', []))
+
+    async def test_invalid_cursor(self):
+        for before in ['garbage', 5, ['a'], {'id': 1}]:
+            with self.subTest(before=before):
+                self.assertEqual(await self.receive_history(before), {'type': 'error', 'error': 'Invalid cursor.'})
+
+
+class QuizDashboardConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', is_teacher=True)
+        room = Room.objects.create(name='room', slug='room')
+        self.quiz = Quiz.objects.create(owner=self.teacher, subject=Subject.objects.create(name='Subject'),
+                                        room=room, name='Quiz')
+
+    async def test_snapshot_before_group_add(self):
+        consumer = QuizDashboardConsumer()
+        consumer.scope = {'user': self.teacher, 'url_route': {'kwargs': {'quiz_id': self.quiz.pk}}}
+        consumer.channel_name = 'dashboard'
+        consumer.channel_layer = mock.AsyncMock()
+        consumer.accept = mock.AsyncMock()
+        consumer.send = mock.AsyncMock()
+        progress = {}
+
+        async def group_add(group, channel):
+            # Дельта сразу после входа в группу уже не входит в снимок
+            progress.update(json.loads(json.dumps(consumer.progress)))
+            await consumer.progress_delta({'questions': {'1': [1, 1]}, 'teams': {}})
+
+        consumer.channel_layer.group_add.side_effect = group_add
+        await consumer.connect()
+        await consumer.disconnect(1000)
+        self.assertEqual(progress, {'questions': {}, 'teams': {}})
+        self.assertEqual(consumer.progress['questions'], {'1': [1, 1]})
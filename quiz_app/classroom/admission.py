@@ -0,0 +1,188 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.db.models.lookups import GreaterThanOrEqual
+from django.http import HttpResponse
+
+from .models import AnswerBucket
+
+ANSWER_RATE = getattr(settings, 'ANSWER_RATE', 2.0)
+ANSWER_BURST = getattr(settings, 'ANSWER_BURST', 5)
+ANSWER_MAX_CONCURRENT = getattr(settings, 'ANSWER_MAX_CONCURRENT', 4)
+ANSWER_MAX_WAIT = getattr(settings, 'ANSWER_MAX_WAIT', 2.0)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status, retry_after):
+        super().__init__(status, retry_after)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def take_token(student_id):
+    '''
+    Token bucket per student kept in the database, so every worker process
+    spends the same tokens: ANSWER_BURST answers at once, then ANSWER_RATE
+    answers per second. Raises AdmissionRejected when the bucket is empty.
+    '''
+    now = time.time()
+    tokens = Least(Value(float(ANSWER_BURST)), F('tokens') + (Value(now) - F('updated')) * ANSWER_RATE)
+    # Пополнение и списание одним UPDATE: параллельные запросы не потратят один и тот же токен
+    if AnswerBucket.objects \
+            .filter(GreaterThanOrEqual(tokens, 1), student_id=student_id) \
+            .update(tokens=tokens - 1, updated=now):
+        return
+    try:
+        with transaction.atomic():
+            AnswerBucket.objects.create(student_id=student_id, tokens=ANSWER_BURST - 1, updated=now)
+        return
+    except IntegrityError:
+        # Корзина уже есть, значит она пуста
+        pass
+    bucket = AnswerBucket.objects.get(student_id=student_id)
+    tokens = min(ANSWER_BURST, bucket.tokens + (now - bucket.updated) * ANSWER_RATE)
+    raise AdmissionRejected(429, max(1, math.ceil((1 - tokens) / ANSWER_RATE)))
+
+
+class ConcurrencyLimiter:
+    '''
+    Lets at most limit requests of this process into the guarded section.
+    The others wait up to max_wait seconds and are shed after that, so a burst
+    queues in front of the database write lock instead of piling up on it.
+    '''
+
+    def __init__(self, limit, max_wait):
+        self.limit = limit
+        self.max_wait = max_wait
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # Асинхронные запросы ждут не на семафоре, а на future своего цикла событий
+        self.async_waiters = deque()
+
+    def start_waiting(self):
+        with self.lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+        return time.perf_counter()
+
+    def stop_waiting(self, started, acquired):
+        waited = time.perf_counter() - started
+        with self.lock:
+            self.waiting -= 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if acquired:
+                self.admitted += 1
+            else:
+                self.shed += 1
+        if not acquired:
+            raise AdmissionRejected(503, math.ceil(self.max_wait))
+
+    def release(self):
+        self.semaphore.release()
+        self.wake_next_waiter()
+
+    def wake_next_waiter(self):
+        with self.lock:
+            waiter = self.async_waiters.popleft() if self.async_waiters else None
+        if waiter is not None:
+            loop, future = waiter
+            loop.call_soon_threadsafe(wake_up, future)
+
+    @contextmanager
+    def admit(self):
+        started = self.start_waiting()
+        acquired = self.semaphore.acquire(timeout=self.max_wait)
+        self.stop_waiting(started, acquired)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aadmit(self):
+        '''
+        admit() for async views: the request waits on the event loop instead
+        of holding a thread, and shares the limit with the sync callers.
+        '''
+        started = self.start_waiting()
+        acquired = self.semaphore.acquire(blocking=False)
+        try:
+            while not acquired:
+                timeout = started + self.max_wait - time.perf_counter()
+                if timeout <= 0:
+                    break
+                await self.wait_for_release(timeout)
+                # Место могли занять раньше: тогда запрос ждет следующего освобождения
+                acquired = self.semaphore.acquire(blocking=False)
+        except asyncio.CancelledError:
+            with self.lock:
+                self.waiting -= 1
+            # Отмененный запрос мог уже получить сигнал об освобождении, передаем его дальше
+            self.wake_next_waiter()
+            raise
+        self.stop_waiting(started, acquired)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def wait_for_release(self, timeout):
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self.lock:
+            self.async_waiters.append(waiter)
+        try:
+            # Место могло освободиться до того, как запрос встал в очередь
+            if self.semaphore.acquire(blocking=False):
+                self.semaphore.release()
+                return
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                if waiter in self.async_waiters:
+                    self.async_waiters.remove(waiter)
+
+    def get_metrics(self):
+        with self.lock:
+            requests = self.admitted + self.shed
+            return {
+                'limit': self.limit,
+                'queue_depth': self.waiting,
+                'max_queue_depth': self.max_waiting,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'wait_avg_ms': round(self.wait_total / requests * 1000, 2) if requests else 0,
+                'wait_max_ms': round(self.wait_max * 1000, 2),
+            }
+
+
+def wake_up(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def get_rejected_response(rejection):
+    response = HttpResponse('Слишком много ответов одновременно, повторите попытку через %s с.' % rejection.retry_after,
+                            status=rejection.status, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(rejection.retry_after)
+    return response
+
+
+answer_limiter = ConcurrencyLimiter(ANSWER_MAX_CONCURRENT, ANSWER_MAX_WAIT)
@@ -0,0 +1,54 @@
+from django.db.models import Q
+
+from .models import Message, Team
+from .pagination import InvalidCursor, get_cursor, paginate_keyset
+
+HISTORY_ORDERING = ('-date_added', '-id')
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+
+def get_chat_team(user, team_id):
+    '''
+    Returns the team if the user is one of its members or owns its quiz,
+    otherwise None.
+    '''
+    return Team.objects \
+        .select_related('quiz') \
+        .filter(Q(quiz__owner=user) | Q(teammembership__student_id=user.pk), pk=team_id) \
+        .first()
+
+
+def get_team_history(team_id, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    '''
+    Returns one page of the team chat, newest message first, with cursors for
+    the older and the newer messages. A page after a cursor holds the oldest
+    messages newer than it, so a client catching up never skips any.
+    '''
+    if before and after:
+        raise InvalidCursor('before and after cannot be combined.')
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    messages = Message.objects \
+        .filter(team_id=team_id) \
+        .select_related('user') \
+        .only('content', 'date_added', 'user__username')
+
+    if after:
+        page = paginate_keyset(messages, ('date_added', 'id'), after, page_size=limit)
+        items = page.items[::-1]
+        has_older = True
+    else:
+        page = paginate_keyset(messages, HISTORY_ORDERING, before, page_size=limit)
+        items = page.items
+        has_older = page.next_cursor is not None
+
+    return {
+        'messages': [{
+            'id': message.pk,
+            'user': message.user.username,
+            'text': message.content,
+            'date': message.date_added.isoformat(),
+        } for message in items],
+        'before': get_cursor(items[-1], HISTORY_ORDERING) if items and has_older else None,
+        'after': get_cursor(items[0], HISTORY_ORDERING) if items else after,
+    }
@@ -1,5 +1,12 @@
+import inspect
+from functools import wraps
+
+from channels.db import database_sync_to_async
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.decorators import user_passes_test
+from django.contrib.auth.views import redirect_to_login
+
+from .routers import reading_from_replica
 
 
 def student_required(function=None, redirect_field_name=REDIRECT_FIELD_NAME, login_url='login'):
@@ -30,3 +37,50 @@ def teacher_required(function=None, redirect_field_name=REDIRECT_FIELD_NAME, log
     if function:
         return actual_decorator(function)
     return actual_decorator
+
+
+def pooled_sync_to_async(func):
+    '''
+    Runs the ORM work of async views on the shared worker pool, ASGI_THREADS
+    threads, instead of a thread of its own per request. Connections are
+    cleaned up around each call, as for the chat consumers.
+    '''
+    return database_sync_to_async(func, thread_sensitive=False)
+
+
+def is_active_student(user):
+    return user.is_active and user.is_student
+
+
+def async_student_required(view_func):
+    '''
+    login_required and student_required for async views. The user is loaded
+    from the session in a worker thread, so the view can use request.user
+    on the event loop afterwards.
+    '''
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        if not await pooled_sync_to_async(is_active_student)(request.user):
+            return redirect_to_login(request.get_full_path(), 'login')
+        response = view_func(request, *args, **kwargs)
+        # dispatch() асинхронного класса-представления синхронный и возвращает корутину
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+    return _wrapped_view
+
+
+def replica_reads(view_func):
+    '''
+    Decorator for read-only views that sends their queries to the replica.
+    Template responses are rendered inside the view, so the querysets they
+    evaluate are read from the replica too.
+    '''
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        with reading_from_replica():
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+        return response
+    return _wrapped_view
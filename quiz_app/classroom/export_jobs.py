@@ -0,0 +1,138 @@
+import logging
+import multiprocessing
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .exports import build_student_workbook, write_results_workbook
+from .models import ExportJob, Quiz
+from .routers import reading_from_replica
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ROOT = getattr(settings, 'EXPORT_ROOT', os.path.join(settings.BASE_DIR, 'exports'))
+EXPORT_JOB_TIMEOUT = getattr(settings, 'EXPORT_JOB_TIMEOUT', 900)
+ACTIVE_STATUSES = (ExportJob.PENDING, ExportJob.RUNNING, ExportJob.DONE)
+
+
+def enqueue_export(kind, quiz, student_id=None):
+    '''
+    Returns the export job for the current results of the quiz. Identical
+    pending jobs are reused, and finished files are served until the quiz
+    results change.
+    '''
+    jobs = ExportJob.objects.filter(kind=kind, quiz=quiz, student_id=student_id, results_version=quiz.results_version)
+    job = jobs.filter(status__in=ACTIVE_STATUSES).order_by('-pk').first()
+    if job is not None and (job.status != ExportJob.DONE or os.path.exists(get_job_path(job))):
+        return job
+    try:
+        with transaction.atomic():
+            return ExportJob.objects.create(kind=kind, quiz=quiz, student_id=student_id,
+                                            results_version=quiz.results_version)
+    except IntegrityError:
+        # Такую же задачу одновременно поставил другой запрос, и она могла уже завершиться
+        job = jobs.order_by('-pk').first()
+        if job is None:
+            raise
+        return job
+
+
+def invalidate_exports(quiz_id):
+    '''
+    Marks the current exports of the quiz as stale. Call it whenever the quiz
+    results change, and when the names and texts the exports show change.
+    '''
+    Quiz.objects.filter(pk=quiz_id).update(results_version=F('results_version') + 1)
+
+
+def get_job_path(job):
+    return os.path.join(EXPORT_ROOT, job.file_name or '%s.xlsx' % job.pk)
+
+
+def claim_next_job():
+    for job in ExportJob.objects.filter(status=ExportJob.PENDING).order_by('created')[:10]:
+        job.started = timezone.now()
+        if ExportJob.objects.filter(pk=job.pk, status=ExportJob.PENDING).update(status=ExportJob.RUNNING,
+                                                                                started=job.started):
+            return job
+    return None
+
+
+def requeue_stale_jobs():
+    '''
+    Returns to the queue the jobs whose worker has been rendering them for
+    longer than EXPORT_JOB_TIMEOUT: the worker was stopped or has hung.
+    '''
+    return ExportJob.objects \
+        .filter(status=ExportJob.RUNNING, started__lt=timezone.now() - timedelta(seconds=EXPORT_JOB_TIMEOUT)) \
+        .update(status=ExportJob.PENDING, started=None)
+
+
+def replica_has_results(job):
+    # Реплика может отставать: пока она не видит версию результатов задачи, читаем основную базу
+    with reading_from_replica():
+        return Quiz.objects.filter(pk=job.quiz_id, results_version__gte=job.results_version).exists()
+
+
+def render_job(job):
+    os.makedirs(EXPORT_ROOT, exist_ok=True)
+    job.file_name = '%s.xlsx' % job.pk
+    path = get_job_path(job)
+    # Зависшую задачу может взять другой обработчик, у каждого свой временный файл
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    try:
+        with open(temp_path, 'wb') as file, reading_from_replica(replica_has_results(job)):
+            if job.kind == ExportJob.QUIZ_RESULTS:
+                write_results_workbook(job.quiz_id, file)
+            else:
+                build_student_workbook(job.quiz_id, job.student_id).save(file)
+        os.replace(temp_path, path)
+    except Exception as e:
+        logger.exception('Export job %s failed', job.pk)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.FAILED, error=str(e),
+                                                   finished=timezone.now())
+        return
+
+    ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.DONE, file_name=job.file_name,
+                                               finished=timezone.now())
+    remove_stale_exports(job)
+
+
+def remove_stale_exports(job):
+    stale_jobs = ExportJob.objects \
+        .filter(kind=job.kind, quiz_id=job.quiz_id, student_id=job.student_id,
+                results_version__lt=job.results_version) \
+        .exclude(status__in=(ExportJob.PENDING, ExportJob.RUNNING))
+    for stale_job in stale_jobs:
+        if stale_job.file_name and os.path.exists(get_job_path(stale_job)):
+            os.remove(get_job_path(stale_job))
+    stale_jobs.delete()
+
+
+def run_worker(poll_interval):
+    # Соединения родительского процесса нельзя использовать после fork
+    connections.close_all()
+    while True:
+        requeue_stale_jobs()
+        job = claim_next_job()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        render_job(job)
+
+
+def run_workers(processes, poll_interval):
+    connections.close_all()
+    workers = [multiprocessing.Process(target=run_worker, args=(poll_interval,), daemon=True)
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
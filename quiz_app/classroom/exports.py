@@ -0,0 +1,195 @@
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import BarChart, PieChart, Reference
+from openpyxl.chart.label import DataLabelList
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from .models import QuizStats, StudentAnswer, TakenQuiz, TeamAttempt
+
+GRADE_LABELS = ['Отлично', 'Хорошо', 'Удовлетворительно', 'Неудовлетворительно']
+RESULTS_HEADER = ["Команда", "Учащиеся", "Викторина", "Дата прохождения", "Оценка"]
+TEAMS_HEADER = ["Команда", "Учащиеся", "Оценка"]
+FETCH_SIZE = 2000
+
+border_style = Border(left=Side(style='thin'),
+                      right=Side(style='thin'),
+                      top=Side(style='thin'),
+                      bottom=Side(style='thin'))
+good_fill = PatternFill(start_color="FFC0FFC0", end_color="FFC0FFC0", fill_type="solid")
+bad_fill = PatternFill(start_color="FFFFC0C0", end_color="FFFFC0C0", fill_type="solid")
+bold_font = Font(bold=True)
+
+
+def iter_results_rows(quiz_id):
+    # Дата форматируется в Python, а не функциями конкретной СУБД
+    rows = TakenQuiz.objects \
+        .filter(quiz_id=quiz_id) \
+        .values_list('team__name', 'student__name', 'quiz__name', 'date', 'score') \
+        .order_by() \
+        .iterator(chunk_size=FETCH_SIZE)
+    for team, student, quiz, date, score in rows:
+        yield team, student, quiz, timezone.localtime(date).strftime('%H:%M %d.%m.%Y'), round(score, 2)
+
+
+def team_results(quiz_id):
+    '''
+    Finished team attempts of the quiz: every team is scored once, so the
+    report reads one row per team.
+    '''
+    return TeamAttempt.objects \
+        .filter(quiz_id=quiz_id, is_finished=True) \
+        .order_by('team__name', 'team_id')
+
+
+def get_team_results(quiz_id):
+    rows = team_results(quiz_id).values_list('team__name', 'member_names', 'score')
+    return [(name, students, round(score, 2)) for name, students, score in rows]
+
+
+def get_grade_counts(quiz_id):
+    stats = QuizStats.objects.filter(quiz_id=quiz_id).first()
+    if stats is None:
+        return [0, 0, 0, 0]
+    return stats.get_grade_counts()
+
+
+def get_score_fill(score):
+    if score >= 8:
+        return good_fill
+    elif score < 4:
+        return bad_fill
+    return None
+
+
+def add_team_charts(ws, team_count):
+    bar_chart = BarChart()
+    values = Reference(ws, min_col=3, min_row=1, max_row=team_count + 1)
+    categories = Reference(ws, min_col=1, min_row=2, max_row=team_count + 2)
+    bar_chart.add_data(values, titles_from_data=True)
+    bar_chart.set_categories(categories)
+    bar_chart.title = "Результаты прохождения"
+    bar_chart.x_axis.title = "Команда"
+    bar_chart.y_axis.title = "Оценка"
+    ws.add_chart(bar_chart, "A10")
+
+    pie_chart = PieChart()
+    data_labels = DataLabelList()
+    data_labels.showPercent = True
+    pie_chart.dataLabels = data_labels
+
+    values = Reference(ws, min_col=6, min_row=1, max_row=4)
+    categories = Reference(ws, min_col=5, min_row=1, max_row=4)
+    pie_chart.add_data(values, titles_from_data=False)
+    pie_chart.set_categories(categories)
+    pie_chart.title = "Распределение оценок студентов"
+    ws.add_chart(pie_chart, "F10")
+
+
+def write_results_workbook(quiz_id, file):
+    '''
+    Writes the quiz results workbook to file with write-only worksheets.
+    Rows are styled as they are written and never kept in memory, so memory
+    use does not depend on the number of results.
+    '''
+    wb = Workbook(write_only=True)
+
+    ws1 = wb.create_sheet(title="Результаты проведения викторины")
+    ws1.column_dimensions[get_column_letter(1)].width = 10
+    ws1.column_dimensions[get_column_letter(2)].width = 30
+    ws1.column_dimensions[get_column_letter(3)].width = 30
+    ws1.column_dimensions[get_column_letter(4)].width = 20
+    ws1.column_dimensions[get_column_letter(5)].width = 10
+    ws1.append([styled_cell(ws1, value, font=bold_font) for value in RESULTS_HEADER])
+    for row in iter_results_rows(quiz_id):
+        cells = [styled_cell(ws1, value) for value in row]
+        fill = get_score_fill(row[4])
+        if fill:
+            cells[4].fill = fill
+        ws1.append(cells)
+
+    ws2 = wb.create_sheet(title="Статистика по результатам")
+    ws2.column_dimensions[get_column_letter(2)].width = 40
+    ws2.column_dimensions[get_column_letter(5)].width = 20
+    data = get_team_results(quiz_id)
+    counts = get_grade_counts(quiz_id)
+
+    # Таблица распределения оценок занимает колонки E:F первых строк листа
+    rows = [TEAMS_HEADER] + [list(row) for row in data]
+    rows += [[None, None, None] for _ in range(len(GRADE_LABELS) - len(rows))]
+    for index, row in enumerate(rows):
+        font = bold_font if index == 0 else None
+        cells = [styled_cell(ws2, value, font=font) for value in row]
+        if index < len(GRADE_LABELS):
+            cells += [styled_cell(ws2, None), styled_cell(ws2, GRADE_LABELS[index]),
+                      styled_cell(ws2, counts[index])]
+        ws2.append(cells)
+
+    add_team_charts(ws2, len(data))
+    wb.save(file)
+
+
+def styled_cell(ws, value, font=None):
+    cell = WriteOnlyCell(ws, value=value)
+    if value is not None:
+        cell.border = border_style
+    if font:
+        cell.font = font
+    return cell
+
+
+def build_student_workbook(quiz_id, student_id):
+    team_attempt = team_results(quiz_id).filter(taken_quizzes__student_id=student_id).select_related('team').first()
+    answers = StudentAnswer.objects.filter(quiz_id=quiz_id, student_id=student_id, team_attempt__isnull=True)
+    if team_attempt is not None:
+        data = [('Команда: %s (%s)' % (team_attempt.team.name, team_attempt.member_names),
+                 'Оценка: %s' % team_attempt.score)]
+        # Попытки, собранные миграцией 0026 из прежних результатов, не хранят ответов команды:
+        # для них выводятся ответы самого студента
+        if team_attempt.answered_count:
+            answers = StudentAnswer.objects.filter(team_attempt=team_attempt)
+    else:
+        data = [('Команда: %s' % team if team else 'Без команды', 'Оценка: %s' % score)
+                for team, score in TakenQuiz.objects
+                .filter(quiz_id=quiz_id, student_id=student_id)
+                .values_list('team__name', 'score')]
+
+    # Создаем Excel файл
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Результат викторины"
+    ws.column_dimensions[get_column_letter(1)].width = 70
+    ws.column_dimensions[get_column_letter(2)].width = 20
+    ws.column_dimensions[get_column_letter(3)].width = 18
+
+    for row in data:
+        ws.append(row)
+    ws.append([])
+    ws.append(["Вопрос", "Ответ команды", "Ответ правильный"])
+    for row in ws.iter_rows(min_row=1, max_row=3):
+        for cell in row:
+            cell.font = bold_font
+
+    data = answers.values_list('question__text', 'answer__text', 'is_correct')
+    data = [(question, answer, 'Да' if is_correct else 'Нет') for question, answer, is_correct in data]
+    for row in data:
+        ws.append(row)
+
+    for row in ws:
+        for cell in row:
+            cell.border = border_style
+
+    # Перебираем ячейки в столбце "Ответ правильный" (колонка C)
+    for row in ws.iter_rows(min_row=4, max_row=ws.max_row, min_col=3, max_col=3):
+        for cell in row:
+            # Проверяем значение ячейки на "Нет" и применяем стиль, если условие выполняется
+            if cell.value == 'Нет':
+                cell.fill = bad_fill
+
+    # Перебираем ячейки и устанавливаем свойство wrap_text для переноса текста
+    for row in ws.iter_rows():
+        for cell in row:
+            cell.alignment = Alignment(wrap_text=True)
+
+    return wb
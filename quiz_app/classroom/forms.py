@@ -4,8 +4,9 @@ from django.db import transaction
 from django.forms.utils import ValidationError
 from django_select2.forms import Select2MultipleWidget
 
-from classroom.models import (Answer, Question, Student, StudentAnswer,
-                              Subject, User, Team)
+from classroom.models import Question, Quiz, Student, Subject, User, Team
+from classroom.quiz_bank import FORMATS, get_format
+from classroom.rosters import MAX_TEAM_SIZE
 
 
 class TeacherSignUpForm(UserCreationForm):
@@ -79,23 +80,33 @@ class BaseAnswerInlineFormSet(forms.BaseInlineFormSet):
             raise ValidationError('Отметьте хотя бы один ответ как правильный.', code='no_correct_answer')
 
 
-class TakeQuizForm(forms.ModelForm):
-    answer = forms.ModelChoiceField(
-        queryset=Answer.objects.none(),
-        widget=forms.RadioSelect(),
-        required=True,
-        empty_label=None)
+class QuizImportForm(forms.Form):
+    file = forms.FileField(label='Файл с вопросами (CSV или JSONL)')
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if get_format(file.name) is None:
+            raise ValidationError('Поддерживаются файлы %s.' % ', '.join('.' + format for format in FORMATS),
+                                  code='invalid_format')
+        return file
 
-    class Meta:
-        model = StudentAnswer
-        fields = ('answer',)
+
+class TakeQuizForm(forms.Form):
+    answer = forms.TypedChoiceField(
+        coerce=int,
+        widget=forms.RadioSelect(),
+        required=True)
 
     def __init__(self, *args, **kwargs):
-        question = kwargs.pop('question')
+        self.question = kwargs.pop('question')
         super().__init__(*args, **kwargs)
-        self.fields['answer'].queryset = question.answers.order_by('text')
+        self.fields['answer'].choices = [(answer.pk, answer.text) for answer in self.question.answers]
         self.fields['answer'].label = 'Варианты ответа: '
 
+    def clean_answer(self):
+        answer_pk = self.cleaned_data['answer']
+        return next(answer for answer in self.question.answers if answer.pk == answer_pk)
+
 
 class TeamForm(forms.ModelForm):
     class Meta:
@@ -107,15 +118,36 @@ class TeamForm(forms.ModelForm):
         self.fields['name'].label = 'Название команды'
         self.fields['quiz'].label = 'Викторина'
         self.fields['students'].label = 'Студенты'
+        # Список отрисовывает только выбранных студентов, остальные ищутся через автодополнение
+        self.fields['students'].widget.choices = [
+            (student.pk, str(student))
+            for student in self.fields['students'].queryset.filter(pk__in=self.get_selected_students())
+        ]
 
     students = forms.ModelMultipleChoiceField(
-        queryset=Student.objects.all(),
-        widget=forms.SelectMultiple(attrs={'size': 5}),
+        queryset=Student.objects.select_related('user'),
+        widget=forms.SelectMultiple(attrs={'size': MAX_TEAM_SIZE}),
         required=True
     )
 
+    def get_selected_students(self):
+        if self.is_bound:
+            values = self.data.getlist(self.add_prefix('students'))
+        else:
+            values = [getattr(student, 'pk', student) for student in self.initial.get('students') or []]
+        return [value for value in values if str(value).isdigit()]
+
     def clean_students(self):
         students = self.cleaned_data['students']
-        if len(students) > 5:
-            raise forms.ValidationError('В команде допускается не более 5 студентов.')
+        if len(students) > MAX_TEAM_SIZE:
+            raise forms.ValidationError('В команде допускается не более %s студентов.' % MAX_TEAM_SIZE)
         return students
+
+
+class RosterImportForm(forms.Form):
+    quiz = forms.ModelChoiceField(queryset=Quiz.objects.none(), label='Викторина')
+    file = forms.FileField(label='Файл CSV с составом команд')
+
+    def __init__(self, owner, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['quiz'].queryset = owner.quizzes.order_by('name')
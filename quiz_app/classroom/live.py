@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import StudentAnswer, TakenQuiz
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_TICK = getattr(settings, 'QUIZ_PROGRESS_TICK', 0.5)
+
+
+def get_progress_group(quiz_id):
+    return 'quiz_%s_progress' % quiz_id
+
+
+def new_progress():
+    # Ключи строковые, так как состояние передается через JSON
+    return {'questions': {}, 'teams': {}}
+
+
+def merge_progress(progress, delta):
+    for question_id, (answered, correct) in delta['questions'].items():
+        counts = progress['questions'].setdefault(question_id, [0, 0])
+        counts[0] += answered
+        counts[1] += correct
+    for team_id, completions in delta['teams'].items():
+        progress['teams'][team_id] = progress['teams'].get(team_id, 0) + completions
+
+
+def get_quiz_progress(quiz_id):
+    '''
+    Current progress of the quiz from the database: answers and correct
+    answers per question and completions per team.
+    '''
+    progress = new_progress()
+    questions = StudentAnswer.objects \
+        .filter(quiz_id=quiz_id) \
+        .values('question_id') \
+        .annotate(answered=Count('pk'), correct=Count('pk', filter=Q(is_correct=True))) \
+        .order_by()
+    for row in questions:
+        progress['questions'][str(row['question_id'])] = [row['answered'], row['correct']]
+    teams = TakenQuiz.objects \
+        .filter(quiz_id=quiz_id, team__isnull=False) \
+        .values('team_id') \
+        .annotate(completions=Count('pk')) \
+        .order_by()
+    for row in teams:
+        progress['teams'][str(row['team_id'])] = row['completions']
+    return progress
+
+
+class ProgressPublisher:
+    '''
+    Collects the progress events of this process and sends them to the
+    dashboard group of each quiz as one delta per tick, so the channel layer
+    traffic does not grow with the number of answers.
+
+    The channel layer is not thread safe. Under ASGI the deltas are sent by a
+    task on the event loop that serves the requests, the one bind() was
+    called with; a process without such a loop sends them through
+    async_to_sync like any other sync code.
+    '''
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.loop = None
+        self.scheduled = False
+
+    def bind(self, loop):
+        self.loop = loop
+
+    def add_answer(self, quiz_id, question_id, is_correct):
+        with self.lock:
+            delta = self.pending.setdefault(quiz_id, new_progress())
+            counts = delta['questions'].setdefault(str(question_id), [0, 0])
+            counts[0] += 1
+            counts[1] += int(is_correct)
+        self.schedule()
+
+    def add_completion(self, quiz_id, team_id, count=1):
+        with self.lock:
+            teams = self.pending.setdefault(quiz_id, new_progress())['teams']
+            teams[str(team_id)] = teams.get(str(team_id), 0) + count
+        self.schedule()
+
+    def schedule(self):
+        # Одна отправка на тик: следующие события до нее только копятся в pending
+        with self.lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        loop = self.loop
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.run(), loop)
+        else:
+            timer = threading.Timer(self.interval, async_to_sync(self.publish))
+            timer.daemon = True
+            timer.start()
+
+    async def run(self):
+        await asyncio.sleep(self.interval)
+        await self.publish()
+
+    async def publish(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.scheduled = False
+        layer = get_channel_layer()
+        if layer is None or not pending:
+            return
+        try:
+            await asyncio.gather(*[
+                layer.group_send(get_progress_group(quiz_id), dict(delta, type='progress_delta'))
+                for quiz_id, delta in pending.items()
+            ])
+        except Exception:
+            logger.exception('Could not publish quiz progress')
+
+
+progress_publisher = ProgressPublisher(PROGRESS_TICK)
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from classroom.models import Quiz, QuizAttempt, Student, StudentAnswer, TakenQuiz, TeamAttempt
+from classroom.progress import derive_answer_counts, derive_team_answer_counts
+
+
+class Command(BaseCommand):
+    help = ('Creates or refreshes quiz attempts (progress and running score) from existing answers. '
+            'Team attempts are only refreshed, they are created when a member opens the quiz.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of quizzes processed per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        quiz_ids = list(Quiz.objects.order_by('pk').values_list('pk', flat=True))
+        created = updated = team_updated = 0
+        for start in range(0, len(quiz_ids), batch_size):
+            batch_created, batch_updated = self.backfill(quiz_ids[start:start + batch_size])
+            created += batch_created
+            updated += batch_updated
+            team_updated += self.backfill_teams(quiz_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS('Создано попыток: %s, обновлено: %s, обновлено командных попыток: %s.'
+                                             % (created, updated, team_updated)))
+
+    @transaction.atomic
+    def backfill(self, quiz_ids):
+        counts = derive_answer_counts(quiz_ids=quiz_ids)
+        finished = set(TakenQuiz.objects
+                       .filter(quiz_id__in=quiz_ids, team_attempt__isnull=True)
+                       .values_list('student_id', 'quiz_id'))
+        quizzes = Quiz.objects.in_bulk(quiz_ids)
+        total_questions = dict(Quiz.objects.filter(pk__in=quiz_ids)
+                               .annotate(total=Count('questions'))
+                               .values_list('pk', 'total'))
+        attempts = {(attempt.student_id, attempt.quiz_id): attempt
+                    for attempt in QuizAttempt.objects.filter(quiz_id__in=quiz_ids)}
+
+        new_attempts = []
+        for key in set(counts) | finished | set(attempts):
+            student_id, quiz_id = key
+            attempt = attempts.get(key) or QuizAttempt(student_id=student_id, quiz_id=quiz_id)
+            attempt.total_questions = total_questions[quiz_id]
+            attempt.answered_count, attempt.correct_count = counts.get(key, (0, 0))
+            attempt.is_finished = key in finished
+            if attempt.is_finished:
+                attempt.next_question = None
+            else:
+                attempt.next_question = Student(pk=student_id) \
+                    .get_unanswered_questions(quizzes[quiz_id]) \
+                    .order_by('text', 'pk') \
+                    .first()
+            if attempt.pk is None:
+                new_attempts.append(attempt)
+
+        QuizAttempt.objects.bulk_create(new_attempts)
+        QuizAttempt.objects.bulk_update(
+            attempts.values(),
+            ['total_questions', 'answered_count', 'correct_count', 'is_finished', 'next_question']
+        )
+        return len(new_attempts), len(attempts)
+
+    @transaction.atomic
+    def backfill_teams(self, quiz_ids):
+        counts = derive_team_answer_counts(quiz_ids=quiz_ids)
+        quizzes = Quiz.objects.in_bulk(quiz_ids)
+        total_questions = dict(Quiz.objects.filter(pk__in=quiz_ids)
+                               .annotate(total=Count('questions'))
+                               .values_list('pk', 'total'))
+        attempts = list(TeamAttempt.objects.filter(quiz_id__in=quiz_ids))
+        for attempt in attempts:
+            attempt.total_questions = total_questions[attempt.quiz_id]
+            attempt.answered_count, attempt.correct_count = counts.get(attempt.pk, (0, 0))
+            if attempt.is_finished:
+                attempt.next_question = None
+            else:
+                answered = StudentAnswer.objects.filter(team_attempt_id=attempt.pk).values('question_id')
+                attempt.next_question = quizzes[attempt.quiz_id].questions \
+                    .exclude(pk__in=answered) \
+                    .order_by('text', 'pk') \
+                    .first()
+
+        TeamAttempt.objects.bulk_update(
+            attempts,
+            ['total_questions', 'answered_count', 'correct_count', 'next_question']
+        )
+        return len(attempts)
@@ -0,0 +1,127 @@
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from classroom.exports import (GRADE_LABELS, RESULTS_HEADER, TEAMS_HEADER, add_team_charts, bold_font, border_style,
+                               get_grade_counts, get_score_fill, get_team_results, iter_results_rows,
+                               write_results_workbook)
+from classroom.models import Quiz, Room, Student, Subject, TakenQuiz, Team, User
+
+BATCH_SIZE = 5000
+STUDENTS = 1000
+TEAMS = 200
+
+
+class Command(BaseCommand):
+    help = ('Compares latency and peak memory of the in-memory and the streaming quiz results export. '
+            'Seeds a scratch database, never run it against a production database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                            help='TakenQuiz row counts to benchmark.')
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            quiz = self.seed(rows)
+            self.stdout.write('TakenQuiz: %s' % rows)
+            self.measure('  в памяти', lambda: build_results_workbook(quiz.pk).save(tempfile.TemporaryFile()))
+            self.measure('  потоковый', lambda: write_results_workbook(quiz.pk, tempfile.TemporaryFile()))
+
+    def measure(self, name, export):
+        started = time.perf_counter()
+        export()
+        elapsed = time.perf_counter() - started
+
+        # Память считается отдельным прогоном, так как tracemalloc замедляет выполнение
+        tracemalloc.start()
+        export()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write('%s: %.2f с, пик памяти %.1f МБ' % (name, elapsed, peak / 1024 / 1024))
+
+    @transaction.atomic
+    def seed(self, rows):
+        owner, _ = User.objects.get_or_create(username='benchmark_teacher', defaults={'is_teacher': True})
+        subject = Subject.objects.first() or Subject.objects.create(name='Benchmark')
+        room, _ = Room.objects.get_or_create(slug='benchmark', defaults={'name': 'benchmark'})
+        quiz = Quiz.objects.create(owner=owner, subject=subject, room=room, name='Export %s' % rows)
+
+        Team.objects.bulk_create([Team(quiz=quiz, name='Team %s' % i) for i in range(TEAMS)])
+        team_ids = list(Team.objects.filter(quiz=quiz).values_list('pk', flat=True))
+        if Student.objects.count() < STUDENTS:
+            User.objects.bulk_create([User(username='benchmark_export_student_%s' % i, is_student=True)
+                                      for i in range(STUDENTS)], batch_size=BATCH_SIZE)
+            users = User.objects.filter(username__startswith='benchmark_export_student_')
+            Student.objects.bulk_create([Student(user=user, name=user.username) for user in users],
+                                        batch_size=BATCH_SIZE)
+        student_ids = list(Student.objects.values_list('pk', flat=True)[:STUDENTS])
+
+        TakenQuiz.objects.bulk_create([TakenQuiz(quiz=quiz,
+                                                 student_id=student_ids[i % len(student_ids)],
+                                                 team_id=team_ids[i % len(team_ids)],
+                                                 score=i % 11)
+                                       for i in range(rows)], batch_size=BATCH_SIZE)
+        return quiz
+
+
+def build_results_workbook(quiz_id):
+    '''
+    The quiz results workbook built in memory, as exports were built before
+    write_results_workbook, to compare the two.
+    '''
+    wb = Workbook()
+    ws1 = wb.active
+    ws1.title = "Результаты проведения викторины"
+    ws1.column_dimensions[get_column_letter(1)].width = 10
+    ws1.column_dimensions[get_column_letter(2)].width = 30
+    ws1.column_dimensions[get_column_letter(3)].width = 30
+    ws1.column_dimensions[get_column_letter(4)].width = 20
+    ws1.column_dimensions[get_column_letter(5)].width = 10
+    ws1.append(RESULTS_HEADER)
+    for row in ws1.iter_rows(min_row=1, max_row=1):
+        for cell in row:
+            cell.font = bold_font
+
+    for row in iter_results_rows(quiz_id):
+        ws1.append(row)
+
+    for row in ws1.iter_rows(min_row=2, min_col=5, max_col=5):
+        for cell in row:
+            fill = get_score_fill(cell.value)
+            if fill:
+                cell.fill = fill
+
+    for row in ws1:
+        for cell in row:
+            cell.border = border_style
+
+    ws2 = wb.create_sheet(title="Статистика по результатам")
+    ws2.column_dimensions[get_column_letter(2)].width = 40
+    ws2.column_dimensions[get_column_letter(5)].width = 20
+    data = get_team_results(quiz_id)
+
+    ws2.append(TEAMS_HEADER)
+    for row in data:
+        ws2.append(row)
+
+    for row in ws2.iter_rows(min_row=1, max_row=1, min_col=1, max_col=3):
+        for cell in row:
+            cell.font = bold_font
+
+    counts = get_grade_counts(quiz_id)
+    for i, label in enumerate(GRADE_LABELS, start=1):
+        ws2[f'E{i}'] = label
+        ws2[f'F{i}'] = counts[i - 1]
+
+    for row in ws2:
+        for cell in row:
+            cell.border = border_style
+
+    add_team_charts(ws2, len(data))
+    return wb
@@ -0,0 +1,164 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from classroom.models import (Answer, Message, Question, Quiz, Room, Student, StudentAnswer, Subject,
+                              TakenQuiz, Team, User)
+
+QUESTIONS_PER_QUIZ = 20
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Seeds a scratch database with StudentAnswer rows and times the classroom hot-path queries '
+            'with and without the hot-path indexes. The indexes are dropped and recreated, so the command '
+            'only runs against a dedicated database given by --database, never the default one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', required=True,
+                            help='Alias of a dedicated scratch database from settings.DATABASES, migrated beforehand.')
+        parser.add_argument('--answers', type=int, default=1000000, help='Number of StudentAnswer rows to seed.')
+        parser.add_argument('--quizzes', type=int, default=50, help='Number of quizzes to seed.')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per timed query.')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse data seeded by a previous run.')
+
+    def handle(self, *args, **options):
+        self.database = options['database']
+        if self.database not in connections.databases:
+            raise CommandError('База данных %s не описана в settings.DATABASES.' % self.database)
+        # Схема рабочей базы не меняется ни при каких флагах, в том числе с --skip-seed
+        scratch_name = connections[self.database].settings_dict['NAME']
+        protected_names = {connections[alias].settings_dict['NAME']
+                           for alias in connections.databases if alias != self.database}
+        if self.database == DEFAULT_DB_ALIAS or scratch_name in protected_names:
+            raise CommandError('Команда удаляет индексы, укажите отдельную базу для замеров, а не %s.'
+                               % self.database)
+
+        if not options['skip_seed']:
+            if StudentAnswer.objects.using(self.database).exists():
+                raise CommandError('База данных уже содержит ответы, используйте --skip-seed.')
+            self.seed(options['answers'], options['quizzes'])
+
+        self.stdout.write('С индексами:')
+        with_indexes = self.run_queries(options['repeat'])
+        self.drop_indexes()
+        try:
+            self.stdout.write('Без индексов:')
+            without_indexes = self.run_queries(options['repeat'])
+        finally:
+            self.create_indexes()
+
+        self.stdout.write('')
+        for name in with_indexes:
+            self.stdout.write('%-32s %9.3f ms -> %9.3f ms' % (name, without_indexes[name], with_indexes[name]))
+
+    def seed(self, total_answers, quiz_count):
+        started = time.perf_counter()
+        database = self.database
+        with transaction.atomic(using=database):
+            owner = User.objects.db_manager(database).create_user('benchmark_teacher', is_teacher=True)
+            subject = Subject.objects.using(database).first() or \
+                Subject.objects.using(database).create(name='Benchmark')
+            room = Room.objects.using(database).create(name='benchmark', slug='benchmark')
+            Quiz.objects.using(database).bulk_create(
+                [Quiz(owner=owner, subject=subject, room=room, name='Quiz %s' % i) for i in range(quiz_count)]
+            )
+            quizzes = list(Quiz.objects.using(database).filter(owner=owner).order_by('pk'))
+            Question.objects.using(database).bulk_create([Question(quiz=quiz, text='Question %s' % i)
+                                                          for quiz in quizzes for i in range(QUESTIONS_PER_QUIZ)])
+            questions = list(Question.objects.using(database).filter(quiz__owner=owner).order_by('pk'))
+            Answer.objects.using(database).bulk_create([
+                Answer(question=question, text=text, is_correct=is_correct)
+                for question in questions
+                for text, is_correct in (('right', True), ('wrong', False))
+            ])
+            answers = {}
+            for answer in Answer.objects.using(database).filter(question__quiz__owner=owner).order_by('pk'):
+                answers.setdefault(answer.question_id, []).append(answer.pk)
+            Team.objects.using(database).bulk_create([Team(quiz=quiz, name='Team %s' % quiz.pk) for quiz in quizzes])
+            teams = list(Team.objects.using(database).filter(quiz__owner=owner).order_by('pk'))
+
+            student_count = -(-total_answers // len(questions))
+            User.objects.using(database).bulk_create([User(username='benchmark_student_%s' % i, is_student=True)
+                                                      for i in range(student_count)], batch_size=BATCH_SIZE)
+            users = User.objects.using(database).filter(username__startswith='benchmark_student_').order_by('pk')
+            Student.objects.using(database).bulk_create([Student(user=user, name=user.username) for user in users],
+                                                        batch_size=BATCH_SIZE)
+            student_ids = list(Student.objects.using(database).filter(user__in=users).values_list('pk', flat=True))
+
+        batch = []
+        seeded = 0
+        for index in range(total_answers):
+            student_id = student_ids[index // len(questions)]
+            question = questions[index % len(questions)]
+            batch.append(StudentAnswer(student_id=student_id, question_id=question.pk, quiz_id=question.quiz_id,
+                                       answer_id=answers[question.pk][index % 2], is_correct=index % 2 == 0))
+            if len(batch) == BATCH_SIZE:
+                seeded += self.flush(batch)
+        seeded += self.flush(batch)
+
+        TakenQuiz.objects.using(database).bulk_create([TakenQuiz(student_id=student_id, quiz=quiz, team=team, score=5)
+                                                       for student_id in student_ids
+                                                       for quiz, team in zip(quizzes, teams)], batch_size=BATCH_SIZE)
+        Message.objects.using(database).bulk_create([Message(room=room, user=owner, content='Message %s' % i)
+                                                     for i in range(10000)], batch_size=BATCH_SIZE)
+        self.stdout.write('Создано ответов: %s за %.1f с.' % (seeded, time.perf_counter() - started))
+
+    def flush(self, batch):
+        StudentAnswer.objects.using(self.database).bulk_create(batch)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    def run_queries(self, repeat):
+        database = self.database
+        quiz = Quiz.objects.using(database).filter(owner__username='benchmark_teacher').order_by('-pk').first()
+        if quiz is None:
+            raise CommandError('Нет данных для замеров, запустите команду без --skip-seed.')
+        student = Student.objects.using(database).order_by('-pk').first()
+        team = Team.objects.using(database).filter(quiz=quiz).first()
+        queries = {
+            'unanswered questions': lambda: list(student.get_unanswered_questions(quiz)),
+            'correct answers count': lambda: StudentAnswer.objects.using(database).filter(
+                student=student, quiz=quiz, is_correct=True).count(),
+            'taken quizzes by quiz and team': lambda: list(TakenQuiz.objects.using(database)
+                                                           .filter(quiz=quiz, team=team)),
+            'taken quiz by student and quiz': lambda: TakenQuiz.objects.using(database)
+                                                               .filter(student=student, quiz=quiz).exists(),
+            'latest room messages': lambda: list(Message.objects.using(database).filter(room=quiz.room_id)
+                                                 .order_by('-date_added')[:50]),
+            'quizzes by subject': lambda: list(Quiz.objects.using(database)
+                                               .filter(subject=quiz.subject_id).order_by('name')),
+        }
+        timings = {}
+        for name, query in queries.items():
+            runs = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                query()
+                runs.append((time.perf_counter() - started) * 1000)
+            timings[name] = statistics.median(runs)
+            self.stdout.write('  %-32s %9.3f ms' % (name, timings[name]))
+        return timings
+
+    def hot_path_indexes(self):
+        for model in (Message, Quiz, StudentAnswer, TakenQuiz):
+            for index in model._meta.indexes:
+                yield model, index
+
+    def drop_indexes(self):
+        # SQLite пересоздает таблицу при удалении ограничения, поэтому индексы удаляются после него
+        with connections[self.database].schema_editor() as schema_editor:
+            for constraint in StudentAnswer._meta.constraints:
+                schema_editor.remove_constraint(StudentAnswer, constraint)
+            for model, index in self.hot_path_indexes():
+                schema_editor.remove_index(model, index)
+
+    def create_indexes(self):
+        with connections[self.database].schema_editor() as schema_editor:
+            for model, index in self.hot_path_indexes():
+                schema_editor.add_index(model, index)
+            for constraint in StudentAnswer._meta.constraints:
+                schema_editor.add_constraint(StudentAnswer, constraint)
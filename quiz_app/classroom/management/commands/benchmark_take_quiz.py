@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+
+from .load_test_take_quiz import ANSWER_RE, PERCENTILES, Command as LoadTestCommand
+
+
+class Command(LoadTestCommand):
+    help = ('Measures the throughput of the take-quiz loop on the configured database: seeds a quiz and '
+            'students, then every student answers all questions from its own thread through the test client. '
+            'Run it once per database profile to compare them, e.g. with and without DATABASE_ENGINE=postgres. '
+            'Never run it against a production database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50, help='Number of students taking the quiz.')
+        parser.add_argument('--questions', type=int, default=10, help='Number of questions in the quiz.')
+        parser.add_argument('--threads', type=int, default=16, help='Number of concurrent students.')
+
+    def handle(self, *args, **options):
+        quiz, users = self.seed(options['students'], options['questions'])
+        self.codes = Counter()
+        self.latencies = []
+        self.lock = threading.Lock()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            futures = [executor.submit(self.take_quiz, quiz.pk, user) for user in users]
+        elapsed = time.perf_counter() - started
+        errors = sum(1 for future in futures if future.exception() is not None)
+
+        database = settings.DATABASES['default']
+        self.stdout.write('База данных: %s, CONN_MAX_AGE: %s' % (connection.vendor, database.get('CONN_MAX_AGE', 0)))
+        self.stdout.write('Студентов: %s, потоков: %s, время: %.2f с' % (len(users), options['threads'], elapsed))
+        self.stdout.write('  Ответов в секунду: %.1f' % (self.codes[302] / elapsed))
+        for code, count in sorted(self.codes.items()):
+            self.stdout.write('  HTTP %s: %s' % (code, count))
+        if errors:
+            self.stdout.write('  Ошибок: %s' % errors)
+        latencies = sorted(self.latencies)
+        for percentile in PERCENTILES:
+            if latencies:
+                index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+                self.stdout.write('  p%s ответа: %.1f ms' % (percentile, latencies[index] * 1000))
+
+    def take_quiz(self, quiz_id, user):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        path = '/students/quiz/%s/' % quiz_id
+        try:
+            while True:
+                response = client.get(path)
+                match = ANSWER_RE.search(response.content.decode())
+                if response.status_code != 200 or match is None:
+                    return
+
+                started = time.perf_counter()
+                response = client.post(path, {'answer': match.group(1)})
+                with self.lock:
+                    self.codes[response.status_code] += 1
+                    self.latencies.append(time.perf_counter() - started)
+
+                if response.status_code in (429, 503):
+                    time.sleep(int(response.get('Retry-After', '1')))
+                elif response.status_code != 302 or response.url.rstrip('/').endswith('students'):
+                    return
+        finally:
+            # Соединение потока живет до конца прогона, как постоянное соединение воркера
+            connections.close_all()
@@ -0,0 +1,203 @@
+import asyncio
+import io
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+
+from classroom.models import Student
+
+from .load_test_take_quiz import ANSWER_RE, CSRF_TOKEN, PERCENTILES, Command as LoadTestCommand
+
+
+class Command(LoadTestCommand):
+    help = ('Compares WSGI and ASGI throughput of the student quiz flow side by side: every student opens the '
+            'quiz list, answers all questions and opens the taken quiz list. The requests go straight to the '
+            'Django WSGI and ASGI handlers of this process, the WSGI side through a pool of --threads threads '
+            'like a threaded server, the ASGI side on one event loop. Seeds the configured database, never '
+            'run it against a production database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000, help='Number of concurrent students.')
+        parser.add_argument('--questions', type=int, default=5, help='Number of questions in the quiz.')
+        parser.add_argument('--threads', type=int, default=32, help='Number of WSGI server threads.')
+
+    def handle(self, *args, **options):
+        results = []
+        for name in ('WSGI', 'ASGI'):
+            # Каждый прогон проходит свою викторину с новыми студентами
+            quiz, users = self.seed(options['students'], options['questions'])
+            Student.interests.through.objects.bulk_create([
+                Student.interests.through(student_id=user.pk, subject_id=quiz.subject_id) for user in users
+            ])
+            sessions = [self.create_session(user) for user in users]
+            results.append((name, self.run(name, quiz.pk, sessions, options['threads'])))
+
+        self.stdout.write('База данных: %s, студентов: %s, вопросов: %s, потоков WSGI: %s' % (
+            connection.vendor, options['students'], options['questions'], options['threads']))
+        rows = [
+            ('Время, с', '%.2f', lambda result: result['elapsed']),
+            ('Запросов в секунду', '%.1f', lambda result: result['requests'] / result['elapsed']),
+            ('Ответов в секунду', '%.1f', lambda result: result['codes'][302] / result['elapsed']),
+        ]
+        for percentile in PERCENTILES:
+            rows.append(('p%s запроса, ms' % percentile, '%.1f',
+                         lambda result, percentile=percentile: get_percentile(result['latencies'], percentile) * 1000))
+        codes = sorted(set().union(*(result['codes'] for _, result in results)))
+        for code in codes:
+            rows.append(('HTTP %s' % code, '%s', lambda result, code=code: result['codes'][code]))
+        rows.append(('Ошибок', '%s', lambda result: result['errors']))
+
+        self.stdout.write('%-22s%14s%14s' % ('', results[0][0], results[1][0]))
+        for title, value_format, get_value in rows:
+            self.stdout.write('%-22s%14s%14s' % ((title,) + tuple(value_format % get_value(result)
+                                                                  for _, result in results)))
+
+    def run(self, name, quiz_id, sessions, threads):
+        self.stdout.write('%s: %s студентов...' % (name, len(sessions)))
+        # Потоков поровну: WSGI-сервер обслуживает в них запросы целиком,
+        # ASGI выполняет в них только работу с ORM, как при ASGI_THREADS=threads
+        executor = ThreadPoolExecutor(max_workers=threads)
+        if name == 'WSGI':
+            handler = WSGIHandler()
+
+            async def send(method, path, cookie, body):
+                # Запрос ждет свободный поток сервера, как в очереди gthread-воркера
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(executor, call_wsgi, handler, method, path, cookie, body)
+        else:
+            handler = ASGIHandler()
+
+            async def send(method, path, cookie, body):
+                asyncio.get_running_loop().set_default_executor(executor)
+                return await call_asgi(handler, method, path, cookie, body)
+
+        result = {'codes': Counter(), 'latencies': [], 'requests': 0, 'errors': 0}
+        started = time.perf_counter()
+        try:
+            asyncio.run(self.take_quizzes(send, quiz_id, sessions, result))
+        finally:
+            executor.shutdown()
+        result['elapsed'] = time.perf_counter() - started
+        return result
+
+    async def take_quizzes(self, send, quiz_id, sessions, result):
+        async def request(method, path, cookie, body=b''):
+            started = time.perf_counter()
+            status, headers, content = await send(method, path, cookie, body)
+            result['latencies'].append(time.perf_counter() - started)
+            result['requests'] += 1
+            result['codes'][status] += 1
+            return status, headers, content
+
+        async def take_quiz(session):
+            cookie = '%s=%s; %s=%s' % (settings.SESSION_COOKIE_NAME, session, settings.CSRF_COOKIE_NAME, CSRF_TOKEN)
+            path = '/students/quiz/%s/' % quiz_id
+            await request('GET', '/students/', cookie)
+            while True:
+                status, headers, content = await request('GET', path, cookie)
+                match = ANSWER_RE.search(content.decode())
+                if status != 200 or match is None:
+                    break
+                status, headers, content = await request('POST', path, cookie, ('answer=%s' % match.group(1)).encode())
+                if status in (429, 503):
+                    await asyncio.sleep(int(headers.get('retry-after', '1')))
+                # 200 после ответа: вопрос уже сменил другой участник команды
+                elif status not in (200, 302) or urlsplit(headers.get('location', '')).path.rstrip('/').endswith('students'):
+                    break
+            await request('GET', '/students/taken/', cookie)
+
+        outcomes = await asyncio.gather(*(take_quiz(session) for session in sessions), return_exceptions=True)
+        result['errors'] = sum(1 for outcome in outcomes if isinstance(outcome, Exception))
+
+
+def get_percentile(latencies, percentile):
+    latencies = sorted(latencies)
+    if not latencies:
+        return 0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+
+def get_request_headers(method, cookie, body):
+    headers = {'host': 'localhost', 'cookie': cookie}
+    if method == 'POST':
+        headers.update({
+            'content-type': 'application/x-www-form-urlencoded',
+            'content-length': str(len(body)),
+            'x-csrftoken': CSRF_TOKEN,
+        })
+    return headers
+
+
+def call_wsgi(handler, method, path, cookie, body):
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+    }
+    for name, value in get_request_headers(method, cookie, body).items():
+        key = name.upper().replace('-', '_')
+        environ[key if key in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + key] = value
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split()[0])
+        response['headers'] = {name.lower(): value for name, value in headers}
+
+    chunks = handler(environ, start_response)
+    try:
+        content = b''.join(chunks)
+    finally:
+        chunks.close()
+    return response['status'], response['headers'], content
+
+
+async def call_asgi(handler, method, path, cookie, body):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(name.encode(), value.encode()) for name, value in get_request_headers(method, cookie, body).items()],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    disconnected = asyncio.Event()
+    response = {'body': []}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Клиент не отключается, пока обработчик не отправит ответ
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.decode().lower(): value.decode() for name, value in message['headers']}
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+
+    try:
+        await handler(scope, receive, send)
+    finally:
+        disconnected.set()
+    return response['status'], response['headers'], b''.join(response['body'])
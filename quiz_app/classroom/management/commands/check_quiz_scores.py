@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+
+from classroom.models import Quiz, QuizAttempt, TakenQuiz, TeamAttempt
+from classroom.progress import derive_answer_counts, derive_team_answer_counts
+
+
+class Command(BaseCommand):
+    help = 'Re-derives running scores from stored answers in bulk and reports any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of quizzes checked per batch.')
+        parser.add_argument('--fix', action='store_true', help='Overwrite drifted attempt counters.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        quiz_ids = list(Quiz.objects.order_by('pk').values_list('pk', flat=True))
+        drifted = 0
+        for start in range(0, len(quiz_ids), batch_size):
+            drifted += self.check_batch(quiz_ids[start:start + batch_size], options['fix'])
+
+        if drifted:
+            self.stdout.write(self.style.WARNING('Найдено расхождений: %s.' % drifted))
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено.'))
+
+    def check_batch(self, quiz_ids, fix):
+        return self.check_student_attempts(quiz_ids, fix) + self.check_team_attempts(quiz_ids, fix)
+
+    def check_student_attempts(self, quiz_ids, fix):
+        counts = derive_answer_counts(quiz_ids=quiz_ids)
+        scores = {(student_id, quiz_id): score for student_id, quiz_id, score in
+                  TakenQuiz.objects
+                  .filter(quiz_id__in=quiz_ids, team_attempt__isnull=True)
+                  .values_list('student_id', 'quiz_id', 'score')}
+
+        drifted = []
+        score_drift = 0
+        for attempt in QuizAttempt.objects.filter(quiz_id__in=quiz_ids):
+            key = (attempt.student_id, attempt.quiz_id)
+            expected = counts.get(key, (0, 0))
+            if (attempt.answered_count, attempt.correct_count) != expected:
+                self.stdout.write('student=%s quiz=%s: answered/correct %s/%s, expected %s/%s' % (
+                    key + (attempt.answered_count, attempt.correct_count) + expected))
+                attempt.answered_count, attempt.correct_count = expected
+                drifted.append(attempt)
+            if key in scores and attempt.total_questions and scores[key] != attempt.get_score():
+                self.stdout.write('student=%s quiz=%s: score %s, expected %s' % (
+                    key + (scores[key], attempt.get_score())))
+                score_drift += 1
+
+        if fix and drifted:
+            QuizAttempt.objects.bulk_update(drifted, ['answered_count', 'correct_count'])
+        return len(drifted) + score_drift
+
+    def check_team_attempts(self, quiz_ids, fix):
+        counts = derive_team_answer_counts(quiz_ids=quiz_ids)
+        scores = {}
+        for team_attempt_id, student_id, score in TakenQuiz.objects \
+                .filter(quiz_id__in=quiz_ids, team_attempt__isnull=False) \
+                .values_list('team_attempt_id', 'student_id', 'score'):
+            scores.setdefault(team_attempt_id, []).append((student_id, score))
+
+        drifted = []
+        score_drift = 0
+        for attempt in TeamAttempt.objects.filter(quiz_id__in=quiz_ids):
+            expected = counts.get(attempt.pk, (0, 0))
+            if (attempt.answered_count, attempt.correct_count) != expected:
+                self.stdout.write('team=%s quiz=%s: answered/correct %s/%s, expected %s/%s' % (
+                    (attempt.team_id, attempt.quiz_id, attempt.answered_count, attempt.correct_count) + expected))
+                attempt.answered_count, attempt.correct_count = expected
+                drifted.append(attempt)
+            # Попытки, собранные миграцией 0026 из прежних результатов, не хранят ответов
+            # и сохраняют среднюю оценку участников
+            if not attempt.is_finished or not expected[0] or not attempt.total_questions:
+                continue
+            if attempt.score != attempt.get_score():
+                self.stdout.write('team=%s quiz=%s: score %s, expected %s' % (
+                    attempt.team_id, attempt.quiz_id, attempt.score, attempt.get_score()))
+                score_drift += 1
+            for student_id, score in scores.get(attempt.pk, []):
+                if score != attempt.get_score():
+                    self.stdout.write('student=%s quiz=%s: team score %s, expected %s' % (
+                        student_id, attempt.quiz_id, score, attempt.get_score()))
+                    score_drift += 1
+
+        if fix and drifted:
+            TeamAttempt.objects.bulk_update(drifted, ['answered_count', 'correct_count'])
+        return len(drifted) + score_drift
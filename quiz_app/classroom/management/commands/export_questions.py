@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from classroom.models import Quiz
+from classroom.quiz_bank import FORMATS, get_format, iter_export_lines
+
+
+class Command(BaseCommand):
+    help = 'Writes the questions of a quiz to a CSV or JSONL question bank file that import_questions reads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_id', type=int)
+        parser.add_argument('--output', help='Output file, standard output by default.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='File format, by default taken from the extension of --output or csv.')
+
+    def handle(self, *args, **options):
+        if not Quiz.objects.filter(pk=options['quiz_id']).exists():
+            raise CommandError('Викторина %s не найдена.' % options['quiz_id'])
+        format = options['format'] or (options['output'] and get_format(options['output'])) or 'csv'
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(iter_export_lines(options['quiz_id'], format))
+        else:
+            for line in iter_export_lines(options['quiz_id'], format):
+                self.stdout.write(line, ending='')
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from classroom.models import Quiz
+from classroom.quiz_bank import FORMATS, QuizImportError, get_format, import_questions
+
+
+class Command(BaseCommand):
+    help = ('Adds the questions of a CSV or JSONL question bank file to a quiz. '
+            'Nothing is imported if the file has an invalid question.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='File format, by default taken from the extension.')
+
+    def handle(self, *args, **options):
+        quiz = Quiz.objects.filter(pk=options['quiz_id']).first()
+        if quiz is None:
+            raise CommandError('Викторина %s не найдена.' % options['quiz_id'])
+        format = options['format'] or get_format(options['path'])
+        if format is None:
+            raise CommandError('Не удалось определить формат файла, укажите --format.')
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as file:
+                imported = import_questions(quiz, file, format)
+        except (QuizImportError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS('Импортировано вопросов: %s за %.2f с.'
+                                             % (imported, time.perf_counter() - started)))
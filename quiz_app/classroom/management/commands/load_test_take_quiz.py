@@ -0,0 +1,124 @@
+import http.client
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from classroom.models import Answer, Question, Quiz, Room, Student, Subject, Team, TeamMembership, User
+from classroom.rosters import MAX_TEAM_SIZE
+
+ANSWER_RE = re.compile(r'name="answer" value="(\d+)"')
+CSRF_TOKEN = 'loadtestloadtestloadtestloadtest'
+PERCENTILES = (50, 90, 99)
+
+
+class Command(BaseCommand):
+    help = ('Reproduces the burst at the start of a quiz: seeds a quiz and students, then all students take '
+            'it at once against a running server. Reports response codes, shed requests and latency. '
+            'Seeds the database the server uses, never run it against a production database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running server.')
+        parser.add_argument('--students', type=int, default=300, help='Number of students taking the quiz.')
+        parser.add_argument('--questions', type=int, default=10, help='Number of questions in the quiz.')
+        parser.add_argument('--retry', action='store_true',
+                            help='Retry shed requests after their Retry-After delay.')
+
+    def handle(self, *args, **options):
+        quiz, users = self.seed(options['students'], options['questions'])
+        sessions = [self.create_session(user) for user in users]
+        self.codes = Counter()
+        self.latencies = []
+        self.lock = threading.Lock()
+        barrier = threading.Barrier(len(sessions))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+            futures = [executor.submit(self.take_quiz, options['url'], quiz.pk, session, barrier, options['retry'])
+                       for session in sessions]
+        elapsed = time.perf_counter() - started
+        errors = sum(1 for future in futures if future.exception() is not None)
+
+        self.stdout.write('Студентов: %s, время: %.2f с' % (len(sessions), elapsed))
+        for code, count in sorted(self.codes.items()):
+            self.stdout.write('  HTTP %s: %s' % (code, count))
+        if errors:
+            self.stdout.write('  Ошибок соединения: %s' % errors)
+        latencies = sorted(self.latencies)
+        for percentile in PERCENTILES:
+            if latencies:
+                index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+                self.stdout.write('  p%s ответа: %.1f ms' % (percentile, latencies[index] * 1000))
+
+    @transaction.atomic
+    def seed(self, student_count, question_count):
+        owner, _ = User.objects.get_or_create(username='load_test_teacher', defaults={'is_teacher': True})
+        subject = Subject.objects.first() or Subject.objects.create(name='Load test')
+        room, _ = Room.objects.get_or_create(slug='load-test', defaults={'name': 'load-test'})
+        quiz = Quiz.objects.create(owner=owner, subject=subject, room=room, name='Load test')
+        for i in range(question_count):
+            question = Question.objects.create(quiz=quiz, text='Question %s' % i)
+            Answer.objects.bulk_create([Answer(question=question, text='right', is_correct=True),
+                                        Answer(question=question, text='wrong')])
+
+        prefix = 'load_test_%s_' % quiz.pk
+        User.objects.bulk_create([User(username=prefix + str(i), is_student=True) for i in range(student_count)])
+        users = list(User.objects.filter(username__startswith=prefix).order_by('pk'))
+        Student.objects.bulk_create([Student(user=user, name=user.username) for user in users])
+        # Студенты проходят викторину командами, участники одной команды отвечают наперегонки
+        memberships = []
+        for start in range(0, len(users), MAX_TEAM_SIZE):
+            team = Team.objects.create(quiz=quiz, name='Load test %s' % (start // MAX_TEAM_SIZE + 1))
+            memberships += [TeamMembership(team=team, student_id=user.pk) for user in users[start:start + MAX_TEAM_SIZE]]
+        TeamMembership.objects.bulk_create(memberships)
+        return quiz, users
+
+    def create_session(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    def take_quiz(self, url, quiz_id, session, barrier, retry):
+        parts = urlsplit(url)
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        path = '/students/quiz/%s/' % quiz_id
+        headers = {
+            'Cookie': '%s=%s; %s=%s' % (settings.SESSION_COOKIE_NAME, session, settings.CSRF_COOKIE_NAME, CSRF_TOKEN),
+        }
+        barrier.wait()
+        while True:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            body = response.read().decode()
+            match = ANSWER_RE.search(body)
+            if response.status != 200 or match is None:
+                return
+
+            started = time.perf_counter()
+            connection.request('POST', path, body='answer=%s' % match.group(1), headers=dict(headers, **{
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'X-CSRFToken': CSRF_TOKEN,
+            }))
+            response = connection.getresponse()
+            response.read()
+            with self.lock:
+                self.codes[response.status] += 1
+                self.latencies.append(time.perf_counter() - started)
+
+            if response.status in (429, 503):
+                if not retry:
+                    return
+                time.sleep(int(response.getheader('Retry-After', '1')))
+            elif response.status != 302 or response.getheader('Location', '').rstrip('/').endswith('students'):
+                return
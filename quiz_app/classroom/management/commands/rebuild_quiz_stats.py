@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from classroom.models import Quiz
+from classroom.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized quiz statistics from taken quizzes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of quizzes rebuilt per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        quiz_ids = list(Quiz.objects.order_by('pk').values_list('pk', flat=True))
+        rebuilt = 0
+        for start in range(0, len(quiz_ids), batch_size):
+            rebuilt += rebuild_stats(quiz_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS('Статистика пересчитана для викторин: %s.' % rebuilt))
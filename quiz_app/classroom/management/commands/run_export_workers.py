@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from classroom.export_jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = 'Starts local worker processes that render queued Excel exports to disk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Number of worker processes.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Запуск обработчиков выгрузок: %s.' % options['processes'])
+        run_workers(options['processes'], options['poll_interval'])
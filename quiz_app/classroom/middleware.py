@@ -0,0 +1,40 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .routers import tracking_writes
+
+REPLICA_PIN_COOKIE = 'replica_pin'
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+class ReplicaPinMiddleware:
+    '''
+    After a request writes to the database, sets a short-lived cookie that
+    keeps the reads of the user on the default database while the replica
+    catches up.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with tracking_writes(REPLICA_PIN_COOKIE in request.COOKIES) as state:
+            response = self.get_response(request)
+        return self.pin_replica(state, response)
+
+    async def __acall__(self, request):
+        with tracking_writes(REPLICA_PIN_COOKIE in request.COOKIES) as state:
+            response = await self.get_response(request)
+        return self.pin_replica(state, response)
+
+    def pin_replica(self, state, response):
+        if state['written']:
+            response.set_cookie(REPLICA_PIN_COOKIE, '1', max_age=REPLICA_PIN_SECONDS, httponly=True,
+                                secure=settings.SESSION_COOKIE_SECURE, samesite='Lax')
+        return response
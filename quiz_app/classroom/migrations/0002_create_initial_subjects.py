@@ -5,11 +5,12 @@ from django.db import migrations
 
 def create_subjects(apps, schema_editor):
     Subject = apps.get_model('classroom', 'Subject')
-    Subject.objects.create(name='Arts', color='#343a40')
-    Subject.objects.create(name='Computing', color='#007bff')
-    Subject.objects.create(name='Math', color='#28a745')
-    Subject.objects.create(name='Biology', color='#17a2b8')
-    Subject.objects.create(name='History', color='#ffc107')
+    db_alias = schema_editor.connection.alias
+    Subject.objects.using(db_alias).create(name='Arts', color='#343a40')
+    Subject.objects.using(db_alias).create(name='Computing', color='#007bff')
+    Subject.objects.using(db_alias).create(name='Math', color='#28a745')
+    Subject.objects.using(db_alias).create(name='Biology', color='#17a2b8')
+    Subject.objects.using(db_alias).create(name='History', color='#ffc107')
 
 
 class Migration(migrations.Migration):
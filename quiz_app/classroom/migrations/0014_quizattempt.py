@@ -0,0 +1,30 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0013_auto_20230515_1856'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizAttempt',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_questions', models.PositiveIntegerField(default=0)),
+                ('answered_count', models.PositiveIntegerField(default=0)),
+                ('is_finished', models.BooleanField(default=False)),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('next_question', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='classroom.Question')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to='classroom.Quiz')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_attempts', to='classroom.Student')),
+            ],
+            options={
+                'unique_together': {('student', 'quiz')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0015_quiz_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='correct_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
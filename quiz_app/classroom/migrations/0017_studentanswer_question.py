@@ -0,0 +1,39 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:20
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_question(apps, schema_editor):
+    Answer = apps.get_model('classroom', 'Answer')
+    StudentAnswer = apps.get_model('classroom', 'StudentAnswer')
+    db_alias = schema_editor.connection.alias
+    StudentAnswer.objects.using(db_alias).update(
+        question=Subquery(Answer.objects.using(db_alias).filter(pk=OuterRef('answer_id')).values('question_id')[:1])
+    )
+
+    # Следующая миграция делает пару (student, question) уникальной, поэтому
+    # повторные ответы на один и тот же вопрос удаляются безвозвратно: остается
+    # только первый ответ студента, обратная миграция удаленные не возвращает
+    first_answers = StudentAnswer.objects.using(db_alias) \
+        .values('student_id', 'question_id') \
+        .annotate(first_pk=Min('pk')) \
+        .values_list('first_pk', flat=True)
+    StudentAnswer.objects.using(db_alias).exclude(pk__in=list(first_answers)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0016_quizattempt_correct_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentanswer',
+            name='question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='classroom.Question'),
+        ),
+        migrations.RunPython(fill_question, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0017_studentanswer_question'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studentanswer',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='classroom.Question'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'date_added'], name='message_room_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['subject', 'name'], name='quiz_subject_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='takenquiz',
+            index=models.Index(fields=['quiz', 'team', 'score'], name='takenquiz_quiz_team_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='takenquiz',
+            index=models.Index(fields=['student', 'quiz'], name='takenquiz_student_quiz_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='takenquiz',
+            index=models.Index(fields=['quiz', '-date'], name='takenquiz_quiz_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='studentanswer',
+            constraint=models.UniqueConstraint(fields=('student', 'question'), name='unique_student_question_answer'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:25
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_quiz_and_is_correct(apps, schema_editor):
+    Answer = apps.get_model('classroom', 'Answer')
+    StudentAnswer = apps.get_model('classroom', 'StudentAnswer')
+    db_alias = schema_editor.connection.alias
+    answers = Answer.objects.using(db_alias).filter(pk=OuterRef('answer_id'))
+    StudentAnswer.objects.using(db_alias).update(
+        quiz=Subquery(answers.values('question__quiz_id')[:1]),
+        is_correct=Subquery(answers.values('is_correct')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0018_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentanswer',
+            name='is_correct',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='studentanswer',
+            name='quiz',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='classroom.Quiz'),
+        ),
+        migrations.RunPython(fill_quiz_and_is_correct, migrations.RunPython.noop),
+    ]
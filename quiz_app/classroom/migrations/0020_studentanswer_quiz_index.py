@@ -0,0 +1,23 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0019_studentanswer_quiz_is_correct'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studentanswer',
+            name='quiz',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='classroom.Quiz'),
+        ),
+        migrations.AddIndex(
+            model_name='studentanswer',
+            index=models.Index(fields=['student', 'quiz', 'is_correct'], name='studentanswer_student_quiz_idx'),
+        ),
+    ]
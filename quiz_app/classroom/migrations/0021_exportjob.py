@@ -0,0 +1,37 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0020_studentanswer_quiz_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='results_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('quiz', 'Результаты викторины'), ('student', 'Результат учащегося')], max_length=10)),
+                ('results_version', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Формируется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10)),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(null=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='classroom.Quiz')),
+                ('student', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='classroom.Student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'quiz', 'student', 'results_version'], name='exportjob_lookup_idx'), models.Index(fields=['status', 'created'], name='exportjob_status_idx')],
+            },
+        ),
+    ]
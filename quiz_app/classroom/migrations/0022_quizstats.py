@@ -0,0 +1,48 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:24
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+import django.db.models.deletion
+
+
+def build_stats(apps, schema_editor):
+    QuizStats = apps.get_model('classroom', 'QuizStats')
+    TakenQuiz = apps.get_model('classroom', 'TakenQuiz')
+    db_alias = schema_editor.connection.alias
+    rows = TakenQuiz.objects.using(db_alias) \
+        .values('quiz_id') \
+        .annotate(attempts=Count('pk'),
+                  score_sum=Sum('score'),
+                  score_min=Min('score'),
+                  score_max=Max('score'),
+                  excellent_count=Count('pk', filter=Q(score__gte=8)),
+                  good_count=Count('pk', filter=Q(score__gte=6, score__lt=8)),
+                  satisfactory_count=Count('pk', filter=Q(score__gte=4, score__lt=6)),
+                  unsatisfactory_count=Count('pk', filter=Q(score__lt=4))) \
+        .order_by()
+    QuizStats.objects.using(db_alias).bulk_create([QuizStats(**row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0021_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizStats',
+            fields=[
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='classroom.Quiz')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_min', models.FloatField(null=True)),
+                ('score_max', models.FloatField(null=True)),
+                ('excellent_count', models.PositiveIntegerField(default=0)),
+                ('good_count', models.PositiveIntegerField(default=0)),
+                ('satisfactory_count', models.PositiveIntegerField(default=0)),
+                ('unsatisfactory_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
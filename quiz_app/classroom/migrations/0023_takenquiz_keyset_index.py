@@ -0,0 +1,21 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0022_quizstats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='takenquiz',
+            name='takenquiz_quiz_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='takenquiz',
+            index=models.Index(fields=['quiz', '-date', '-id'], name='takenquiz_quiz_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0023_takenquiz_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='classroom.Team'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['team', 'date_added'], name='message_team_date_idx'),
+        ),
+    ]
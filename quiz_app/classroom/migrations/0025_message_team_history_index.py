@@ -0,0 +1,21 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0024_message_team'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_team_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['team', '-date_added', '-id'], name='message_team_history_idx'),
+        ),
+    ]
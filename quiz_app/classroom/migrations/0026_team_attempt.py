@@ -0,0 +1,95 @@
+# Generated by Django 2.2.7 on 2026-10-18 03:48
+
+from itertools import groupby
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, F, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def create_team_attempts(apps, schema_editor):
+    # Прежние результаты команды сворачиваются в одну завершенную попытку со средней оценкой участников
+    Quiz = apps.get_model('classroom', 'Quiz')
+    TakenQuiz = apps.get_model('classroom', 'TakenQuiz')
+    TeamAttempt = apps.get_model('classroom', 'TeamAttempt')
+    db_alias = schema_editor.connection.alias
+    total_questions = dict(Quiz.objects.using(db_alias).annotate(total=Count('questions')).values_list('pk', 'total'))
+    TeamMembership = apps.get_model('classroom', 'TeamMembership')
+    # Команда по умолчанию (team=3) проставлялась и результатам чужих викторин и студентам
+    # не из команды: такие строки остаются индивидуальными результатами
+    memberships = TeamMembership.objects.using(db_alias).filter(team_id=OuterRef('team_id'),
+                                                                student_id=OuterRef('student_id'))
+    team_rows = TakenQuiz.objects.using(db_alias) \
+        .filter(team__isnull=False, quiz_id=F('team__quiz_id')) \
+        .filter(Exists(memberships))
+    TakenQuiz.objects.using(db_alias) \
+        .filter(team__isnull=False) \
+        .exclude(pk__in=team_rows.values('pk')) \
+        .update(team=None)
+
+    rows = team_rows \
+        .order_by('team_id', 'date', 'pk') \
+        .values_list('team_id', 'quiz_id', 'student__name', 'student__user__username', 'score', 'date')
+    attempts = []
+    for (team_id, quiz_id), members in groupby(rows, key=lambda row: row[:2]):
+        members = list(members)
+        attempts.append(TeamAttempt(
+            team_id=team_id,
+            quiz_id=quiz_id,
+            total_questions=total_questions[quiz_id],
+            is_finished=True,
+            score=round(sum(row[4] for row in members) / len(members), 2),
+            member_names=', '.join(row[2] or row[3] for row in members),
+            finished=max(row[5] for row in members),
+        ))
+    TeamAttempt.objects.using(db_alias).bulk_create(attempts, batch_size=500)
+    team_rows.update(team_attempt_id=Subquery(
+        TeamAttempt.objects.using(db_alias).filter(team_id=OuterRef('team_id')).values('pk')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0025_message_team_history_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='takenquiz',
+            name='team',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='taken_quizzes', to='classroom.Team'),
+        ),
+        migrations.CreateModel(
+            name='TeamAttempt',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_questions', models.PositiveIntegerField(default=0)),
+                ('answered_count', models.PositiveIntegerField(default=0)),
+                ('correct_count', models.PositiveIntegerField(default=0)),
+                ('is_finished', models.BooleanField(default=False)),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('score', models.FloatField(null=True)),
+                ('member_names', models.TextField(blank=True)),
+                ('finished', models.DateTimeField(null=True)),
+                ('next_question', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='classroom.Question')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='team_attempts', to='classroom.Quiz')),
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='attempt', to='classroom.Team')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='studentanswer',
+            name='team_attempt',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='classroom.TeamAttempt'),
+        ),
+        migrations.AddField(
+            model_name='takenquiz',
+            name='team_attempt',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='taken_quizzes', to='classroom.TeamAttempt'),
+        ),
+        migrations.AddIndex(
+            model_name='teamattempt',
+            index=models.Index(fields=['quiz', 'is_finished'], name='teamattempt_quiz_finished_idx'),
+        ),
+        migrations.RunPython(create_team_attempts, migrations.RunPython.noop),
+    ]
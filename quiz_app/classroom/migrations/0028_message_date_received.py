@@ -0,0 +1,19 @@
+# Generated by Django 2.2.7 on 2026-10-18 04:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0027_alter_user_first_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='date_added',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.7 on 2026-10-18 04:35
+
+from django.db import migrations, models
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    ExportJob = apps.get_model('classroom', 'ExportJob')
+    db_alias = schema_editor.connection.alias
+    seen = set()
+    duplicates = []
+    jobs = ExportJob.objects.using(db_alias) \
+        .filter(status__in=('pending', 'running')) \
+        .order_by('-pk') \
+        .values_list('pk', 'kind', 'quiz_id', 'student_id', 'results_version')
+    for pk, *key in jobs:
+        if tuple(key) in seen:
+            duplicates.append(pk)
+        seen.add(tuple(key))
+    ExportJob.objects.using(db_alias).filter(pk__in=duplicates).update(status='failed', error='Duplicate job')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0028_message_date_received'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='started',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='exportjob',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=['pending', 'running'], student__isnull=True), fields=('kind', 'quiz', 'results_version'), name='unique_active_quiz_export'),
+        ),
+        migrations.AddConstraint(
+            model_name='exportjob',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=['pending', 'running'], student__isnull=False), fields=('kind', 'quiz', 'student', 'results_version'), name='unique_active_student_export'),
+        ),
+    ]
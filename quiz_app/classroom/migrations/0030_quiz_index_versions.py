@@ -0,0 +1,23 @@
+# Generated by Django 2.2.7 on 2026-10-18 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0029_export_job_started'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='quizzes_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='quiz_index_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
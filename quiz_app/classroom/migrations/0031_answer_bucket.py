@@ -0,0 +1,22 @@
+# Generated by Django 2.2.7 on 2026-10-18 05:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0030_quiz_index_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerBucket',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='classroom.Student')),
+                ('tokens', models.FloatField()),
+                ('updated', models.FloatField()),
+            ],
+        ),
+    ]
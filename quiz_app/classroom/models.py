@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django.utils.html import escape, mark_safe
 
 
@@ -11,6 +12,8 @@ class User(AbstractUser):
 class Subject(models.Model):
     name = models.CharField(max_length=30)
     color = models.CharField(max_length=7, default='#007bff')
+    # Растет при каждом изменении викторин предмета, см. classroom.quiz_index
+    quiz_index_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -37,11 +40,17 @@ class Room(models.Model):
 class Message(models.Model):
     room = models.ForeignKey(Room, related_name='messages', on_delete=models.CASCADE)
     user = models.ForeignKey(User, related_name='messages', on_delete=models.CASCADE)
+    team = models.ForeignKey('Team', related_name='messages', on_delete=models.CASCADE, null=True, blank=True)
     content = models.TextField()
-    date_added = models.DateTimeField(auto_now_add=True)
+    # Время получения сообщения, буфер чата сохраняет его позже
+    date_added = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ('date_added',)
+        indexes = [
+            models.Index(fields=['room', 'date_added'], name='message_room_date_idx'),
+            models.Index(fields=['team', '-date_added', '-id'], name='message_team_history_idx'),
+        ]
 
 
 class Quiz(models.Model):
@@ -49,6 +58,13 @@ class Quiz(models.Model):
     name = models.CharField(max_length=255)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='quizzes')
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='taken_quizzes', default=1)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    results_version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subject', 'name'], name='quiz_subject_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -76,11 +92,13 @@ class Student(models.Model):
     name = models.CharField('Name', max_length=255, null=True, blank=True)
     quizzes = models.ManyToManyField(Quiz, through='TakenQuiz')
     interests = models.ManyToManyField(Subject, related_name='interested_students')
+    # Растет, когда студент проходит викторину, см. classroom.quiz_index
+    quizzes_version = models.PositiveIntegerField(default=0)
 
     def get_unanswered_questions(self, quiz):
         answered_questions = self.quiz_answers \
-            .filter(answer__question__quiz=quiz) \
-            .values_list('answer__question__pk', flat=True)
+            .filter(quiz=quiz) \
+            .values_list('question_id', flat=True)
         questions = quiz.questions.exclude(pk__in=answered_questions).order_by('text')
         return questions
 
@@ -107,11 +125,21 @@ class TeamMembership(models.Model):
 
 class TakenQuiz(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='taken_quizzes')
-    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='taken_quizzes', default=3)
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='taken_quizzes', null=True)
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='taken_quizzes')
+    # Участник командной попытки: результат команды, записанный для каждого студента
+    team_attempt = models.ForeignKey('TeamAttempt', on_delete=models.CASCADE, related_name='taken_quizzes',
+                                     null=True)
     score = models.FloatField()
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['quiz', 'team', 'score'], name='takenquiz_quiz_team_idx'),
+            models.Index(fields=['student', 'quiz'], name='takenquiz_student_quiz_idx'),
+            models.Index(fields=['quiz', '-date', '-id'], name='takenquiz_quiz_date_id_idx'),
+        ]
+
     def get_date(self):
         return mark_safe(self.date.strftime('%d.%m.%Y %H:%M'))
 
@@ -119,3 +147,165 @@ class TakenQuiz(models.Model):
 class StudentAnswer(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='quiz_answers')
     answer = models.ForeignKey(Answer, on_delete=models.CASCADE, related_name='+')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='+')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='+')
+    team_attempt = models.ForeignKey('TeamAttempt', on_delete=models.CASCADE, related_name='answers', null=True)
+    is_correct = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'question'], name='unique_student_question_answer'),
+        ]
+        indexes = [
+            models.Index(fields=['student', 'quiz', 'is_correct'], name='studentanswer_student_quiz_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.question_id is None or self.quiz_id is None:
+            answer = Answer.objects.select_related('question').get(pk=self.answer_id)
+            self.question_id = answer.question_id
+            self.quiz_id = answer.question.quiz_id
+            self.is_correct = answer.is_correct
+        super().save(*args, **kwargs)
+
+
+class Attempt(models.Model):
+    next_question = models.ForeignKey(Question, on_delete=models.SET_NULL, related_name='+', null=True)
+    total_questions = models.PositiveIntegerField(default=0)
+    answered_count = models.PositiveIntegerField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+    is_finished = models.BooleanField(default=False)
+    started = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+    def get_progress(self):
+        unanswered = self.total_questions - self.answered_count
+        return 100 - round(((unanswered - 1) / self.total_questions) * 100)
+
+    def get_score(self):
+        if not self.total_questions:
+            # Преподаватель удалил все вопросы во время попытки
+            return 0
+        return round((self.correct_count / self.total_questions) * 10, 2)
+
+
+class QuizAttempt(Attempt):
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='quiz_attempts')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='attempts')
+
+    class Meta:
+        unique_together = ('student', 'quiz')
+
+
+class TeamAttempt(Attempt):
+    '''
+    One attempt of a team: any member answers the current question for the
+    whole team, and the attempt is scored once. Finished attempts keep the
+    member names, so team reports read a single row per team.
+    '''
+    team = models.OneToOneField(Team, on_delete=models.CASCADE, related_name='attempt')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='team_attempts')
+    score = models.FloatField(null=True)
+    member_names = models.TextField(blank=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['quiz', 'is_finished'], name='teamattempt_quiz_finished_idx'),
+        ]
+
+
+class QuizStats(models.Model):
+    GRADE_FIELDS = ('excellent_count', 'good_count', 'satisfactory_count', 'unsatisfactory_count')
+
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    attempts = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_min = models.FloatField(null=True)
+    score_max = models.FloatField(null=True)
+    excellent_count = models.PositiveIntegerField(default=0)
+    good_count = models.PositiveIntegerField(default=0)
+    satisfactory_count = models.PositiveIntegerField(default=0)
+    unsatisfactory_count = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def get_grade_field(score):
+        if score >= 8:
+            return 'excellent_count'
+        elif score >= 6:
+            return 'good_count'
+        elif score >= 4:
+            return 'satisfactory_count'
+        return 'unsatisfactory_count'
+
+    def get_mean(self):
+        if not self.attempts:
+            return None
+        return self.score_sum / self.attempts
+
+    def get_grade_counts(self):
+        return [getattr(self, field) for field in self.GRADE_FIELDS]
+
+
+class AnswerBucket(models.Model):
+    '''
+    Token bucket of a student, shared by all worker processes: tokens left
+    and the time.time() they were counted at. See classroom.admission.
+    '''
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    tokens = models.FloatField()
+    updated = models.FloatField()
+
+
+class ExportJob(models.Model):
+    QUIZ_RESULTS = 'quiz'
+    STUDENT_RESULT = 'student'
+    KIND_CHOICES = (
+        (QUIZ_RESULTS, 'Результаты викторины'),
+        (STUDENT_RESULT, 'Результат учащегося'),
+    )
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Формируется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='export_jobs')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='export_jobs', null=True)
+    results_version = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    file_name = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'quiz', 'student', 'results_version'], name='exportjob_lookup_idx'),
+            models.Index(fields=['status', 'created'], name='exportjob_status_idx'),
+        ]
+        # Одна задача в очереди на выгрузку; student NULL у выгрузок викторины,
+        # а NULL не совпадают в уникальных индексах, поэтому условия два
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'quiz', 'results_version'],
+                                    condition=models.Q(status__in=['pending', 'running'], student__isnull=True),
+                                    name='unique_active_quiz_export'),
+            models.UniqueConstraint(fields=['kind', 'quiz', 'student', 'results_version'],
+                                    condition=models.Q(status__in=['pending', 'running'], student__isnull=False),
+                                    name='unique_active_student_export'),
+        ]
+
+    def is_available_to(self, user):
+        if self.kind == self.QUIZ_RESULTS:
+            return self.quiz.owner_id == user.pk
+        return self.student_id == user.pk
@@ -0,0 +1,87 @@
+import base64
+import datetime
+import json
+from operator import attrgetter
+
+from django.core.exceptions import SuspiciousOperation, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(SuspiciousOperation):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class CursorEncoder(json.JSONEncoder):
+    # В отличие от DjangoJSONEncoder сохраняет микросекунды, иначе сравнение дат в курсоре неточно
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    # Курсор приходит от клиента, в том числе из JSON по веб-сокету
+    if not isinstance(cursor, str):
+        raise InvalidCursor('Invalid cursor.')
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeError):
+        raise InvalidCursor('Invalid cursor.')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor.')
+    return values
+
+
+def get_keyset_filter(ordering, values):
+    '''
+    Builds the "after this row" condition for the ordering, e.g. for
+    ('-date', '-id'): date < d OR (date = d AND id < i).
+    '''
+    condition = Q()
+    for index in reversed(range(len(ordering))):
+        field = ordering[index].lstrip('-')
+        lookup = '__lt' if ordering[index].startswith('-') else '__gt'
+        step = Q(**{field + lookup: values[index]})
+        if index < len(ordering) - 1:
+            step |= Q(**{field: values[index]}) & condition
+        condition = step
+    return condition
+
+
+def get_cursor(item, ordering):
+    return encode_cursor([attrgetter(field.lstrip('-').replace('__', '.'))(item) for field in ordering])
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=50):
+    '''
+    Returns the page of queryset that follows the cursor. The last field of
+    the ordering must be unique, so the cost of a page does not depend on
+    how deep it is.
+    '''
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        try:
+            queryset = queryset.filter(get_keyset_filter(ordering, decode_cursor(cursor, len(ordering))))
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor.')
+    items = list(queryset[:page_size + 1])
+
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = get_cursor(items[-1], ordering)
+    return KeysetPage(items, next_cursor)
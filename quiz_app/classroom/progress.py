@@ -0,0 +1,340 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .export_jobs import invalidate_exports
+from .live import progress_publisher
+from .models import Question, Quiz, QuizAttempt, Student, StudentAnswer, TakenQuiz, TeamAttempt
+from .quiz_index import invalidate_student_quizzes
+from .snapshots import get_snapshot
+from .stats import rebuild_stats, record_result
+
+
+def get_attempt(student_id, quiz_pk):
+    '''
+    Returns the student's attempt for the quiz together with the quiz in a
+    single query, or None until the student opens the quiz and
+    start_attempt() creates it.
+    '''
+    return QuizAttempt.objects \
+        .select_related('quiz') \
+        .filter(student_id=student_id, quiz_id=quiz_pk) \
+        .first()
+
+
+def start_attempt(student_id, quiz_pk):
+    quiz = Quiz.objects.get(pk=quiz_pk)
+    attempt = QuizAttempt(student_id=student_id, quiz=quiz)
+    resync_attempt(attempt, commit=False)
+    attempt.is_finished = TakenQuiz.objects.filter(student_id=student_id, quiz=quiz).exists()
+    try:
+        with transaction.atomic():
+            attempt.save()
+    except IntegrityError:
+        # Попытку создал параллельный запрос того же студента
+        attempt = get_attempt(student_id, quiz_pk)
+    return attempt
+
+
+def get_team_attempt(team):
+    '''
+    Returns the attempt of the team together with the quiz, or None until the
+    first member opens the quiz and start_team_attempt() creates it.
+    '''
+    return TeamAttempt.objects.select_related('quiz').filter(team=team).first()
+
+
+def start_team_attempt(team):
+    questions = team.quiz.questions.order_by('text', 'pk')
+    attempt = TeamAttempt(team=team, quiz=team.quiz, total_questions=questions.count(),
+                          next_question=questions.first())
+    try:
+        with transaction.atomic():
+            attempt.save()
+    except IntegrityError:
+        # Другой участник команды создал попытку одновременно с нами
+        attempt = TeamAttempt.objects.select_related('quiz').get(team=team)
+    return attempt
+
+
+def get_attempt_answers(attempt):
+    if isinstance(attempt, TeamAttempt):
+        return StudentAnswer.objects.filter(team_attempt_id=attempt.pk)
+    return StudentAnswer.objects.filter(student_id=attempt.student_id, quiz_id=attempt.quiz_id,
+                                        team_attempt__isnull=True)
+
+
+def count_attempt_answers(attempt):
+    '''
+    Sets the attempt counters from the stored answers and the current
+    questions of the quiz. Returns the answers of the attempt.
+    '''
+    answers = get_attempt_answers(attempt)
+    counts = answers.aggregate(answered=Count('pk'), correct=Count('pk', filter=Q(is_correct=True)))
+    attempt.total_questions = Question.objects.filter(quiz_id=attempt.quiz_id).count()
+    attempt.answered_count, attempt.correct_count = counts['answered'], counts['correct']
+    return answers
+
+
+def resync_attempt(attempt, commit=True):
+    '''
+    Recomputes the attempt counters from the stored answers. Only used when the
+    attempt is created or its current question disappears from the quiz.
+    '''
+    answers = count_attempt_answers(attempt)
+    attempt.next_question = attempt.quiz.questions \
+        .exclude(pk__in=answers.values('question_id')) \
+        .order_by('text', 'pk') \
+        .first()
+    if commit:
+        attempt.save(update_fields=['total_questions', 'answered_count', 'correct_count', 'next_question'])
+
+
+def resync_open_attempts(quiz_id):
+    '''
+    Recomputes the counters and the current question of every unfinished
+    attempt of the quiz after the teacher adds, imports, renames or deletes
+    questions. Call it in the transaction that changes the questions.
+    '''
+    question_ids = list(Question.objects
+                        .filter(quiz_id=quiz_id)
+                        .order_by('text', 'pk')
+                        .values_list('pk', flat=True))
+    attempts = list(QuizAttempt.objects.filter(quiz_id=quiz_id, is_finished=False))
+    team_attempts = list(TeamAttempt.objects.filter(quiz_id=quiz_id, is_finished=False))
+    if not attempts and not team_attempts:
+        return
+
+    answered = {}
+    rows = StudentAnswer.objects \
+        .filter(quiz_id=quiz_id) \
+        .filter(Q(team_attempt__isnull=True,
+                  student_id__in=QuizAttempt.objects
+                  .filter(quiz_id=quiz_id, is_finished=False)
+                  .values('student_id')) |
+                Q(team_attempt__quiz_id=quiz_id, team_attempt__is_finished=False)) \
+        .values_list('student_id', 'team_attempt_id', 'question_id', 'is_correct')
+    for student_id, team_attempt_id, question_id, is_correct in rows:
+        key = ('team', team_attempt_id) if team_attempt_id else ('student', student_id)
+        answered.setdefault(key, {})[question_id] = is_correct
+
+    def resync(attempt, key):
+        answers = answered.get(key, {})
+        attempt.total_questions = len(question_ids)
+        attempt.answered_count = len(answers)
+        attempt.correct_count = sum(answers.values())
+        attempt.next_question_id = next((pk for pk in question_ids if pk not in answers), None)
+
+    for attempt in attempts:
+        resync(attempt, ('student', attempt.student_id))
+    for attempt in team_attempts:
+        resync(attempt, ('team', attempt.pk))
+    fields = ['total_questions', 'answered_count', 'correct_count', 'next_question']
+    QuizAttempt.objects.bulk_update(attempts, fields, batch_size=500)
+    TeamAttempt.objects.bulk_update(team_attempts, fields, batch_size=500)
+
+
+def derive_answer_counts(quiz_ids=None, student_id=None):
+    '''
+    Re-derives answered and correct answer counts from StudentAnswer rows in a
+    single grouped query. Returns {(student_id, quiz_id): (answered, correct)}.
+    Answers given for a team attempt are counted by derive_team_answer_counts.
+    '''
+    rows = StudentAnswer.objects.filter(team_attempt__isnull=True)
+    if quiz_ids is not None:
+        rows = rows.filter(quiz_id__in=quiz_ids)
+    if student_id is not None:
+        rows = rows.filter(student_id=student_id)
+    rows = rows \
+        .values('student_id', 'quiz_id') \
+        .annotate(answered=Count('pk'), correct=Count('pk', filter=Q(is_correct=True))) \
+        .order_by()
+    return {(row['student_id'], row['quiz_id']): (row['answered'], row['correct']) for row in rows}
+
+
+def derive_team_answer_counts(quiz_ids=None):
+    '''
+    derive_answer_counts for team attempts: the answers stored for each team
+    attempt, whoever of the members gave them. Returns
+    {team_attempt_id: (answered, correct)}.
+    '''
+    rows = StudentAnswer.objects.filter(team_attempt__isnull=False)
+    if quiz_ids is not None:
+        rows = rows.filter(quiz_id__in=quiz_ids)
+    rows = rows \
+        .values('team_attempt_id') \
+        .annotate(answered=Count('pk'), correct=Count('pk', filter=Q(is_correct=True))) \
+        .order_by()
+    return {row['team_attempt_id']: (row['answered'], row['correct']) for row in rows}
+
+
+def get_current_question(attempt):
+    '''
+    Returns the snapshot question the student has to answer next, or None when
+    every question is answered.
+    '''
+    if attempt.next_question_id is None and not attempt.is_finished:
+        # Текущий вопрос был удален преподавателем, ищем следующий заново
+        resync_attempt(attempt)
+    if attempt.next_question_id is None:
+        return None
+    snapshot = get_snapshot(attempt.quiz)
+    question = snapshot.get_question(attempt.next_question_id)
+    if question is None:
+        # Снимок устарел относительно попытки, перечитываем версию викторины
+        attempt.quiz.refresh_from_db(fields=['version'])
+        question = get_snapshot(attempt.quiz).get_question(attempt.next_question_id)
+    return question
+
+
+def get_following_question(attempt, question):
+    '''
+    Returns the snapshot question that comes after the answered one. The
+    current question is always the first unanswered one, so while the
+    answered questions are exactly the ones before it, this is the next
+    question of the snapshot.
+    '''
+    snapshot = get_snapshot(attempt.quiz)
+    if snapshot.get_position(question.pk) == attempt.answered_count:
+        return snapshot.get_following_question(question.pk)
+    # Преподаватель менял вопросы во время попытки: после текущего вопроса
+    # есть отвеченные, ищем первый неотвеченный
+    answered = set(get_attempt_answers(attempt).values_list('question_id', flat=True))
+    answered.add(question.pk)
+    return next((following for following in snapshot.questions if following.pk not in answered), None)
+
+
+def record_answer(attempt, question, answer, student_id):
+    '''
+    Saves the student's answer and moves the attempt to the next question. The
+    answer to a team attempt counts for the whole team. Returns False when the
+    question was already answered (e.g. a double submit or another member of
+    the team answering first).
+    '''
+    following_question = get_following_question(attempt, question)
+    following_question_id = following_question.pk if following_question else None
+    team_attempt_id = attempt.pk if isinstance(attempt, TeamAttempt) else None
+    try:
+        with transaction.atomic():
+            updated = type(attempt).objects \
+                .filter(pk=attempt.pk, next_question_id=question.pk) \
+                .update(next_question_id=following_question_id,
+                        answered_count=F('answered_count') + 1,
+                        correct_count=F('correct_count') + int(answer.is_correct))
+            if not updated:
+                return False
+            StudentAnswer.objects.create(student_id=student_id, answer_id=answer.pk,
+                                         question_id=question.pk, quiz_id=attempt.quiz_id,
+                                         team_attempt_id=team_attempt_id, is_correct=answer.is_correct)
+            transaction.on_commit(lambda: progress_publisher.add_answer(attempt.quiz_id, question.pk,
+                                                                        answer.is_correct))
+    except IntegrityError:
+        return False
+    attempt.next_question_id = following_question_id
+    attempt.answered_count += 1
+    attempt.correct_count += int(answer.is_correct)
+    return True
+
+
+def finish_attempt(attempt):
+    if isinstance(attempt, TeamAttempt):
+        return finish_team_attempt(attempt)
+    # Счетчики расходятся с ответами, если вопросы удаляли во время попытки
+    count_attempt_answers(attempt)
+    score = attempt.get_score()
+    with transaction.atomic():
+        TakenQuiz.objects.create(student_id=attempt.student_id, quiz_id=attempt.quiz_id, score=score)
+        record_result(attempt.quiz_id, score)
+        QuizAttempt.objects \
+            .filter(pk=attempt.pk) \
+            .update(is_finished=True, total_questions=attempt.total_questions,
+                    answered_count=attempt.answered_count, correct_count=attempt.correct_count)
+        invalidate_exports(attempt.quiz_id)
+        transaction.on_commit(lambda: invalidate_student_quizzes(attempt.student_id))
+    attempt.is_finished = True
+    return score
+
+
+def finish_team_attempt(attempt):
+    '''
+    Scores the team attempt once and records the result for every member of
+    the team. A member finishing an attempt another member has already
+    finished gets the stored score.
+    '''
+    count_attempt_answers(attempt)
+    score = attempt.get_score()
+    members = list(Student.objects
+                   .filter(teammembership__team_id=attempt.team_id)
+                   .select_related('user')
+                   .order_by('user__username'))
+    with transaction.atomic():
+        finished = TeamAttempt.objects \
+            .filter(pk=attempt.pk, is_finished=False) \
+            .update(is_finished=True, score=score, finished=timezone.now(), total_questions=attempt.total_questions,
+                    answered_count=attempt.answered_count, correct_count=attempt.correct_count,
+                    member_names=', '.join(member.name or member.user.username for member in members))
+        if not finished:
+            return TeamAttempt.objects.values_list('score', flat=True).get(pk=attempt.pk)
+        taken = set(TakenQuiz.objects
+                    .filter(quiz_id=attempt.quiz_id, student__in=members)
+                    .values_list('student_id', flat=True))
+        taken_quizzes = TakenQuiz.objects.bulk_create([
+            TakenQuiz(student=member, quiz_id=attempt.quiz_id, team_id=attempt.team_id, team_attempt=attempt,
+                      score=score)
+            for member in members if member.pk not in taken
+        ])
+        if taken_quizzes:
+            record_result(attempt.quiz_id, score, count=len(taken_quizzes))
+        invalidate_exports(attempt.quiz_id)
+        transaction.on_commit(lambda: progress_publisher.add_completion(attempt.quiz_id, attempt.team_id,
+                                                                        len(taken_quizzes)))
+        if taken_quizzes:
+            transaction.on_commit(lambda: invalidate_student_quizzes(*(taken_quiz.student_id
+                                                                       for taken_quiz in taken_quizzes)))
+    attempt.is_finished = True
+    attempt.score = score
+    return score
+
+
+def regrade_answers(quiz_id, answers):
+    '''
+    Applies a change of Answer.is_correct to the stored answers and to
+    everything derived from them: attempt counters, scores of finished
+    attempts and the quiz statistics. Call it in the transaction that saves
+    the answers.
+    '''
+    stored = StudentAnswer.objects.filter(answer__in=answers)
+    student_ids = set(stored.filter(team_attempt__isnull=True).values_list('student_id', flat=True))
+    team_attempt_ids = set(stored.filter(team_attempt__isnull=False).values_list('team_attempt_id', flat=True))
+    for answer in answers:
+        StudentAnswer.objects.filter(answer=answer).update(is_correct=answer.is_correct)
+
+    counts = derive_answer_counts(quiz_ids=[quiz_id])
+    attempts = list(QuizAttempt.objects.filter(quiz_id=quiz_id, student_id__in=student_ids))
+    scores = {}
+    for attempt in attempts:
+        attempt.correct_count = counts.get((attempt.student_id, quiz_id), (0, 0))[1]
+        if attempt.is_finished and attempt.total_questions:
+            scores.setdefault(attempt.get_score(), []).append(attempt.student_id)
+    QuizAttempt.objects.bulk_update(attempts, ['correct_count'])
+    # Оценок немного, поэтому результаты обновляются одним запросом на оценку
+    for score, score_student_ids in scores.items():
+        TakenQuiz.objects \
+            .filter(quiz_id=quiz_id, student_id__in=score_student_ids, team_attempt__isnull=True) \
+            .update(score=score)
+
+    team_counts = derive_team_answer_counts(quiz_ids=[quiz_id])
+    team_attempts = list(TeamAttempt.objects.filter(pk__in=team_attempt_ids))
+    team_scores = {}
+    for attempt in team_attempts:
+        attempt.correct_count = team_counts.get(attempt.pk, (0, 0))[1]
+        if attempt.is_finished and attempt.total_questions:
+            attempt.score = attempt.get_score()
+            team_scores.setdefault(attempt.score, []).append(attempt.pk)
+    TeamAttempt.objects.bulk_update(team_attempts, ['correct_count', 'score'])
+    for score, score_attempt_ids in team_scores.items():
+        TakenQuiz.objects.filter(team_attempt_id__in=score_attempt_ids).update(score=score)
+
+    if scores or team_scores:
+        rebuild_stats([quiz_id])
+        invalidate_exports(quiz_id)
@@ -0,0 +1,164 @@
+import csv
+import json
+import os
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Answer, Question
+from .progress import resync_open_attempts
+from .quiz_index import invalidate_subject_index
+from .snapshots import invalidate_snapshot
+
+IMPORT_BATCH_SIZE = getattr(settings, 'QUIZ_IMPORT_BATCH_SIZE', 500)
+EXPORT_FETCH_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+CSV_HEADER = ['question', 'answer', 'is_correct']
+TRUE_VALUES = {'1', 'true', 'yes', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'нет'}
+# Те же ограничения, что и у формы вопроса с ответами
+MIN_ANSWERS = 2
+MAX_ANSWERS = 10
+
+
+class QuizImportError(ValueError):
+    def __init__(self, line, message):
+        super().__init__('Строка %s: %s' % (line, message))
+        self.line = line
+
+
+def get_format(file_name):
+    '''
+    Returns the format of a question bank file from its extension, or None.
+    '''
+    extension = os.path.splitext(file_name)[1].lstrip('.').lower()
+    return extension if extension in FORMATS else None
+
+
+def read_csv(lines):
+    '''
+    Reads "question,answer,is_correct" rows; consecutive rows with the same
+    question text are the answers of one question.
+    '''
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None or [cell.strip().lower() for cell in header] != CSV_HEADER:
+        raise QuizImportError(1, 'ожидается заголовок %s' % ','.join(CSV_HEADER))
+    question = None
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) != len(CSV_HEADER):
+            raise QuizImportError(reader.line_num, 'ожидается %s столбца' % len(CSV_HEADER))
+        text, answer, is_correct = (cell.strip() for cell in row)
+        if is_correct.lower() not in TRUE_VALUES | FALSE_VALUES:
+            raise QuizImportError(reader.line_num, 'is_correct должен быть 1 или 0')
+        if question is None or question[1] != text:
+            if question is not None:
+                yield question
+            question = (reader.line_num, text, [])
+        question[2].append((answer, is_correct.lower() in TRUE_VALUES))
+    if question is not None:
+        yield question
+
+
+def read_jsonl(lines):
+    '''
+    Reads one question per line:
+    {"text": "...", "answers": [["answer", true], ["answer", false]]}
+    '''
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            answers = [(str(text).strip(), bool(is_correct)) for text, is_correct in item['answers']]
+            text = str(item['text']).strip()
+        except (ValueError, TypeError, KeyError):
+            raise QuizImportError(line_number, 'ожидается {"text": ..., "answers": [[ответ, true], ...]}')
+        yield line_number, text, answers
+
+
+def validate_question(line, text, answers):
+    text_length = Question._meta.get_field('text').max_length
+    answer_length = Answer._meta.get_field('text').max_length
+    if not text or len(text) > text_length:
+        raise QuizImportError(line, 'текст вопроса должен содержать от 1 до %s символов' % text_length)
+    if not MIN_ANSWERS <= len(answers) <= MAX_ANSWERS:
+        raise QuizImportError(line, 'у вопроса должно быть от %s до %s ответов' % (MIN_ANSWERS, MAX_ANSWERS))
+    if any(not answer or len(answer) > answer_length for answer, _ in answers):
+        raise QuizImportError(line, 'текст ответа должен содержать от 1 до %s символов' % answer_length)
+    if not any(is_correct for _, is_correct in answers):
+        raise QuizImportError(line, 'отметьте хотя бы один ответ как правильный')
+
+
+def create_questions(quiz, batch):
+    questions = [Question(quiz=quiz, text=text) for _, text, _ in batch]
+    Question.objects.bulk_create(questions)
+    if questions[0].pk is None:
+        # SQLite и MySQL не возвращают ключи из bulk_create, но строки одной вставки
+        # получают последние ключи вопросов викторины по порядку
+        pks = Question.objects.filter(quiz=quiz).order_by('-pk').values_list('pk', flat=True)[:len(questions)]
+        for question, pk in zip(questions, reversed(pks)):
+            question.pk = pk
+    Answer.objects.bulk_create([
+        Answer(question=question, text=text, is_correct=is_correct)
+        for question, (_, _, answers) in zip(questions, batch)
+        for text, is_correct in answers
+    ])
+
+
+@transaction.atomic
+def import_questions(quiz, lines, format):
+    '''
+    Adds the questions of a question bank file to the quiz, IMPORT_BATCH_SIZE
+    questions per insert. The file is read line by line; an invalid question
+    raises QuizImportError and nothing is imported.
+    '''
+    questions = read_csv(lines) if format == 'csv' else read_jsonl(lines)
+    imported = 0
+    while True:
+        batch = list(islice(questions, IMPORT_BATCH_SIZE))
+        if not batch:
+            break
+        for question in batch:
+            validate_question(*question)
+        create_questions(quiz, batch)
+        imported += len(batch)
+    if imported:
+        invalidate_snapshot(quiz.pk)
+        resync_open_attempts(quiz.pk)
+        transaction.on_commit(lambda: invalidate_subject_index(quiz.subject_id))
+    return imported
+
+
+def iter_questions(quiz_id):
+    answers = Answer.objects \
+        .filter(question__quiz_id=quiz_id) \
+        .order_by('question__text', 'question_id', 'text', 'pk') \
+        .values_list('question_id', 'question__text', 'text', 'is_correct') \
+        .iterator(chunk_size=EXPORT_FETCH_SIZE)
+    for (_, text), rows in groupby(answers, key=lambda row: row[:2]):
+        yield text, [(answer, is_correct) for _, _, answer, is_correct in rows]
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iter_export_lines(quiz_id, format):
+    '''
+    Yields the questions of the quiz as lines of a question bank file that
+    import_questions reads back.
+    '''
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(CSV_HEADER)
+        for text, answers in iter_questions(quiz_id):
+            for answer, is_correct in answers:
+                yield writer.writerow([text, answer, int(is_correct)])
+    else:
+        for text, answers in iter_questions(quiz_id):
+            yield json.dumps({'text': text, 'answers': answers}, ensure_ascii=False, separators=(',', ':')) + '\n'
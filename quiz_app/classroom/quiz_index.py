@@ -0,0 +1,127 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F
+
+from .models import Quiz, Student, Subject, TakenQuiz
+
+QUIZ_INDEX_TIMEOUT = getattr(settings, 'QUIZ_INDEX_TIMEOUT', 300)
+
+
+# Ключи содержат версии из базы, как у снимков викторин: кэш у каждого процесса
+# свой, а смена версии в базе видна всем процессам сразу
+def get_subject_key(subject_id, version):
+    return 'available-quizzes:%s:%s' % (subject_id, version)
+
+
+def get_student_key(student_id, version):
+    return 'student-quizzes:%s:%s' % (student_id, version)
+
+
+class CacheCounters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_metrics(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / requests, 4) if requests else 0,
+            }
+
+
+subject_counters = CacheCounters()
+student_counters = CacheCounters()
+
+
+def get_subject_indexes(versions):
+    '''
+    Takes {subject_id: quiz_index_version} and returns {subject_id: {quiz_id:
+    questions_count}} with the quizzes of each subject that have questions.
+    Only the subjects missing from the cache are counted in the database.
+    '''
+    keys = {subject_id: get_subject_key(subject_id, version) for subject_id, version in versions.items()}
+    cached = cache.get_many(keys.values())
+    indexes = {subject_id: cached[key] for subject_id, key in keys.items() if key in cached}
+    missing = [subject_id for subject_id in versions if subject_id not in indexes]
+    subject_counters.add(len(indexes), len(missing))
+    if missing:
+        built = {subject_id: {} for subject_id in missing}
+        quizzes = Quiz.objects \
+            .filter(subject_id__in=missing) \
+            .annotate(questions_count=Count('questions')) \
+            .filter(questions_count__gt=0) \
+            .values_list('subject_id', 'pk', 'questions_count') \
+            .order_by()
+        for subject_id, quiz_id, questions_count in quizzes:
+            built[subject_id][quiz_id] = questions_count
+        cache.set_many({keys[subject_id]: index for subject_id, index in built.items()}, QUIZ_INDEX_TIMEOUT)
+        indexes.update(built)
+    return indexes
+
+
+def get_taken_quizzes(student_id, version):
+    '''
+    Returns the set of quizzes the student has already taken.
+    '''
+    key = get_student_key(student_id, version)
+    taken = cache.get(key)
+    if taken is not None:
+        student_counters.add(1, 0)
+        return taken
+    student_counters.add(0, 1)
+    taken = set(TakenQuiz.objects
+                .filter(student_id=student_id)
+                .values_list('quiz_id', flat=True))
+    cache.set(key, taken, QUIZ_INDEX_TIMEOUT)
+    return taken
+
+
+def get_available_quizzes(student_id):
+    '''
+    Returns {quiz_id: questions_count} of the quizzes the student can take:
+    the quizzes of the student's subjects minus the quizzes already taken.
+    The interests and the versions of the cached entries are read in one
+    query.
+    '''
+    rows = list(Student.objects
+                .filter(pk=student_id)
+                .values_list('quizzes_version', 'interests', 'interests__quiz_index_version'))
+    if not rows:
+        return {}
+    versions = {subject_id: version for _, subject_id, version in rows if subject_id is not None}
+    available = {}
+    for index in get_subject_indexes(versions).values():
+        available.update(index)
+    for quiz_id in get_taken_quizzes(student_id, rows[0][0]):
+        available.pop(quiz_id, None)
+    return available
+
+
+def invalidate_subject_index(*subject_ids):
+    '''
+    Call it whenever a quiz of the subjects is added, removed, moved to another
+    subject or gains or loses questions.
+    '''
+    Subject.objects.filter(pk__in=subject_ids).update(quiz_index_version=F('quiz_index_version') + 1)
+
+
+def invalidate_student_quizzes(*student_ids):
+    '''
+    Call it whenever the students take a quiz.
+    '''
+    Student.objects.filter(pk__in=student_ids).update(quizzes_version=F('quizzes_version') + 1)
+
+
+def get_metrics():
+    return {'subjects': subject_counters.get_metrics(), 'students': student_counters.get_metrics()}
@@ -0,0 +1,113 @@
+import csv
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Student, Team, TeamMembership
+
+MAX_TEAM_SIZE = 5
+CSV_HEADER = ['team', 'student']
+AUTOCOMPLETE_LIMIT = 20
+
+
+class RosterImportError(ValueError):
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def read_roster(lines):
+    '''
+    Reads "team,student" rows, student being the username, into
+    {team name: [(line, username)]}.
+    '''
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None or [cell.strip().lower() for cell in header] != CSV_HEADER:
+        raise RosterImportError(['Строка 1: ожидается заголовок %s' % ','.join(CSV_HEADER)])
+    teams = OrderedDict()
+    errors = []
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) != len(CSV_HEADER) or not all(cell.strip() for cell in row):
+            errors.append('Строка %s: ожидается название команды и имя пользователя студента' % reader.line_num)
+            continue
+        team, username = (cell.strip() for cell in row)
+        teams.setdefault(team, []).append((reader.line_num, username))
+    if errors:
+        raise RosterImportError(errors)
+    return teams
+
+
+def validate_roster(quiz, teams):
+    '''
+    Checks the whole roster at once and returns {username: student_id}.
+    Raises RosterImportError with every problem found.
+    '''
+    errors = []
+    name_length = Team._meta.get_field('name').max_length
+    usernames = {username for members in teams.values() for _, username in members}
+    students = dict(Student.objects
+                    .filter(user__username__in=usernames)
+                    .values_list('user__username', 'pk'))
+    existing_teams = set(Team.objects.filter(quiz=quiz, name__in=teams).values_list('name', flat=True))
+    # Студент может состоять только в одной команде викторины
+    assigned = set(TeamMembership.objects
+                   .filter(team__quiz=quiz, student_id__in=students.values())
+                   .values_list('student__user__username', flat=True))
+    seen = {}
+
+    for team, members in teams.items():
+        if len(team) > name_length:
+            errors.append('Команда "%s": название длиннее %s символов' % (team, name_length))
+        if team in existing_teams:
+            errors.append('Команда "%s" уже есть в викторине' % team)
+        if len(members) > MAX_TEAM_SIZE:
+            errors.append('Команда "%s": %s студентов, допускается не более %s'
+                          % (team, len(members), MAX_TEAM_SIZE))
+        for line, username in members:
+            if username not in students:
+                errors.append('Строка %s: студент %s не найден' % (line, username))
+            elif username in assigned:
+                errors.append('Строка %s: студент %s уже состоит в команде этой викторины' % (line, username))
+            elif username in seen:
+                errors.append('Строка %s: студент %s уже указан в строке %s' % (line, username, seen[username]))
+            seen.setdefault(username, line)
+    if errors:
+        raise RosterImportError(errors)
+    return students
+
+
+@transaction.atomic
+def import_roster(quiz, lines):
+    '''
+    Creates the teams of the roster file for the quiz with their members.
+    Nothing is created if the roster has errors.
+    '''
+    teams = read_roster(lines)
+    students = validate_roster(quiz, teams)
+    Team.objects.bulk_create([Team(quiz=quiz, name=name) for name in teams])
+    # Названия команд проверены на уникальность, поэтому ключи находятся по ним
+    # и на базах, где bulk_create не возвращает ключи
+    team_ids = dict(Team.objects.filter(quiz=quiz, name__in=teams).values_list('name', 'pk'))
+    TeamMembership.objects.bulk_create([
+        TeamMembership(team_id=team_ids[name], student_id=students[username])
+        for name, members in teams.items()
+        for _, username in members
+    ])
+    return len(teams)
+
+
+def search_students(term, limit=AUTOCOMPLETE_LIMIT):
+    '''
+    Returns up to limit students whose username starts with the term or whose
+    name contains it, as [{'id': ..., 'text': ...}].
+    '''
+    students = Student.objects \
+        .filter(Q(user__username__istartswith=term) | Q(name__icontains=term)) \
+        .order_by('user__username') \
+        .values_list('pk', 'user__username', 'name')[:limit]
+    return [{'id': pk, 'text': '%s (%s)' % (username, name) if name else username}
+            for pk, username, name in students]
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DATABASE = getattr(settings, 'REPLICA_DATABASE', 'replica')
+
+_reporting = ContextVar('reporting', default=False)
+# Состояние текущего запроса хранится в изменяемом словаре, чтобы отметка о записи
+# была видна middleware, даже если ORM вызывался в скопированном контексте
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+@contextmanager
+def reading_from_replica(enabled=True):
+    '''
+    Sends the reads inside the block to the replica, unless the current user
+    has written recently.
+    '''
+    token = _reporting.set(enabled)
+    try:
+        yield
+    finally:
+        _reporting.reset(token)
+
+
+@contextmanager
+def tracking_writes(pinned):
+    '''
+    Tracks the writes of one request. Returns the request state: 'written'
+    is set once the request writes to the database.
+    '''
+    state = {'pinned': pinned, 'written': False}
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+def is_routed(hints):
+    '''
+    Objects of other databases, such as a scratch database of a benchmark,
+    stay where they were loaded from.
+    '''
+    instance = hints.get('instance')
+    return instance is None or instance._state.db in (None, DEFAULT_DB_ALIAS, REPLICA_DATABASE)
+
+
+class ReplicaRouter:
+    '''
+    Sends the reads of reporting views and exports to the replica and
+    everything else to the default database. A request that has written, or
+    comes from a user who wrote in the last REPLICA_PIN_SECONDS, keeps reading
+    from the default database, so users see their own writes at once.
+    '''
+
+    def db_for_read(self, model, **hints):
+        if not is_routed(hints):
+            return None
+        if not _reporting.get() or REPLICA_DATABASE not in settings.DATABASES:
+            return DEFAULT_DB_ALIAS
+        state = _request_state.get()
+        if state is not None and (state['pinned'] or state['written']):
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DATABASE
+
+    def db_for_write(self, model, **hints):
+        if not is_routed(hints):
+            return None
+        state = _request_state.get()
+        if state is not None:
+            state['written'] = True
+        # Объект, прочитанный с реплики, все равно сохраняется в основную базу
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_DATABASE}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика получает схему через репликацию
+        if db == REPLICA_DATABASE:
+            return False
+        return None
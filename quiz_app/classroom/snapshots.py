@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Prefetch
+
+from .models import Answer, Question, Quiz
+
+SnapshotAnswer = namedtuple('SnapshotAnswer', ['pk', 'text', 'is_correct'])
+SnapshotQuestion = namedtuple('SnapshotQuestion', ['pk', 'text', 'answers'])
+
+
+class QuizSnapshot:
+    '''
+    Immutable, ordered view of a quiz's questions and answers used by the
+    student flow instead of querying Question and Answer rows.
+    '''
+    __slots__ = ('quiz_id', 'version', 'questions', '_positions')
+
+    def __init__(self, quiz_id, version, questions):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.questions = questions
+        self._positions = {question.pk: index for index, question in enumerate(questions)}
+
+    def __len__(self):
+        return len(self.questions)
+
+    def get_question(self, pk):
+        position = self._positions.get(pk)
+        if position is None:
+            return None
+        return self.questions[position]
+
+    def get_position(self, pk):
+        return self._positions[pk]
+
+    def get_following_question(self, pk):
+        position = self._positions[pk] + 1
+        if position < len(self.questions):
+            return self.questions[position]
+        return None
+
+
+class SnapshotCache:
+    '''
+    Per-process LRU of quiz snapshots in front of Django's cache framework.
+    Keys include the quiz version, so stale entries are never served and
+    simply age out.
+    '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, quiz_id, version):
+        key = 'quiz-snapshot:%s:%s' % (quiz_id, version)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                self._snapshots.move_to_end(key)
+                return snapshot
+
+        questions = cache.get(key)
+        if questions is None:
+            questions = build_questions(quiz_id)
+            cache.set(key, questions, None)
+        snapshot = QuizSnapshot(quiz_id, version, questions)
+
+        with self._lock:
+            self._snapshots[key] = snapshot
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.maxsize:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+
+snapshot_cache = SnapshotCache(getattr(settings, 'QUIZ_SNAPSHOT_CACHE_SIZE', 128))
+
+
+def build_questions(quiz_id):
+    questions = Question.objects \
+        .filter(quiz_id=quiz_id) \
+        .order_by('text', 'pk') \
+        .prefetch_related(Prefetch('answers', queryset=Answer.objects.order_by('text', 'pk')))
+    return tuple(
+        SnapshotQuestion(question.pk, question.text, tuple(
+            SnapshotAnswer(answer.pk, answer.text, answer.is_correct) for answer in question.answers.all()
+        ))
+        for question in questions
+    )
+
+
+def get_snapshot(quiz):
+    return snapshot_cache.get(quiz.pk, quiz.version)
+
+
+def invalidate_snapshot(quiz_id):
+    '''
+    Moves the quiz to a new version. Call it whenever questions or answers
+    of the quiz are changed.
+    '''
+    Quiz.objects.filter(pk=quiz_id).update(version=F('version') + 1)
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import QuizStats, TakenQuiz
+
+GRADE_FILTERS = {
+    'excellent_count': Q(score__gte=8),
+    'good_count': Q(score__gte=6, score__lt=8),
+    'satisfactory_count': Q(score__gte=4, score__lt=6),
+    'unsatisfactory_count': Q(score__lt=4),
+}
+
+
+def record_result(quiz_id, score, count=1):
+    '''
+    Adds count new TakenQuiz rows with the same score to the quiz statistics.
+    Call it in the same transaction that creates the TakenQuiz rows.
+    '''
+    QuizStats.objects.get_or_create(quiz_id=quiz_id)
+    grade_field = QuizStats.get_grade_field(score)
+    QuizStats.objects.filter(quiz_id=quiz_id).update(**{
+        'attempts': F('attempts') + count,
+        'score_sum': F('score_sum') + score * count,
+        'score_min': Least(Coalesce(F('score_min'), Value(score)), Value(score)),
+        'score_max': Greatest(Coalesce(F('score_max'), Value(score)), Value(score)),
+        grade_field: F(grade_field) + count,
+    })
+
+
+def get_stats(quiz):
+    try:
+        return quiz.stats
+    except QuizStats.DoesNotExist:
+        return QuizStats(quiz=quiz)
+
+
+@transaction.atomic
+def rebuild_stats(quiz_ids):
+    '''
+    Recomputes the statistics of the given quizzes from TakenQuiz rows with a
+    single grouped query.
+    '''
+    rows = TakenQuiz.objects \
+        .filter(quiz_id__in=quiz_ids) \
+        .values('quiz_id') \
+        .annotate(attempts=Count('pk'),
+                  score_sum=Sum('score'),
+                  score_min=Min('score'),
+                  score_max=Max('score'),
+                  **{field: Count('pk', filter=grade_filter) for field, grade_filter in GRADE_FILTERS.items()}) \
+        .order_by()
+    QuizStats.objects.filter(quiz_id__in=quiz_ids).delete()
+    QuizStats.objects.bulk_create([QuizStats(**row) for row in rows])
+    return len(rows)
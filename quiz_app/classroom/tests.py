@@ -0,0 +1,735 @@
+import asyncio
+import time
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .admission import ANSWER_BURST, AdmissionRejected, ConcurrencyLimiter, get_rejected_response, take_token
+from .export_jobs import enqueue_export
+from .exports import build_student_workbook, get_team_results, iter_results_rows
+from .models import (Answer, AnswerBucket, ExportJob, Message, Question, Quiz, QuizAttempt, Room, Student, Subject, TakenQuiz, Team,
+                     TeamMembership, User)
+from .middleware import REPLICA_PIN_COOKIE
+from .progress import finish_team_attempt, record_answer, start_team_attempt
+from .quiz_index import get_available_quizzes, get_subject_key, invalidate_student_quizzes, invalidate_subject_index
+from .routers import REPLICA_DATABASE, ReplicaRouter, reading_from_replica, tracking_writes
+from .snapshots import get_snapshot, snapshot_cache
+from .views.students import QuizListView, TakenQuizListView, get_take_quiz_step
+
+QUESTIONS = 5
+
+
+def create_quiz(owner, name='Quiz', questions=QUESTIONS):
+    subject = Subject.objects.first() or Subject.objects.create(name='Subject')
+    room, _ = Room.objects.get_or_create(slug='tests', defaults={'name': 'tests'})
+    quiz = Quiz.objects.create(owner=owner, subject=subject, room=room, name=name)
+    for i in range(questions):
+        question = Question.objects.create(quiz=quiz, text='Question %s' % i)
+        Answer.objects.bulk_create([Answer(question=question, text='right', is_correct=True),
+                                    Answer(question=question, text='wrong')])
+    return quiz
+
+
+def create_student(username):
+    user = User.objects.create_user(username, is_student=True)
+    Student.objects.create(user=user, name=username)
+    return user
+
+
+def take_team_quiz(team, user, correct):
+    '''
+    The member answers the first correct questions right and the rest wrong,
+    then finishes the team attempt.
+    '''
+    attempt = start_team_attempt(team)
+    for index, question in enumerate(get_snapshot(team.quiz).questions):
+        answer = next(answer for answer in question.answers if answer.is_correct == (index < correct))
+        record_answer(attempt, question, answer, user.pk)
+    return finish_team_attempt(attempt)
+
+
+class QueryScalingMixin:
+    '''
+    assertQueriesDoNotScale() fails when a page makes more queries as its
+    rows grow. add_rows(start, stop) creates rows start to stop - 1, and
+    get_page() returns the page response; caches are cleared before every
+    measurement, so each one starts cold.
+    '''
+
+    SCALING_ROWS = (10, 1000)
+
+    def assertQueriesDoNotScale(self, get_page, add_rows):
+        counts = {}
+        created = 0
+        for rows in self.SCALING_ROWS:
+            add_rows(created, rows)
+            created = rows
+            cache.clear()
+            snapshot_cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = get_page()
+            self.assertEqual(response.status_code, 200)
+            counts[rows] = len(queries)
+        self.assertEqual(len(set(counts.values())), 1, 'Query count grows with rows: %s' % counts)
+
+
+class TakeQuizMixin:
+    '''
+    Takes self.quiz as self.student through the sync steps of take_quiz. The
+    async view runs the ORM work in the shared thread pool, whose connections
+    do not see the test transaction.
+    '''
+
+    def get_request(self, data=None):
+        factory = RequestFactory()
+        path = '/students/quiz/%s/' % self.quiz.pk
+        request = factory.post(path, data) if data is not None else factory.get(path)
+        request.user = self.student
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        return request
+
+    def take_step(self, data=None):
+        step = get_take_quiz_step(self.get_request(data), self.quiz.pk)
+        return step if isinstance(step, HttpResponse) else step()
+
+    def get_attempt(self):
+        return QuizAttempt.objects.get(student_id=self.student.pk, quiz=self.quiz)
+
+    def get_right_answer(self):
+        return Answer.objects.get(question_id=self.get_attempt().next_question_id, is_correct=True)
+
+
+class TakeQuizQueriesTests(TakeQuizMixin, TestCase):
+    '''
+    Query counts of every step of the student quiz flow, with the quiz
+    snapshot cached as it is between requests.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', is_teacher=True)
+        cls.student = create_student('student')
+        cls.quiz = create_quiz(cls.teacher)
+
+    def setUp(self):
+        cache.clear()
+        snapshot_cache.clear()
+        get_snapshot(self.quiz)
+
+    def test_first_visit(self):
+        request = self.get_request()
+        # Команда, попытка
+        with self.assertNumQueries(2):
+            start = get_take_quiz_step(request, self.quiz.pk)
+        # Викторина, ответы и следующий вопрос для попытки, пройдена ли викторина, вставка попытки
+        with self.assertNumQueries(8):
+            response = start()
+        self.assertEqual(response.status_code, 200)
+
+    def test_question_page(self):
+        self.take_step()
+        # Команда, попытка вместе с викториной
+        with self.assertNumQueries(2):
+            response = self.take_step()
+        self.assertEqual(response.status_code, 200)
+
+    def test_answer(self):
+        self.take_step()
+        answer = self.get_right_answer()
+        # Команда и попытка; затем корзина токенов студента (первый ответ ее создает),
+        # обновление попытки и вставка ответа в транзакции
+        with self.assertNumQueries(2):
+            save = get_take_quiz_step(self.get_request({'answer': answer.pk}), self.quiz.pk)
+        with self.assertNumQueries(8):
+            response = save()
+        self.assertEqual(response.status_code, 302)
+
+        answer = self.get_right_answer()
+        save = get_take_quiz_step(self.get_request({'answer': answer.pk}), self.quiz.pk)
+        with self.assertNumQueries(5):
+            response = save()
+        self.assertEqual(response.status_code, 302)
+
+    def test_last_answer(self):
+        self.take_step()
+        for _ in range(QUESTIONS - 1):
+            self.take_step({'answer': self.get_right_answer().pk})
+        answer = self.get_right_answer()
+        save = get_take_quiz_step(self.get_request({'answer': answer.pk}), self.quiz.pk)
+        # Токен, ответ, пересчет ответов и вопросов, результат, статистика викторины (строка
+        # создается с первым результатом), отметка о завершении и версия выгрузок
+        with self.assertNumQueries(17):
+            response = save()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TakenQuiz.objects.get(student_id=self.student.pk, quiz=self.quiz).score, 10)
+
+    def test_finished_quiz(self):
+        self.take_step()
+        for _ in range(QUESTIONS):
+            self.take_step({'answer': self.get_right_answer().pk})
+        with self.assertNumQueries(2):
+            response = self.take_step()
+        self.assertRedirects(response, '/students/taken/', fetch_redirect_response=False)
+
+
+class TakeQuizViewTests(TransactionTestCase):
+    '''
+    The async take_quiz view through the ASGI test client, from the first
+    question to the result. The view runs the ORM work in the shared thread
+    pool, whose connections only see committed data.
+    '''
+
+    def setUp(self):
+        cache.clear()
+        snapshot_cache.clear()
+        self.teacher = User.objects.create_user('teacher', is_teacher=True)
+        self.student = create_student('student')
+        self.quiz = create_quiz(self.teacher, questions=3)
+        self.async_client.force_login(self.student)
+
+    def get_answer(self, is_correct):
+        attempt = QuizAttempt.objects.get(student_id=self.student.pk, quiz=self.quiz)
+        return Answer.objects.get(question_id=attempt.next_question_id, is_correct=is_correct)
+
+    async def test_take_quiz(self):
+        path = '/students/quiz/%s/' % self.quiz.pk
+        for is_correct in (True, False, True):
+            response = await self.async_client.get(path)
+            self.assertEqual(response.status_code, 200)
+            answer = await sync_to_async(self.get_answer)(is_correct)
+            self.assertContains(response, 'value="%s"' % answer.pk)
+            response = await self.async_client.post(path, {'answer': answer.pk})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/students/')
+
+        taken_quiz = await TakenQuiz.objects.aget(student_id=self.student.pk, quiz=self.quiz)
+        self.assertEqual(taken_quiz.score, round(2 / 3 * 10, 2))
+        response = await self.async_client.get(path)
+        self.assertEqual(response['Location'], '/students/taken/')
+
+    async def test_missing_quiz(self):
+        response = await self.async_client.get('/students/quiz/%s/' % (self.quiz.pk + 1))
+        self.assertEqual(response.status_code, 404)
+
+
+class QuizChangeDuringAttemptTests(TakeQuizMixin, TestCase):
+    '''
+    Questions the teacher adds or deletes while a student takes the quiz
+    reach the open attempt.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', is_teacher=True)
+        cls.student = create_student('student')
+        cls.quiz = create_quiz(cls.teacher, questions=3)
+
+    def setUp(self):
+        cache.clear()
+        snapshot_cache.clear()
+        self.client.force_login(self.teacher)
+        self.take_step()
+        for _ in range(2):
+            self.take_step({'answer': self.get_right_answer().pk})
+
+    def add_question(self, text):
+        response = self.client.post('/teachers/quiz/%s/question/add/' % self.quiz.pk, {'text': text})
+        self.assertEqual(response.status_code, 302)
+        question = Question.objects.get(quiz=self.quiz, text=text)
+        Answer.objects.bulk_create([Answer(question=question, text='right', is_correct=True),
+                                    Answer(question=question, text='wrong')])
+        return question
+
+    def test_added_and_deleted_questions(self):
+        first = self.add_question('A question')
+        answered = Question.objects.get(quiz=self.quiz, text='Question 0')
+        response = self.client.post('/teachers/quiz/%s/question/%s/delete/' % (self.quiz.pk, answered.pk))
+        self.assertEqual(response.status_code, 302)
+
+        attempt = self.get_attempt()
+        self.assertEqual((attempt.total_questions, attempt.answered_count, attempt.correct_count), (3, 1, 1))
+        self.assertEqual(attempt.next_question_id, first.pk)
+
+        self.take_step({'answer': Answer.objects.get(question=first, is_correct=False).pk})
+        self.take_step({'answer': self.get_right_answer().pk})
+        taken_quiz = TakenQuiz.objects.get(student_id=self.student.pk, quiz=self.quiz)
+        self.assertEqual(taken_quiz.score, round(2 / 3 * 10, 2))
+
+    def test_renamed_question(self):
+        last = Question.objects.get(quiz=self.quiz, text='Question 2')
+        self.add_question('Question 3')
+        response = self.client.post('/teachers/quiz/%s/question/%s/' % (self.quiz.pk, last.pk), {
+            'text': 'Question 4',
+            'answers-TOTAL_FORMS': '2', 'answers-INITIAL_FORMS': '2',
+            'answers-MIN_NUM_FORMS': '2', 'answers-MAX_NUM_FORMS': '10',
+            **{'answers-%s-%s' % (index, field): value
+               for index, answer in enumerate(last.answers.order_by('pk'))
+               for field, value in (('id', answer.pk), ('question', last.pk), ('text', answer.text),
+                                    ('is_correct', 'on' if answer.is_correct else ''))},
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.get_attempt().next_question.text, 'Question 3')
+
+    def test_score_from_stored_answers(self):
+        # Удаление мимо представлений не пересчитывает попытку, оценка все равно верная
+        Question.objects.filter(quiz=self.quiz, text='Question 0').delete()
+        self.take_step({'answer': Answer.objects.get(question__quiz=self.quiz, question__text='Question 2',
+                                                     is_correct=False).pk})
+        attempt = self.get_attempt()
+        self.assertEqual((attempt.total_questions, attempt.answered_count, attempt.correct_count), (2, 2, 1))
+        self.assertEqual(TakenQuiz.objects.get(student_id=self.student.pk, quiz=self.quiz).score, 5)
+
+
+class QuizIndexTests(TestCase):
+    '''
+    Invalidation moves the versions in the database, so cache entries another
+    worker still holds are never read again.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', is_teacher=True)
+        cls.student = create_student('student')
+        cls.quiz = create_quiz(cls.teacher, questions=1)
+        cls.student.student.interests.add(cls.quiz.subject)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_one_query_when_cached(self):
+        get_available_quizzes(self.student.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_available_quizzes(self.student.pk), {self.quiz.pk: 1})
+
+    def test_subject_invalidation(self):
+        get_available_quizzes(self.student.pk)
+        quiz = create_quiz(self.teacher, name='New quiz', questions=2)
+        invalidate_subject_index(quiz.subject_id)
+        self.assertIsNotNone(cache.get(get_subject_key(quiz.subject_id, 0)))
+        self.assertEqual(get_available_quizzes(self.student.pk), {self.quiz.pk: 1, quiz.pk: 2})
+
+    def test_student_invalidation(self):
+        get_available_quizzes(self.student.pk)
+        TakenQuiz.objects.create(student_id=self.student.pk, quiz=self.quiz, score=10)
+        invalidate_student_quizzes(self.student.pk)
+        self.assertEqual(get_available_quizzes(self.student.pk), {})
+
+    def test_interests(self):
+        get_available_quizzes(self.student.pk)
+        self.student.student.interests.clear()
+        self.assertEqual(get_available_quizzes(self.student.pk), {})
+
+
+class AnswerBucketTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student('student')
+        cls.other = create_student('other')
+
+    def take_tokens(self, student, count):
+        for _ in range(count):
+            take_token(student.pk)
+
+    def test_burst(self):
+        self.take_tokens(self.student, ANSWER_BURST)
+        with self.assertRaises(AdmissionRejected) as rejected:
+            take_token(self.student.pk)
+        self.assertEqual((rejected.exception.status, rejected.exception.retry_after), (429, 1))
+        self.assertLess(AnswerBucket.objects.get(student_id=self.student.pk).tokens, 1)
+
+    def test_refill(self):
+        self.take_tokens(self.student, ANSWER_BURST)
+        # Две секунды назад: корзина пополнилась, но не больше ANSWER_BURST
+        AnswerBucket.objects.filter(student_id=self.student.pk).update(updated=time.time() - 2)
+        take_token(self.student.pk)
+        AnswerBucket.objects.filter(student_id=self.student.pk).update(updated=time.time() - 3600)
+        self.take_tokens(self.student, ANSWER_BURST)
+        with self.assertRaises(AdmissionRejected):
+            take_token(self.student.pk)
+
+    def test_students(self):
+        self.take_tokens(self.student, ANSWER_BURST)
+        take_token(self.other.pk)
+
+    def test_rejected_response(self):
+        response = get_rejected_response(AdmissionRejected(429, 3))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3')
+
+
+class ConcurrencyLimiterTests(SimpleTestCase):
+    def test_admit(self):
+        limiter = ConcurrencyLimiter(1, 0.05)
+        with limiter.admit():
+            with self.assertRaises(AdmissionRejected) as rejected, limiter.admit():
+                pass
+        self.assertEqual(rejected.exception.status, 503)
+        with limiter.admit():
+            pass
+        metrics = limiter.get_metrics()
+        self.assertEqual((metrics['admitted'], metrics['shed'], metrics['queue_depth']), (2, 1, 0))
+
+    def test_aadmit_waits_for_release(self):
+        limiter = ConcurrencyLimiter(1, 1)
+        admitted = []
+
+        async def hold(name, seconds):
+            async with limiter.aadmit():
+                admitted.append(name)
+                await asyncio.sleep(seconds)
+
+        async def run():
+            await asyncio.gather(hold('first', 0.05), hold('second', 0))
+
+        asyncio.run(run())
+        self.assertEqual(admitted, ['first', 'second'])
+        metrics = limiter.get_metrics()
+        self.assertEqual((metrics['admitted'], metrics['shed'], metrics['max_queue_depth']), (2, 0, 1))
+        self.assertGreater(metrics['wait_max_ms'], 0)
+
+    def test_aadmit_sheds(self):
+        limiter = ConcurrencyLimiter(1, 0.05)
+
+        async def run():
+            async with limiter.aadmit():
+                with self.assertRaises(AdmissionRejected) as rejected:
+                    async with limiter.aadmit():
+                        pass
+            return rejected.exception
+
+        self.assertEqual(asyncio.run(run()).status, 503)
+        self.assertEqual(limiter.get_metrics()['shed'], 1)
+
+    def test_sync_release_wakes_async_waiter(self):
+        limiter = ConcurrencyLimiter(1, 1)
+
+        async def wait():
+            async with limiter.aadmit():
+                pass
+
+        async def run():
+            with limiter.admit():
+                waiter = asyncio.get_running_loop().create_task(wait())
+                await asyncio.sleep(0.05)
+                self.assertFalse(waiter.done())
+            await asyncio.wait_for(waiter, 0.5)
+
+        asyncio.run(run())
+        self.assertEqual(limiter.get_metrics()['admitted'], 2)
+
+
+class ExportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', is_teacher=True)
+        cls.quiz = create_quiz(cls.teacher, questions=1)
+
+    def setUp(self):
+        self.client.force_login(self.teacher)
+
+    def test_pending_job_reused(self):
+        job = enqueue_export(ExportJob.QUIZ_RESULTS, self.quiz)
+        self.assertEqual(enqueue_export(ExportJob.QUIZ_RESULTS, self.quiz), job)
+
+    def test_racing_job_finished(self):
+        # Файла у готовой задачи нет, и такую же задачу уже поставил и выполнил параллельный запрос
+        finished = ExportJob.objects.create(kind=ExportJob.QUIZ_RESULTS, quiz=self.quiz, status=ExportJob.DONE,
+                                            results_version=self.quiz.results_version, file_name='missing.xlsx')
+        with mock.patch.object(ExportJob.objects, 'create', side_effect=IntegrityError):
+            self.assertEqual(enqueue_export(ExportJob.QUIZ_RESULTS, self.quiz), finished)
+
+    def get_results_version(self):
+        return Quiz.objects.values_list('results_version', flat=True).get(pk=self.quiz.pk)
+
+    def test_quiz_renamed(self):
+        version = self.get_results_version()
+        self.client.post('/teachers/quiz/%s/' % self.quiz.pk, {'name': 'Renamed', 'subject': self.quiz.subject_id})
+        self.assertGreater(self.get_results_version(), version)
+
+    def test_question_text_changed(self):
+        question = self.quiz.questions.get()
+        answers = list(question.answers.order_by('pk'))
+        data = {
+            'text': 'Renamed',
+            'answers-TOTAL_FORMS': '2', 'answers-INITIAL_FORMS': '2',
+            'answers-MIN_NUM_FORMS': '2', 'answers-MAX_NUM_FORMS': '10',
+        }
+        for index, answer in enumerate(answers):
+            data.update({'answers-%s-id' % index: answer.pk, 'answers-%s-question' % index: question.pk,
+                         'answers-%s-text' % index: answer.text})
+            if answer.is_correct:
+                data['answers-%s-is_correct' % index] = 'on'
+        version = self.get_results_version()
+        response = self.client.post('/teachers/quiz/%s/question/%s/' % (self.quiz.pk, question.pk), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertGreater(self.get_results_version(), version)
+
+
+class TeamResultsTests(TestCase):
+    '''
+    Team results of the exports. The queries are plain ORM, so the same tests
+    cover SQLite and PostgreSQL: run them with DATABASES pointing at a local
+    PostgreSQL to check the second backend.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        # Снимки викторин кэшируются в процессе, а id викторин повторяются между тестами
+        cache.clear()
+        snapshot_cache.clear()
+        cls.teacher = User.objects.create_user('teacher', is_teacher=True)
+        cls.quiz = create_quiz(cls.teacher, questions=2)
+        cls.members = []
+        for index in range(3):
+            team = Team.objects.create(quiz=cls.quiz, name='Team %s' % index)
+            members = [create_student('team%s_member%s' % (index, number)) for number in range(2)]
+            TeamMembership.objects.bulk_create([TeamMembership(team=team, student_id=user.pk) for user in members])
+            take_team_quiz(team, members[0], correct=index)
+            cls.members.append(members)
+
+    def test_team_results(self):
+        with self.assertNumQueries(1):
+            rows = get_team_results(self.quiz.pk)
+        self.assertEqual(rows, [
+            ('Team 0', 'team0_member0, team0_member1', 0.0),
+            ('Team 1', 'team1_member0, team1_member1', 5.0),
+            ('Team 2', 'team2_member0, team2_member1', 10.0),
+        ])
+
+    def test_team_results_of_other_quiz(self):
+        other_quiz = create_quiz(self.teacher, name='Other', questions=2)
+        self.assertEqual(get_team_results(other_quiz.pk), [])
+
+    def test_results_rows(self):
+        with self.assertNumQueries(1):
+            rows = list(iter_results_rows(self.quiz.pk))
+        self.assertEqual(sorted((team, student, score) for team, student, quiz, date, score in rows), [
+            ('Team 0', 'team0_member0', 0.0), ('Team 0', 'team0_member1', 0.0),
+            ('Team 1', 'team1_member0', 5.0), ('Team 1', 'team1_member1', 5.0),
+            ('Team 2', 'team2_member0', 10.0), ('Team 2', 'team2_member1', 10.0),
+        ])
+
+    def test_student_workbook(self):
+        # Второй участник не отвечал сам, но получает ответы команды
+        with self.assertNumQueries(2):
+            wb = build_student_workbook(self.quiz.pk, self.members[1][1].pk)
+        self.assertEqual(list(wb.active.values), [
+            ('Команда: Team 1 (team1_member0, team1_member1)', 'Оценка: 5.0', None),
+            (None, None, None),
+            ('Вопрос', 'Ответ команды', 'Ответ правильный'),
+            ('Question 0', 'right', 'Да'),
+            ('Question 1', 'wrong', 'Нет'),
+        ])
+
+
+class ListPagesQueriesTests(QueryScalingMixin, TestCase):
+    '''
+    Every list page makes the same number of queries with 10 and with 1000
+    rows. Student pages are async views running the ORM work in the shared
+    thread pool, so their sync render methods are called directly. The reads
+    are pinned to the default database: a replica mirror does not see the
+    data of a TestCase.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', is_teacher=True)
+        cls.student = create_student('student')
+        cls.quiz = create_quiz(cls.teacher)
+        cls.team = Team.objects.create(quiz=cls.quiz, name='Team')
+        TeamMembership.objects.create(team=cls.team, student_id=cls.student.pk)
+        cls.student.student.interests.add(cls.quiz.subject)
+
+    def setUp(self):
+        self.client.force_login(self.teacher)
+        self.client.cookies[REPLICA_PIN_COOKIE] = '1'
+
+    def get_student_request(self, path):
+        request = RequestFactory().get(path)
+        request.user = self.student
+        return request
+
+    def add_quizzes(self, start, stop):
+        for index in range(start, stop):
+            create_quiz(self.teacher, name='Quiz %s' % index, questions=1)
+
+    def add_students(self, start, stop):
+        users = User.objects.bulk_create([User(username='student_%s' % index, is_student=True)
+                                          for index in range(start, stop)])
+        return Student.objects.bulk_create([Student(user=user, name=user.username) for user in users])
+
+    def test_teacher_quiz_list(self):
+        self.assertQueriesDoNotScale(lambda: self.client.get('/teachers/'), self.add_quizzes)
+
+    def test_quiz_change(self):
+        def add_questions(start, stop):
+            questions = Question.objects.bulk_create([Question(quiz=self.quiz, text='Extra %s' % index)
+                                                      for index in range(start, stop)])
+            Answer.objects.bulk_create([Answer(question=question, text='right', is_correct=True)
+                                        for question in questions])
+
+        self.assertQueriesDoNotScale(lambda: self.client.get('/teachers/quiz/%s/' % self.quiz.pk), add_questions)
+
+    def test_quiz_results(self):
+        def add_results(start, stop):
+            TakenQuiz.objects.bulk_create([TakenQuiz(student=student, quiz=self.quiz, team=self.team, score=5)
+                                           for student in self.add_students(start, stop)])
+
+        self.assertQueriesDoNotScale(lambda: self.client.get('/teachers/quiz/%s/results/' % self.quiz.pk),
+                                     add_results)
+
+    def test_team_list(self):
+        def add_teams(start, stop):
+            teams = Team.objects.bulk_create([Team(quiz=self.quiz, name='Team %s' % index)
+                                              for index in range(start, stop)])
+            TeamMembership.objects.bulk_create([TeamMembership(team=team, student=student)
+                                                for team, student in zip(teams, self.add_students(start, stop))])
+
+        self.assertQueriesDoNotScale(lambda: self.client.get('/teachers/teams/'), add_teams)
+
+    def test_create_team(self):
+        self.assertQueriesDoNotScale(lambda: self.client.get('/teachers/create_team/'), self.add_quizzes)
+
+    def test_team_chat_history(self):
+        def add_messages(start, stop):
+            Message.objects.bulk_create([Message(room=self.quiz.room, team=self.team, user=self.student,
+                                                 content='Message %s' % index) for index in range(start, stop)])
+
+        self.assertQueriesDoNotScale(lambda: self.client.get('/chat/team/%s/history/' % self.team.pk),
+                                     add_messages)
+
+    def test_student_quiz_list(self):
+        request = self.get_student_request('/students/')
+        self.assertQueriesDoNotScale(lambda: QuizListView().render_quizzes(request), self.add_quizzes)
+
+    def test_taken_quiz_list(self):
+        def add_taken_quizzes(start, stop):
+            quizzes = Quiz.objects.bulk_create([Quiz(owner=self.teacher, subject=self.quiz.subject,
+                                                     room=self.quiz.room, name='Taken %s' % index)
+                                                for index in range(start, stop)])
+            TakenQuiz.objects.bulk_create([TakenQuiz(student_id=self.student.pk, quiz=quiz, team=self.team,
+                                                     score=5) for quiz in quizzes])
+
+        def get_page():
+            with tracking_writes(pinned=True):
+                return TakenQuizListView().render_taken_quizzes(request)
+
+        request = self.get_student_request('/students/taken/')
+        self.assertQueriesDoNotScale(get_page, add_taken_quizzes)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    '''
+    The replica mirrors the default database in tests over a connection of
+    its own. The mirror connection does not see the uncommitted data of a
+    TestCase, so the data is committed.
+    '''
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', is_teacher=True)
+        self.quiz = create_quiz(self.teacher, questions=1)
+        self.client.force_login(self.teacher)
+
+    @contextmanager
+    def capture_queries(self):
+        '''
+        Yields {alias: [sql, ...]} filled with the queries run on each
+        connection inside the block.
+        '''
+        queries = {}
+        with ExitStack() as stack:
+            contexts = {alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in self.databases}
+            yield queries
+        for alias, context in contexts.items():
+            queries[alias] = [query['sql'] for query in context.captured_queries]
+
+    def assertReadOn(self, queries, alias, table):
+        reads = {other: [sql for sql in queries[other] if sql.startswith('SELECT') and '"%s"' % table in sql]
+                 for other in self.databases}
+        self.assertTrue(reads.pop(alias), 'No read of %s on %s: %s' % (table, alias, queries))
+        self.assertFalse(any(reads.values()), 'Read of %s on another database: %s' % (table, queries))
+
+    def test_connections(self):
+        connections[DEFAULT_DB_ALIAS].ensure_connection()
+        connections[REPLICA_DATABASE].ensure_connection()
+        self.assertIsNot(connections[REPLICA_DATABASE].connection, connections[DEFAULT_DB_ALIAS].connection)
+
+    def test_reporting_reads(self):
+        with self.capture_queries() as queries:
+            list(Quiz.objects.all())
+        self.assertReadOn(queries, DEFAULT_DB_ALIAS, 'classroom_quiz')
+
+        with self.capture_queries() as queries, reading_from_replica():
+            self.assertEqual(Quiz.objects.get(pk=self.quiz.pk)._state.db, REPLICA_DATABASE)
+        self.assertReadOn(queries, REPLICA_DATABASE, 'classroom_quiz')
+
+    def test_writes(self):
+        with self.capture_queries() as queries, reading_from_replica():
+            quiz = Quiz.objects.get(pk=self.quiz.pk)
+            quiz.name = 'Renamed'
+            quiz.save()
+        self.assertReadOn(queries, REPLICA_DATABASE, 'classroom_quiz')
+        self.assertTrue([sql for sql in queries[DEFAULT_DB_ALIAS] if sql.startswith('UPDATE "classroom_quiz"')])
+        self.assertEqual(quiz._state.db, DEFAULT_DB_ALIAS)
+        self.assertEqual(Quiz.objects.get(pk=self.quiz.pk).name, 'Renamed')
+
+    def test_reads_after_write(self):
+        with tracking_writes(pinned=False) as state, reading_from_replica():
+            with self.capture_queries() as queries:
+                list(Quiz.objects.all())
+            self.assertReadOn(queries, REPLICA_DATABASE, 'classroom_quiz')
+
+            Quiz.objects.filter(pk=self.quiz.pk).update(name='Renamed')
+            self.assertTrue(state['written'])
+            with self.capture_queries() as queries:
+                self.assertEqual(Quiz.objects.get(pk=self.quiz.pk).name, 'Renamed')
+            self.assertReadOn(queries, DEFAULT_DB_ALIAS, 'classroom_quiz')
+
+    def test_pinned_reads(self):
+        with self.capture_queries() as queries, tracking_writes(pinned=True), reading_from_replica():
+            list(Quiz.objects.all())
+        self.assertReadOn(queries, DEFAULT_DB_ALIAS, 'classroom_quiz')
+
+    def test_other_databases(self):
+        router = ReplicaRouter()
+        self.quiz._state.db = 'scratch'
+        with reading_from_replica():
+            self.assertIsNone(router.db_for_read(Quiz, instance=self.quiz))
+        self.assertIsNone(router.db_for_write(Quiz, instance=self.quiz))
+        self.assertFalse(router.allow_migrate(REPLICA_DATABASE, 'classroom'))
+        self.assertIsNone(router.allow_migrate(DEFAULT_DB_ALIAS, 'classroom'))
+
+    def get_results(self):
+        with self.capture_queries() as queries:
+            response = self.client.get('/teachers/quiz/%s/results/more/' % self.quiz.pk)
+        self.assertEqual(response.status_code, 200)
+        return response, queries
+
+    def test_results_view(self):
+        response, queries = self.get_results()
+        self.assertReadOn(queries, REPLICA_DATABASE, 'classroom_quiz')
+        self.assertReadOn(queries, REPLICA_DATABASE, 'classroom_takenquiz')
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_results_view_after_write(self):
+        response = self.client.post('/teachers/quiz/%s/' % self.quiz.pk,
+                                    {'name': 'Renamed', 'subject': self.quiz.subject_id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+
+        response, queries = self.get_results()
+        self.assertReadOn(queries, DEFAULT_DB_ALIAS, 'classroom_quiz')
+        self.assertReadOn(queries, DEFAULT_DB_ALIAS, 'classroom_takenquiz')
+        self.assertFalse(queries[REPLICA_DATABASE])
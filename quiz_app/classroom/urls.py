@@ -4,14 +4,19 @@ from .views import classroom, students, teachers
 
 urlpatterns = [
     path('', classroom.home, name='home'),
+    path('exports/<int:job_id>/', classroom.export_status, name='export_status'),
+    path('exports/<int:job_id>/download/', classroom.export_download, name='export_download'),
+    path('chat/team/<int:team_id>/history/', classroom.team_chat_history, name='team_chat_history'),
+    path('metrics/admission/', classroom.admission_metrics, name='admission_metrics'),
+    path('metrics/quiz-index/', classroom.quiz_index_metrics, name='quiz_index_metrics'),
 
     path('students/', include(([
         path('', students.QuizListView.as_view(), name='quiz_list'),
         path('interests/', students.StudentInterestsView.as_view(), name='student_interests'),
         path('taken/', students.TakenQuizListView.as_view(), name='taken_quiz_list'),
+        path('taken/more/', students.taken_quiz_list_more, name='taken_quiz_list_more'),
         path('quiz/<int:pk>/', students.take_quiz, name='take_quiz'),
         path('exportStudent/<int:quiz_id>/<int:student_id>/', students.ExportToExcelStudentView.as_view(), name='exportStudent'),
-        path('add_message/', students.add_message, name='add_message'),
     ], 'classroom'), namespace='students')),
 
     path('teachers/', include(([
@@ -20,11 +25,17 @@ urlpatterns = [
         path('quiz/<int:pk>/', teachers.QuizUpdateView.as_view(), name='quiz_change'),
         path('quiz/<int:pk>/delete/', teachers.QuizDeleteView.as_view(), name='quiz_delete'),
         path('quiz/<int:pk>/results/', teachers.QuizResultsView.as_view(), name='quiz_results'),
+        path('quiz/<int:pk>/results/more/', teachers.quiz_results_more, name='quiz_results_more'),
+        path('quiz/<int:pk>/live/', teachers.QuizDashboardView.as_view(), name='quiz_dashboard'),
         path('quiz/<int:pk>/question/add/', teachers.question_add, name='question_add'),
+        path('quiz/<int:pk>/question/import/', teachers.quiz_import, name='quiz_import'),
+        path('quiz/<int:pk>/question/export/', teachers.quiz_questions_export, name='quiz_questions_export'),
         path('quiz/<int:quiz_pk>/question/<int:question_pk>/', teachers.question_change, name='question_change'),
         path('quiz/<int:quiz_pk>/question/<int:question_pk>/delete/', teachers.QuestionDeleteView.as_view(), name='question_delete'),
         path('create_team/', teachers.CreateTeamView.as_view(), name='create_team'),
         path('teams/', teachers.TeamListView.as_view(), name='team_list'),
+        path('teams/import/', teachers.RosterImportView.as_view(), name='roster_import'),
+        path('students/autocomplete/', teachers.student_autocomplete, name='student_autocomplete'),
         path('export/<int:quiz_id>/', teachers.ExportToExcelView.as_view(), name='export'),
         path('team/<int:team_id>/', teachers.team_view, name='team_view'),
     ], 'classroom'), namespace='teachers')),
@@ -1,6 +1,18 @@
-from django.shortcuts import redirect, render
+import os
+from datetime import datetime
+
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.views.generic import TemplateView
 
+from ..admission import answer_limiter
+from ..chat_history import HISTORY_PAGE_SIZE, get_chat_team, get_team_history
+from ..export_jobs import get_job_path
+from ..models import ExportJob
+from ..quiz_index import get_metrics as get_quiz_index_metrics
+
 
 class SignUpView(TemplateView):
     template_name = 'registration/signup.html'
@@ -13,3 +25,63 @@ def home(request):
         else:
             return redirect('students:quiz_list')
     return render(request, 'classroom/home.html')
+
+
+def export_job_response(job):
+    data = {
+        'job': job.pk,
+        'status': job.status,
+        'status_url': reverse('export_status', args=[job.pk]),
+    }
+    if job.status == ExportJob.DONE:
+        data['download_url'] = reverse('export_download', args=[job.pk])
+    return JsonResponse(data, status=200 if job.status in (ExportJob.DONE, ExportJob.FAILED) else 202)
+
+
+def get_available_job(request, job_id):
+    job = get_object_or_404(ExportJob.objects.select_related('quiz'), pk=job_id)
+    if not job.is_available_to(request.user):
+        raise Http404
+    return job
+
+
+@login_required
+def export_status(request, job_id):
+    return export_job_response(get_available_job(request, job_id))
+
+
+@login_required
+def export_download(request, job_id):
+    job = get_available_job(request, job_id)
+    path = get_job_path(job)
+    if job.status != ExportJob.DONE or not os.path.exists(path):
+        raise Http404
+    if job.kind == ExportJob.QUIZ_RESULTS:
+        filename = f'Quiz_Results_{datetime.now().strftime("%d_%m_%Y")}.xlsx'
+    else:
+        filename = f'Student_Result_{request.user.username}.xlsx'
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename,
+                        content_type='application/ms-excel')
+
+
+@login_required
+def team_chat_history(request, team_id):
+    if get_chat_team(request.user, team_id) is None:
+        raise Http404
+    try:
+        limit = int(request.GET.get('limit', HISTORY_PAGE_SIZE))
+    except ValueError:
+        limit = HISTORY_PAGE_SIZE
+    history = get_team_history(team_id, before=request.GET.get('before'), after=request.GET.get('after'),
+                               limit=limit)
+    return JsonResponse(history, json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+@user_passes_test(lambda u: u.is_staff)
+def admission_metrics(request):
+    return JsonResponse({'answers': answer_limiter.get_metrics()})
+
+
+@user_passes_test(lambda u: u.is_staff)
+def quiz_index_metrics(request):
+    return JsonResponse(get_quiz_index_metrics())
@@ -1,29 +1,35 @@
+import asyncio
 from datetime import timezone
+from functools import partial
 
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
-from django.db.models import Count
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_POST
-from django.views.generic import CreateView, ListView, UpdateView
-from openpyxl.styles import Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill
-from openpyxl.styles import Alignment
+from django.views.generic import CreateView, UpdateView
 
-from ..decorators import student_required
+from ..admission import AdmissionRejected, answer_limiter, get_rejected_response, take_token
+from ..decorators import async_student_required, pooled_sync_to_async, replica_reads, student_required
+from ..export_jobs import enqueue_export
 from ..forms import StudentInterestsForm, StudentSignUpForm, TakeQuizForm
-from ..models import Quiz, Student, TakenQuiz, User, Room, Message
-
-from django.http import HttpResponse, JsonResponse
+from ..live import progress_publisher
+from ..pagination import paginate_keyset
+from ..models import ExportJob, Quiz, Student, TakenQuiz, Team, User
+from ..quiz_index import get_available_quizzes
+from ..progress import (finish_attempt, get_attempt, get_current_question, get_team_attempt, record_answer,
+                        start_attempt, start_team_attempt)
+from ..routers import reading_from_replica
+from .classroom import export_job_response
+
+from django.http import Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
 from django.views.generic import View
-from openpyxl import Workbook
-from django.db import connection
-from openpyxl.styles import Font
+
+TAKEN_QUIZZES_PAGE_SIZE = 50
 
 
 class StudentSignUpView(CreateView):
@@ -56,70 +62,116 @@ class StudentInterestsView(UpdateView):
         return super().form_valid(form)
 
 
-@method_decorator([login_required, student_required], name='dispatch')
-class QuizListView(ListView):
-    model = Quiz
-    ordering = ('name',)
-    context_object_name = 'quizzes'
+# Представления прохождения викторины асинхронные: под ASGI запрос не занимает поток,
+# пока ждет очереди на запись, а работа с ORM собрана в один-два вызова в общем пуле потоков
+@method_decorator(async_student_required, name='dispatch')
+class QuizListView(View):
     template_name = 'classroom/students/quiz_list.html'
 
-    def get_queryset(self):
-        student = self.request.user.student
-        student_interests = student.interests.values_list('pk', flat=True)
-        taken_quizzes = student.quizzes.values_list('pk', flat=True)
-        queryset = Quiz.objects.filter(subject__in=student_interests) \
-            .exclude(pk__in=taken_quizzes) \
-            .annotate(questions_count=Count('questions')) \
-            .filter(questions_count__gt=0)
-        return queryset
+    async def get(self, request):
+        return await pooled_sync_to_async(self.render_quizzes)(request)
 
+    def render_quizzes(self, request):
+        available = get_available_quizzes(request.user.pk)
+        quizzes = list(Quiz.objects
+                       .filter(pk__in=available)
+                       .select_related('subject')
+                       .order_by('name', 'pk'))
+        for quiz in quizzes:
+            quiz.questions_count = available[quiz.pk]
+        return render(request, self.template_name, {'quizzes': quizzes})
 
-@method_decorator([login_required, student_required], name='dispatch')
-class TakenQuizListView(ListView):
-    model = TakenQuiz
-    context_object_name = 'taken_quizzes'
+
+@method_decorator(async_student_required, name='dispatch')
+class TakenQuizListView(View):
     template_name = 'classroom/students/taken_quiz_list.html'
 
-    def get_queryset(self):
-        queryset = self.request.user.student.taken_quizzes \
-            .select_related('quiz', 'quiz__subject') \
-            .order_by('quiz__name')
-        return queryset
+    async def get(self, request):
+        return await pooled_sync_to_async(self.render_taken_quizzes)(request)
 
+    def render_taken_quizzes(self, request):
+        with reading_from_replica():
+            taken_quizzes = get_taken_quizzes_page(request.user.pk, request.GET.get('cursor'))
+            return render(request, self.template_name, {'taken_quizzes': taken_quizzes})
 
-@login_required
-@student_required
-def take_quiz(request, pk):
-    quiz = get_object_or_404(Quiz, pk=pk)
-    student = request.user.student
-    team=3
 
-    if student.quizzes.filter(pk=pk).exists():
-        return render(request, 'students/taken_quiz.html')
+def get_taken_quizzes_page(student_id, cursor=None):
+    taken_quizzes = TakenQuiz.objects \
+        .filter(student_id=student_id) \
+        .select_related('quiz', 'quiz__subject', 'team')
+    return paginate_keyset(taken_quizzes, ('quiz__name', 'id'), cursor, page_size=TAKEN_QUIZZES_PAGE_SIZE)
 
-    total_questions = quiz.questions.count()
-    unanswered_questions = student.get_unanswered_questions(quiz)
-    total_unanswered_questions = unanswered_questions.count()
-    progress = 100 - round(((total_unanswered_questions - 1) / total_questions) * 100)
-    question = unanswered_questions.first()
+
+@login_required
+@student_required
+@replica_reads
+def taken_quiz_list_more(request):
+    taken_quizzes = get_taken_quizzes_page(request.user.pk, request.GET.get('cursor'))
+    html = render_to_string('classroom/students/_taken_quiz_rows.html', {'taken_quizzes': taken_quizzes})
+    return JsonResponse({'html': html, 'next_cursor': taken_quizzes.next_cursor})
+
+
+@async_student_required
+async def take_quiz(request, pk):
+    if isinstance(request, ASGIRequest):
+        # Прогресс викторины отправляется в слой каналов из цикла событий сервера
+        progress_publisher.bind(asyncio.get_running_loop())
+    step = await pooled_sync_to_async(get_take_quiz_step)(request, pk)
+    if isinstance(step, HttpResponse):
+        return step
+    # Все записи шага, от создания попытки до результата, проходят через ограничитель
+    try:
+        async with answer_limiter.aadmit():
+            return await pooled_sync_to_async(step)()
+    except AdmissionRejected as rejection:
+        return get_rejected_response(rejection)
+
+
+def get_take_quiz_step(request, pk):
+    '''
+    Loads the attempt and the current question of the student without
+    writing to the database. Returns the response to send, or a function
+    that makes the writes of the step and returns the response; the caller
+    runs it under answer_limiter.
+    '''
+    # Студент команды отвечает за всю команду в ее общей попытке
+    team = Team.objects.select_related('quiz').filter(quiz_id=pk, teammembership__student_id=request.user.pk).first()
+    attempt = get_team_attempt(team) if team is not None else get_attempt(request.user.pk, pk)
+    if attempt is None:
+        return partial(start_take_quiz, request, pk, team)
+    return get_attempt_step(request, attempt, team)
+
+
+def start_take_quiz(request, pk, team):
+    try:
+        attempt = start_team_attempt(team) if team is not None else start_attempt(request.user.pk, pk)
+    except Quiz.DoesNotExist:
+        raise Http404
+    step = get_attempt_step(request, attempt, team)
+    return step if isinstance(step, HttpResponse) else step()
+
+
+def get_attempt_step(request, attempt, team):
+    quiz = attempt.quiz
+
+    if not attempt.total_questions:
+        raise Http404
+
+    if attempt.is_finished:
+        if team is not None:
+            messages.info(request, 'Команда уже прошла викторину. Результат: %s.' % attempt.score)
+        else:
+            messages.info(request, 'Вы уже прошли эту викторину.')
+        return redirect('students:taken_quiz_list')
+
+    question = get_current_question(attempt)
+    if question is None:
+        return partial(finish_take_quiz, request, attempt)
 
     if request.method == 'POST':
         form = TakeQuizForm(question=question, data=request.POST)
         if form.is_valid():
-            with transaction.atomic():
-                student_answer = form.save(commit=False)
-                student_answer.student = student
-                student_answer.save()
-                if student.get_unanswered_questions(quiz).exists():
-                    return redirect('students:take_quiz', pk)
-                else:
-                    correct_answers = student.quiz_answers.filter(answer__question__quiz=quiz,
-                                                                  answer__is_correct=True).count()
-                    score = round((correct_answers / total_questions)*10, 2)
-                    TakenQuiz.objects.create(student=student, quiz=quiz, score=score)
-                    messages.warning(request, 'Прохождение викторины завершено. Ваш результат: %s.' % (
-                        score))
-                    return redirect('students:quiz_list')
+            return partial(save_answer, request, attempt, question, form.cleaned_data['answer'])
     else:
         form = TakeQuizForm(question=question)
 
@@ -127,83 +179,32 @@ def take_quiz(request, pk):
         'quiz': quiz,
         'question': question,
         'form': form,
-        'progress': progress
+        'progress': attempt.get_progress(),
+        'team': team
     })
 
 
+def save_answer(request, attempt, question, answer):
+    # Ответ сверх лимита студента поднимает AdmissionRejected, take_quiz отвечает 429
+    take_token(request.user.pk)
+    record_answer(attempt, question, answer, request.user.pk)
+    if attempt.next_question_id is not None:
+        return redirect('students:take_quiz', attempt.quiz_id)
+    return finish_take_quiz(request, attempt)
+
+
+def finish_take_quiz(request, attempt):
+    score = finish_attempt(attempt)
+    messages.warning(request, 'Прохождение викторины завершено. Ваш результат: %s.' % (
+        score))
+    return redirect('students:quiz_list')
+
+
 @method_decorator([login_required, student_required], name='dispatch')
 class ExportToExcelStudentView(View):
     def get(self, request, quiz_id, student_id, *args, **kwargs):
-        with connection.cursor() as cursor:
-            cursor.execute("select 'Команда: ' || t.name || ' (' ||\
-                                   (select group_concat(st.name, ', ')\
-                                    from classroom_takenquiz tq1\
-                                    inner join classroom_student st on tq1.student_id = st.user_id\
-                                    inner join classroom_team t1 on tq1.team_id = t1.id\
-                                    where tq1.quiz_id = tq.quiz_id\
-                                    and t1.id = tq.team_id\
-                                    group by tq1.team_id) || ')' as students,\
-                                   'Оценка: ' || tq.score as score\
-                            from classroom_takenquiz tq\
-                            inner join classroom_team t on tq.team_id = t.id\
-                            where tq.quiz_id = %s and tq.student_id = %s\
-                            group by tq.team_id", [quiz_id, student_id])
-            data = cursor.fetchall()
-
-        # Создаем Excel файл
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Результат викторины"
-        ws.column_dimensions[get_column_letter(1)].width = 70
-        ws.column_dimensions[get_column_letter(2)].width = 20
-        ws.column_dimensions[get_column_letter(3)].width = 18
-
-        for row in data:
-            ws.append(row)
-        ws.append([])
-        ws.append(["Вопрос", "Ответ команды", "Ответ правильный"])
-        for row in ws.iter_rows(min_row=1, max_row=3):
-            for cell in row:
-                cell.font = Font(bold=True)
-
-        border_style = Border(left=Side(style='thin'),
-                              right=Side(style='thin'),
-                              top=Side(style='thin'),
-                              bottom=Side(style='thin'))
-
-        with connection.cursor() as cursor:
-            cursor.execute("select cq.text,\
-                                   ca.text,\
-                                   case when ca.is_correct = 1 then 'Да' else 'Нет' end as is_correct\
-                            from classroom_studentanswer sa\
-                            inner join classroom_answer ca on sa.answer_id = ca.id\
-                            inner join classroom_question cq on ca.question_id = cq.id\
-                            where cq.quiz_id = %s and sa.student_id = %s", [quiz_id, student_id])
-            data = cursor.fetchall()
-        for row in data:
-            ws.append(row)
-
-        for row in ws:
-            for cell in row:
-                cell.border = border_style
-
-        # Создаем стиль для светло-красного цвета
-        fill = PatternFill(start_color="FFFFC0C0", end_color="FFFFC0C0", fill_type="solid")
-
-        # Перебираем ячейки в столбце "Ответ правильный" (колонка C)
-        for row in ws.iter_rows(min_row=4, max_row=ws.max_row, min_col=3, max_col=3):
-            for cell in row:
-                # Проверяем значение ячейки на "Нет" и применяем стиль, если условие выполняется
-                if cell.value == 'Нет':
-                    cell.fill = fill
-
-        # Перебираем ячейки и устанавливаем свойство wrap_text для переноса текста
-        for row in ws.iter_rows():
-            for cell in row:
-                cell.alignment = Alignment(wrap_text=True)
-
-        response = HttpResponse(content_type='application/ms-excel')
-        response['Content-Disposition'] = f'attachment; filename="Student_Result_{request.user.username}.xlsx"'
-        wb.save(response)
-        return response
-
+        if student_id != request.user.pk:
+            raise Http404
+        quiz = get_object_or_404(Quiz, pk=quiz_id)
+        job = enqueue_export(ExportJob.STUDENT_RESULT, quiz, student_id)
+        return export_job_response(job)
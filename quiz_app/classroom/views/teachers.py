@@ -1,30 +1,37 @@
-from datetime import datetime
+from io import TextIOWrapper
 
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
-from django.db.models import Avg, Count
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce
 from django.forms import inlineformset_factory
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
                                   UpdateView)
-from openpyxl.chart.label import DataLabelList
-from openpyxl.styles import Border, Side, Font
-from openpyxl.utils import get_column_letter
-from openpyxl.chart import BarChart, PieChart, Reference
-from openpyxl.styles import PatternFill
 
-from ..decorators import teacher_required
-from ..forms import BaseAnswerInlineFormSet, QuestionForm, TeacherSignUpForm, TeamForm
-from ..models import Answer, Question, Quiz, User, Team, TeamMembership, Message
-
-from django.http import HttpResponse
+from ..decorators import replica_reads, teacher_required
+from ..export_jobs import enqueue_export, invalidate_exports
+from ..forms import (BaseAnswerInlineFormSet, QuestionForm, QuizImportForm, RosterImportForm, TeacherSignUpForm,
+                     TeamForm)
+from ..pagination import paginate_keyset
+from ..models import Answer, ExportJob, Question, Quiz, User, Team, TeamMembership
+from ..progress import regrade_answers, resync_open_attempts
+from ..quiz_bank import FORMATS, QuizImportError, get_format, import_questions, iter_export_lines
+from ..quiz_index import invalidate_subject_index
+from ..rosters import RosterImportError, import_roster, search_students
+from ..snapshots import invalidate_snapshot
+from ..stats import get_stats
+from .classroom import export_job_response
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.views.generic import View
-from openpyxl import Workbook
-from django.db import connection
+
+RESULTS_PAGE_SIZE = 50
 
 
 class TeacherSignUpView(CreateView):
@@ -52,8 +59,8 @@ class QuizListView(ListView):
     def get_queryset(self):
         queryset = self.request.user.quizzes \
             .select_related('subject') \
-            .annotate(questions_count=Count('questions', distinct=True)) \
-            .annotate(taken_count=Count('taken_quizzes', distinct=True))
+            .annotate(questions_count=Count('questions')) \
+            .annotate(taken_count=Coalesce(F('stats__attempts'), 0))
         return queryset
 
 
@@ -78,12 +85,21 @@ class QuizUpdateView(UpdateView):
     template_name = 'classroom/teachers/quiz_change_form.html'
 
     def get_context_data(self, **kwargs):
-        kwargs['questions'] = self.get_object().questions.annotate(answers_count=Count('answers'))
+        kwargs['questions'] = self.object.questions.annotate(answers_count=Count('answers'))
         return super().get_context_data(**kwargs)
 
     def get_queryset(self):
         return self.request.user.quizzes.all()
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        invalidate_snapshot(self.object.pk)
+        if 'name' in form.changed_data:
+            invalidate_exports(self.object.pk)
+        if 'subject' in form.changed_data:
+            invalidate_subject_index(form.initial['subject'], self.object.subject_id)
+        return response
+
     def get_success_url(self):
         return reverse('teachers:quiz_change', kwargs={'pk': self.object.pk})
 
@@ -95,25 +111,27 @@ class QuizDeleteView(DeleteView):
     template_name = 'classroom/teachers/quiz_delete_confirm.html'
     success_url = reverse_lazy('teachers:quiz_change_list')
 
-    def delete(self, request, *args, **kwargs):
-        quiz = self.get_object()
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        invalidate_subject_index(self.object.subject_id)
+        return response
 
     def get_queryset(self):
         return self.request.user.quizzes.all()
 
 
-@method_decorator([login_required, teacher_required], name='dispatch')
+@method_decorator([login_required, teacher_required, replica_reads], name='dispatch')
 class QuizResultsView(DetailView):
     model = Quiz
     context_object_name = 'quiz'
     template_name = 'classroom/teachers/quiz_results.html'
 
     def get_context_data(self, **kwargs):
-        quiz = self.get_object()
-        taken_quizzes = quiz.taken_quizzes.select_related('student__user').order_by('-date')
-        total_taken_quizzes = taken_quizzes.count()
-        quiz_score = quiz.taken_quizzes.aggregate(average_score=Avg('score'))
+        quiz = self.object
+        taken_quizzes = get_results_page(quiz)
+        stats = get_stats(quiz)
+        total_taken_quizzes = stats.attempts
+        quiz_score = {'average_score': stats.get_mean()}
         extra_context = {
             'taken_quizzes': taken_quizzes,
             'total_taken_quizzes': total_taken_quizzes,
@@ -122,10 +140,42 @@ class QuizResultsView(DetailView):
         kwargs.update(extra_context)
         return super().get_context_data(**kwargs)
 
+    def get_queryset(self):
+        return self.request.user.quizzes.select_related('stats')
+
+
+@method_decorator([login_required, teacher_required], name='dispatch')
+class QuizDashboardView(DetailView):
+    model = Quiz
+    context_object_name = 'quiz'
+    template_name = 'classroom/teachers/quiz_dashboard.html'
+
+    def get_context_data(self, **kwargs):
+        kwargs.update({
+            'questions': self.object.questions.order_by('text', 'pk'),
+            'teams': Team.objects.filter(quiz=self.object).order_by('name', 'pk')
+        })
+        return super().get_context_data(**kwargs)
+
     def get_queryset(self):
         return self.request.user.quizzes.all()
 
 
+def get_results_page(quiz, cursor=None):
+    taken_quizzes = quiz.taken_quizzes.select_related('student', 'team')
+    return paginate_keyset(taken_quizzes, ('-date', '-id'), cursor, page_size=RESULTS_PAGE_SIZE)
+
+
+@login_required
+@teacher_required
+@replica_reads
+def quiz_results_more(request, pk):
+    quiz = get_object_or_404(Quiz, pk=pk, owner=request.user)
+    taken_quizzes = get_results_page(quiz, request.GET.get('cursor'))
+    html = render_to_string('classroom/teachers/_quiz_results_rows.html', {'taken_quizzes': taken_quizzes})
+    return JsonResponse({'html': html, 'next_cursor': taken_quizzes.next_cursor})
+
+
 @login_required
 @teacher_required
 def question_add(request, pk):
@@ -134,9 +184,13 @@ def question_add(request, pk):
     if request.method == 'POST':
         form = QuestionForm(request.POST)
         if form.is_valid():
-            question = form.save(commit=False)
-            question.quiz = quiz
-            question.save()
+            with transaction.atomic():
+                question = form.save(commit=False)
+                question.quiz = quiz
+                question.save()
+                invalidate_snapshot(quiz.pk)
+                resync_open_attempts(quiz.pk)
+            invalidate_subject_index(quiz.subject_id)
             return redirect('teachers:question_change', quiz.pk, question.pk)
     else:
         form = QuestionForm()
@@ -144,6 +198,43 @@ def question_add(request, pk):
     return render(request, 'classroom/teachers/question_add_form.html', {'quiz': quiz, 'form': form})
 
 
+@login_required
+@teacher_required
+def quiz_import(request, pk):
+    quiz = get_object_or_404(Quiz, pk=pk, owner=request.user)
+
+    if request.method == 'POST':
+        form = QuizImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            file = form.cleaned_data['file']
+            try:
+                imported = import_questions(quiz, TextIOWrapper(file.file, encoding='utf-8-sig', newline=''),
+                                            get_format(file.name))
+            except (QuizImportError, UnicodeDecodeError) as e:
+                form.add_error('file', str(e))
+            else:
+                messages.success(request, 'Импортировано вопросов: %s.' % imported)
+                return redirect('teachers:quiz_change', quiz.pk)
+    else:
+        form = QuizImportForm()
+
+    return render(request, 'classroom/teachers/quiz_import_form.html', {'quiz': quiz, 'form': form})
+
+
+@login_required
+@teacher_required
+def quiz_questions_export(request, pk):
+    quiz = get_object_or_404(Quiz, pk=pk, owner=request.user)
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        format = 'csv'
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(iter_export_lines(quiz.pk, format),
+                                     content_type='%s; charset=utf-8' % content_type)
+    response['Content-Disposition'] = 'attachment; filename="quiz_%s_questions.%s"' % (quiz.pk, format)
+    return response
+
+
 @login_required
 @teacher_required
 def question_change(request, quiz_pk, question_pk):
@@ -168,6 +259,17 @@ def question_change(request, quiz_pk, question_pk):
             with transaction.atomic():
                 form.save()
                 formset.save()
+                regraded = [answer for answer, changed_fields in formset.changed_objects
+                            if 'is_correct' in changed_fields]
+                if regraded:
+                    regrade_answers(quiz.pk, regraded)
+                invalidate_snapshot(quiz.pk)
+                if 'text' in form.changed_data:
+                    # Вопросы идут по тексту, так что у открытых попыток может смениться текущий
+                    resync_open_attempts(quiz.pk)
+                if form.has_changed() or formset.has_changed():
+                    # В выгрузках есть тексты вопросов и ответов
+                    invalidate_exports(quiz.pk)
             return redirect('teachers:quiz_change', quiz.pk)
     else:
         form = QuestionForm(instance=question)
@@ -189,166 +291,37 @@ class QuestionDeleteView(DeleteView):
     pk_url_kwarg = 'question_pk'
 
     def get_context_data(self, **kwargs):
-        question = self.get_object()
-        kwargs['quiz'] = question.quiz
+        kwargs['quiz'] = self.object.quiz
         return super().get_context_data(**kwargs)
 
-    def delete(self, request, *args, **kwargs):
-        question = self.get_object()
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        with transaction.atomic():
+            response = super().form_valid(form)
+            invalidate_snapshot(self.object.quiz_id)
+            resync_open_attempts(self.object.quiz_id)
+            invalidate_exports(self.object.quiz_id)
+        invalidate_subject_index(self.object.quiz.subject_id)
+        return response
 
     def get_queryset(self):
-        return Question.objects.filter(quiz__owner=self.request.user)
+        return Question.objects.filter(quiz__owner=self.request.user).select_related('quiz')
 
     def get_success_url(self):
-        question = self.get_object()
-        return reverse('teachers:quiz_change', kwargs={'pk': question.quiz_id})
+        return reverse('teachers:quiz_change', kwargs={'pk': self.object.quiz_id})
 
 
 @method_decorator([login_required, teacher_required], name='dispatch')
 class ExportToExcelView(View):
     def get(self, request, quiz_id, *args, **kwargs):
-        with connection.cursor() as cursor:
-            cursor.execute("select ct.name as team,\
-                                   cs.name as student,\
-                                   cq.name as quiz,\
-                                   strftime('%%H:%%M %%d.%%m.%%Y',classroom_takenquiz.date) as date,\
-                                   round(classroom_takenquiz.score, 2)\
-                            from classroom_takenquiz\
-                            inner join classroom_student cs on classroom_takenquiz.student_id = cs.user_id\
-                            inner join classroom_quiz cq on classroom_takenquiz.quiz_id = cq.id\
-                            inner join classroom_user us on cs.user_id = us.id\
-                            inner join classroom_team ct on classroom_takenquiz.team_id = ct.id\
-                            where cq.id = %s", [quiz_id])
-            data = cursor.fetchall()
-
-        # Создаем Excel файл
-        wb = Workbook()
-        ws1 = wb.active
-        ws1.title = "Результаты проведения викторины"
-        ws1.column_dimensions[get_column_letter(1)].width = 10
-        ws1.column_dimensions[get_column_letter(2)].width = 30
-        ws1.column_dimensions[get_column_letter(3)].width = 30
-        ws1.column_dimensions[get_column_letter(4)].width = 20
-        ws1.column_dimensions[get_column_letter(5)].width = 10
-        ws1.append(["Команда", "Учащиеся", "Викторина", "Дата прохождения", "Оценка"])
-        for row in ws1.iter_rows(min_row=1, max_row=1):
-            for cell in row:
-                cell.font = Font(bold=True)
-
-        border_style = Border(left=Side(style='thin'),
-                              right=Side(style='thin'),
-                              top=Side(style='thin'),
-                              bottom=Side(style='thin'))
-
-        for row in data:
-            ws1.append(row)
-
-        for row in ws1.iter_rows(min_row=2, min_col=5, max_col=5):
-            for cell in row:
-                score = cell.value
-                if score >= 8:
-                    fill = PatternFill(start_color="FFC0FFC0", end_color="FFC0FFC0", fill_type="solid")
-                elif score < 4:
-                    fill = PatternFill(start_color="FFFFC0C0", end_color="FFFFC0C0", fill_type="solid")
-                else:
-                    fill = None
-                if fill:
-                    cell.fill = fill
-                cell.border = border_style
-
-        for row in ws1:
-            for cell in row:
-                cell.border = border_style
-
-        ws2 = wb.create_sheet(title="Статистика по результатам")
-        ws2.column_dimensions[get_column_letter(2)].width = 40
-        ws2.column_dimensions[get_column_letter(5)].width = 20
-        with connection.cursor() as cursor:
-            cursor.execute("select t.name,\
-                                   (select GROUP_CONCAT(st.name, ', ')\
-                                    from classroom_takenquiz tq1\
-                                    inner join classroom_student st on tq1.student_id=st.user_id\
-                                    inner join classroom_team t1 on tq1.team_id = t1.id\
-                                    where tq1.quiz_id = tq.quiz_id\
-                                    and t1.id = tq.team_id\
-                                    group by tq1.team_id) as students,\
-                                   tq.score\
-                            from classroom_takenquiz tq\
-                            inner join classroom_team t on tq.team_id = t.id\
-                            where tq.quiz_id = %s\
-                            group by tq.team_id", [quiz_id])
-            data = cursor.fetchall()
-
-        team_scores = [(row[0], row[2]) for row in data]
-
-        ws2.append(["Команда", "Учащиеся", "Оценка"])
-        for row in data:
-            ws2.append(row)
-
-        for row in ws2.iter_rows(min_row=1, max_row=1, min_col=1, max_col=3):
-            for cell in row:
-                cell.font = Font(bold=True)
-
-        bar_chart = BarChart()
-        values = Reference(ws2, min_col=3, min_row=1, max_row=len(data) + 1)
-        categories = Reference(ws2, min_col=1, min_row=2, max_row=len(data) + 2)
-        bar_chart.add_data(values, titles_from_data=True)
-        bar_chart.set_categories(categories)
-        bar_chart.title = "Результаты прохождения"
-        bar_chart.x_axis.title = "Команда"
-        bar_chart.y_axis.title = "Оценка"
-        ws2.add_chart(bar_chart, "A10")
-
-        pie_chart = PieChart()
-        labels = ['Отлично', 'Хорошо', 'Удовлетворительно', 'Неудовлетворительно']
-        counts = [0, 0, 0, 0]
-
-        for score in team_scores:
-            if score[1] >= 8:
-                counts[0] += 1
-            elif score[1] >= 6:
-                counts[1] += 1
-            elif score[1] >= 4:
-                counts[2] += 1
-            else:
-                counts[3] += 1
-
-        data = counts
-        for i, label in enumerate(labels, start=1):
-            ws2[f'E{i}'] = label
-            ws2[f'F{i}'] = counts[i - 1]
-
-        for row in ws2:
-            for cell in row:
-                cell.border = border_style
-
-        total_count = sum(counts)
-        percentages = [count / total_count * 100 for count in counts]
-
-        data_labels = DataLabelList()
-        data_labels.showPercent = True
-        pie_chart.dataLabels = data_labels
-
-        values = Reference(ws2, min_col=6, min_row=1, max_row=4)
-        categories = Reference(ws2, min_col=5, min_row=1, max_row=4)
-        pie_chart.add_data(values, titles_from_data=False)
-        pie_chart.set_categories(categories)
-        pie_chart.title = "Распределение оценок студентов"
+        quiz = get_object_or_404(Quiz, pk=quiz_id, owner=request.user)
+        job = enqueue_export(ExportJob.QUIZ_RESULTS, quiz)
+        return export_job_response(job)
 
-        ws2.add_chart(pie_chart, "F10")
 
-        response = HttpResponse(content_type='application/ms-excel')
-        response[
-            'Content-Disposition'] = f'attachment; filename="Quiz_Results_{datetime.now().strftime("%d_%m_%Y")}.xlsx"'
-        wb.save(response)
-        return response
-
-
-@method_decorator([login_required, teacher_required], name='dispatch')
+@method_decorator([login_required, teacher_required, replica_reads], name='dispatch')
 class TeamListView(View):
     def get(self, request):
-        teams = Team.objects.annotate(students_count=Count('students'))
+        teams = Team.objects.select_related('quiz').annotate(students_count=Count('students'))
         return render(request, 'classroom/teachers/team_list.html', {'teams': teams})
 
 
@@ -368,11 +341,41 @@ class CreateTeamView(View):
         return render(request, 'classroom/teachers/team_add_form.html', {'form': form})
 
 
+@method_decorator([login_required, teacher_required], name='dispatch')
+class RosterImportView(View):
+    def get(self, request):
+        form = RosterImportForm(request.user)
+        return render(request, 'classroom/teachers/roster_import_form.html', {'form': form})
+
+    def post(self, request):
+        form = RosterImportForm(request.user, request.POST, request.FILES)
+        if form.is_valid():
+            file = form.cleaned_data['file']
+            try:
+                created = import_roster(form.cleaned_data['quiz'],
+                                        TextIOWrapper(file.file, encoding='utf-8-sig', newline=''))
+            except RosterImportError as e:
+                for error in e.errors:
+                    form.add_error('file', error)
+            except UnicodeDecodeError:
+                form.add_error('file', 'Файл должен быть в кодировке UTF-8.')
+            else:
+                messages.success(request, 'Создано команд: %s.' % created)
+                return redirect('teachers:team_list')
+        return render(request, 'classroom/teachers/roster_import_form.html', {'form': form})
+
+
+@login_required
+@teacher_required
+def student_autocomplete(request):
+    term = request.GET.get('q', '').strip()
+    results = search_students(term) if term else []
+    return JsonResponse({'results': results}, json_dumps_params={'ensure_ascii': False})
+
+
 def team_view(request, team_id):
-    user_messages = Message.objects.filter(room_id=1)
-    team = Team.objects.get(id=team_id)
+    team = get_object_or_404(Team.objects.select_related('quiz'), id=team_id)
     context = {
-        'team': team,
-        'user_messages': user_messages
+        'team': team
     }
     return render(request, 'classroom/teachers/team_detail.html', context)
@@ -31,6 +31,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'classroom.middleware.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'django_school.urls'
@@ -60,6 +61,58 @@ X_FRAME_OPTIONS = 'DENY'
 
 WSGI_APPLICATION = 'django_school.wsgi.application'
 
+ASGI_APPLICATION = 'django_school.asgi.application'
+
+
+# По умолчанию SQLite для разработки. DATABASE_ENGINE=postgres включает рабочий
+# профиль: соединения живут CONN_MAX_AGE секунд и переиспользуются между запросами
+if os.environ.get('DATABASE_ENGINE') == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'quiz_app'),
+            'USER': os.environ.get('POSTGRES_USER', 'quiz_app'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+            # pgbouncer в режиме transaction не сохраняет серверные курсоры между транзакциями
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('PGBOUNCER') == '1',
+        },
+    }
+    # Отчеты и экспорт читают с реплики, если она задана (см. classroom.routers)
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = dict(
+            DATABASES['default'],
+            HOST=os.environ['POSTGRES_REPLICA_HOST'],
+            PORT=os.environ.get('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+            TEST={'MIRROR': 'default'},
+        )
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        },
+    }
+    # Реплика SQLite - второе соединение с тем же файлом, так что маршрутизация
+    # отчетов работает и проверяется тестами и без Postgres
+    DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['classroom.routers.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = 10
+
+# Группы чата рассылаются между процессами через Unix-сокеты, без внешнего брокера
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'chat.layers.UnixSocketChannelLayer',
+        'CONFIG': {
+            'socket_dir': os.path.join(BASE_DIR, 'sockets'),
+        },
+    },
+}
+
 
 LANGUAGE_CODE = 'en-us'
 
@@ -100,3 +153,6 @@ MESSAGE_TAGS = {
 
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
+
+
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')